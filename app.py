@@ -1,17 +1,56 @@
-import requests
+import time
+
+# Start of module import, reported as boot time on /health
+IMPORT_STARTED = time.perf_counter()
+
 import os
 import uuid
+import asyncio
+import base64
+import contextvars
+import json
+import math
+import queue
+import threading
+from collections import OrderedDict
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, session
-from groq import Groq
+import httpx
+from flask import (
+    Flask, request, jsonify, session, Response, stream_with_context, g, copy_current_request_context,
+    has_request_context
+)
+from flask.json.provider import DefaultJSONProvider
 from dotenv import load_dotenv
 import logging
 
-# LangChain imports
-from langchain_groq import ChatGroq
-from langchain_core.tools import tool
-from langchain.agents import create_tool_calling_agent, AgentExecutor
-from langchain_core.prompts import ChatPromptTemplate
+from chat_store import create_chat_store
+from chat_locks import ChatBusy, create_chat_locks
+from write_behind import ChatStoreBusy
+from search_index import SearchIndex, make_snippet, tokenize
+from context_builder import ContextBuilder, MESSAGE_OVERHEAD_TOKENS, PROMPT_RESERVE_TOKENS, SUMMARY_MAX_TOKENS
+from weather import WeatherClient
+from session_store import ServerSideSessionInterface, create_session_store
+from metrics import MetricsCallbackHandler, create_metrics_registry
+from router import AGENT, DIRECT, create_model_router
+from response_cache import cache_key, create_response_cache
+from bulk import create_bulk_runner, parse_jobs
+from chat_export import ImportFormatError, export_chats, import_chats
+from static_assets import create_static_assets
+from task_queue import create_task_queue
+from rate_limit import create_admission_controller
+from resilience import (
+    CIRCUIT_OPEN, OVERLOADED, RATE_LIMITED, ToolResultRecorder, acall_with_retry, call_with_retry,
+    classify_error, create_circuit_breakers, create_retry_policy
+)
+
+# LangChain imports (langchain_groq, langchain.agents, langchain_core.tools and groq are
+# imported on first use; see get_groq_client())
+from langchain_core.callbacks import BaseCallbackHandler
+
+try:
+    import orjson
+except ImportError:  # Optional: falls back to the standard library encoder
+    orjson = None
 
 # Load environment variables
 load_dotenv()
@@ -20,28 +59,140 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider that serializes responses with orjson when it is installed"""
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS),
+            mimetype=self.mimetype
+        )
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'your-secret-key-change-this')
 
-# Initialize Groq client
-try:
-    groq_client = Groq(api_key=os.getenv('GROQ_API_KEY'))
-    logger.info("Groq client initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize Groq client: {e}")
-    groq_client = None
-
-# Initialize LangChain Groq client
-try:
-    langchain_llm = ChatGroq(
+# Session data lives server-side; the cookie only carries an opaque session id
+app.session_interface = ServerSideSessionInterface(create_session_store())
+
+# Fingerprinted, precompressed static files and the cached index page (STATIC_ASSETS=fingerprint|plain)
+static_assets = create_static_assets(app)
+
+# Latency spans and counters exported on /metrics (METRICS_ENABLED=false turns them off)
+metrics = create_metrics_registry()
+
+# Post-response work (titles, search indexing, summary folds, cache writes, timing logs)
+# runs on BACKGROUND_WORKERS threads behind a bounded queue
+background_tasks = create_task_queue(metrics)
+metrics.defer = lambda fn, *args: background_tasks.submit('timing_log', fn, *args)
+
+@app.before_request
+def start_request_timer():
+    if not metrics.enabled:
+        return
+    g.request_start = time.perf_counter()
+    g.trace_token = metrics.start_trace(method=request.method, path=request.path)
+
+@app.after_request
+def record_request_metrics(response):
+    if not metrics.enabled or 'request_start' not in g:
+        return response
+    seconds = time.perf_counter() - g.request_start
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.observe('http_request_duration_seconds', seconds, endpoint=endpoint, method=request.method)
+    metrics.inc('http_requests_total', endpoint=endpoint, method=request.method, status=response.status_code)
+    metrics.finish_trace(g.trace_token, status=response.status_code, ms=round(seconds * 1000, 2))
+    return response
+
+def metrics_callbacks(model_name: str, path: str) -> list:
+    """LangChain callbacks that time LLM round trips and tool calls, if metrics are enabled"""
+    return [MetricsCallbackHandler(metrics, model_name, path)] if metrics.enabled else []
+
+# Groq calls are retried by resilience.py, with backoff and per-model circuit
+# breakers, so the SDK clients below are created with max_retries=0
+retry_policy = create_retry_policy()
+circuit_breakers = create_circuit_breakers()
+
+# Per-model RPM/TPM admission with a fair, bounded wait queue in front of every Groq call
+admission = create_admission_controller()
+
+# The agent's planning call and its answer after a tool call are both charged up front
+AGENT_ROUND_TRIPS = 2
+
+# Groq and LangChain clients are built on first use, or by the background
+# warm-up started in create_app(). Importing groq, langchain_groq and
+# langchain.agents takes about a second, which would otherwise be paid by
+# every worker before it can serve its first request.
+clients = {}
+clients_lock = threading.RLock()  # Builders may fetch other lazy clients
+
+def lazy_client(name: str, build):
+    """Return the client cached under name, building it once; None if construction failed"""
+    if name in clients:
+        return clients[name]
+    with clients_lock:
+        if name not in clients:
+            try:
+                clients[name] = build()
+                logger.info(f"{name} initialized successfully")
+            except Exception as e:
+                logger.error(f"Failed to initialize {name}: {e}")
+                clients[name] = None
+        return clients[name]
+
+# Shared HTTP connection pools reused by every Groq / LangChain client
+def get_http_client():
+    return lazy_client('HTTP connection pool', lambda: httpx.Client(
+        timeout=60.0, limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+    ))
+
+def get_http_async_client():
+    return lazy_client('Async HTTP connection pool', lambda: httpx.AsyncClient(
+        timeout=60.0, limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+    ))
+
+def get_groq_client():
+    """Groq client"""
+    def build():
+        from groq import Groq
+        return Groq(api_key=os.getenv('GROQ_API_KEY'), http_client=get_http_client(), max_retries=0)
+    return lazy_client('Groq client', build)
+
+def get_async_groq_client():
+    """Async Groq client used by the ASGI chat path (see asgi.py)"""
+    def build():
+        from groq import AsyncGroq
+        return AsyncGroq(api_key=os.getenv('GROQ_API_KEY'), http_client=get_http_async_client(), max_retries=0)
+    return lazy_client('Async Groq client', build)
+
+def build_chat_groq(model_name: str = "llama3-8b-8192", temperature: float = 0.7):
+    """LangChain chat model on the shared HTTP connection pools"""
+    from langchain_groq import ChatGroq
+    return ChatGroq(
         api_key=os.getenv('GROQ_API_KEY'),
-        model_name="llama3-8b-8192",
-        temperature=0.7
+        model_name=model_name,
+        temperature=temperature,
+        http_client=get_http_client(),
+        http_async_client=get_http_async_client(),
+        max_retries=0
     )
-    logger.info("LangChain Groq client initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize LangChain Groq client: {e}")
-    langchain_llm = None
+
+def get_langchain_llm():
+    """Default LangChain Groq client"""
+    return lazy_client('LangChain Groq client', build_chat_groq)
 
 # Available models (you can expand this list)
 AVAILABLE_MODELS = [
@@ -51,24 +202,76 @@ AVAILABLE_MODELS = [
     "gemma-7b-it"
 ]
 
-# Simple in-memory storage (in production, use a proper database)
-chat_sessions = {}
-user_profiles = {}
+# Chat storage backend (in-memory by default, SQLite with CHAT_STORE=sqlite, or
+# in-memory with write-behind to SQLite with CHAT_STORE=journal)
+chat_store = create_chat_store()
+
+# WORKER_MODE=multi runs several worker processes (e.g. gunicorn -w 4) on one
+# SQLite database. Chats, sessions, rolling summaries and chat locks are then
+# shared, and every worker's search index picks up the other workers' writes.
+WORKER_MODE = os.getenv('WORKER_MODE', 'single').lower()
+if WORKER_MODE not in ('single', 'multi'):
+    raise ValueError(f"Unknown WORKER_MODE: {WORKER_MODE}")
+MULTI_WORKER = WORKER_MODE == 'multi'
+if MULTI_WORKER and not (chat_store.shared and app.session_interface.store.shared):
+    raise ValueError("WORKER_MODE=multi requires CHAT_STORE=sqlite and SESSION_STORE=sqlite")
+
+search_index = SearchIndex(chat_store, shared=MULTI_WORKER)
+
+# Turns of one chat run one at a time, across every worker in multi mode
+chat_locks = create_chat_locks(shared=MULTI_WORKER)
+
+# Short-lived cache of user profiles read from the chat store; off with several
+# workers, since a profile saved on one worker would stay stale on the others
+PROFILE_CACHE_TTL_SECONDS = 0 if MULTI_WORKER else 30
+PROFILE_CACHE_SIZE = 10000
+profile_cache = OrderedDict()
+profile_cache_lock = threading.Lock()
+
+# Number of most recent messages loaded for building model context
+CONTEXT_MESSAGE_LIMIT = 20
+
+# Messages returned per page by /chats/<id>, /switch and /messages
+MESSAGE_PAGE_SIZE = 50
+MAX_MESSAGE_PAGE_SIZE = 200
+
+# Sidebar pagination for GET /chats
+CHAT_PAGE_SIZE = 50
+MAX_CHAT_PAGE_SIZE = 200
 
 def initialize_session():
     """Initialize session with default values"""
     if 'user_id' not in session:
         session['user_id'] = str(uuid.uuid4())
 
-    if 'current_chat_id' not in session:
-        session['current_chat_id'] = None
+def get_user_profile(user_id: str) -> dict:
+    """Get the user's profile, served from a short-lived cache"""
+    now = time.monotonic()
+    with profile_cache_lock:
+        entry = profile_cache.get(user_id)
+        if entry and entry[0] > now:
+            profile_cache.move_to_end(user_id)
+            return entry[1]
+
+    profile = chat_store.get_profile(user_id) or {
+        'name': None,
+        'preferences': {},
+        'created_at': datetime.now().isoformat()
+    }
 
-    if 'user_profile' not in session:
-        session['user_profile'] = {
-            'name': None,
-            'preferences': {},
-            'created_at': datetime.now().isoformat()
-        }
+    with profile_cache_lock:
+        profile_cache[user_id] = (now + PROFILE_CACHE_TTL_SECONDS, profile)
+        profile_cache.move_to_end(user_id)
+        while len(profile_cache) > PROFILE_CACHE_SIZE:
+            profile_cache.popitem(last=False)
+    return profile
+
+def save_user_profile(user_id: str, profile: dict):
+    """Persist the user's profile and refresh the cache"""
+    chat_store.save_profile(user_id, profile)
+    with profile_cache_lock:
+        profile_cache[user_id] = (time.monotonic() + PROFILE_CACHE_TTL_SECONDS, profile)
+        profile_cache.move_to_end(user_id)
 
 def create_new_chat(title=None):
     """Create a new chat session"""
@@ -76,31 +279,24 @@ def create_new_chat(title=None):
     if 'user_id' not in session:
         initialize_session()
 
-    chat_id = str(uuid.uuid4())
     user_id = session.get('user_id')
 
     if not user_id:
         raise ValueError("User ID not found in session")
 
-    if title is None:
-        title = f"Chat {datetime.now().strftime('%m/%d %H:%M')}"
+    chat_data = create_chat_for_user(user_id, title)
+    session['current_chat_id'] = chat_data['id']
 
-    chat_data = {
-        'id': chat_id,
-        'title': title,
-        'messages': [],
-        'created_at': datetime.now().isoformat(),
-        'updated_at': datetime.now().isoformat(),
-        'user_id': user_id
-    }
-
-    if user_id not in chat_sessions:
-        chat_sessions[user_id] = {}
+    return chat_data
 
-    chat_sessions[user_id][chat_id] = chat_data
-    session['current_chat_id'] = chat_id
-    session.modified = True
+def create_chat_for_user(user_id: str, title=None):
+    """Create and index a chat without making it the session's current chat"""
+    chat_id = str(uuid.uuid4())
+    if title is None:
+        title = f"Chat {datetime.now().strftime('%m/%d %H:%M')}"
 
+    chat_data = chat_store.create_chat(user_id, chat_id, title, datetime.now().isoformat())
+    search_index.add_chat(user_id, chat_id, title)
     return chat_data
 
 def get_current_chat():
@@ -111,19 +307,91 @@ def get_current_chat():
     if not user_id or not chat_id:
         return None
 
-    return chat_sessions.get(user_id, {}).get(chat_id)
+    return chat_store.get_chat(user_id, chat_id, message_limit=CONTEXT_MESSAGE_LIMIT)
+
+def lock_current_chat():
+    """Take the turn lock of the session's current chat, creating the chat if needed; return (chat, lease).
+
+    The chat is read once the lock is held, so it includes the reply of any turn that held it before.
+    """
+    chat_id = session.get('current_chat_id')
+    if chat_id:
+        lease = chat_locks.acquire(chat_id)
+        current_chat = get_current_chat()
+        if current_chat:
+            return current_chat, lease
+        lease.release()
+    current_chat = create_new_chat()
+    return current_chat, chat_locks.acquire(current_chat['id'])
+
+async def alock_current_chat():
+    """Async variant of lock_current_chat(); the chat is read or created on a worker thread"""
+    chat_id = session.get('current_chat_id')
+    if chat_id:
+        lease = await chat_locks.aacquire(chat_id)
+        try:
+            current_chat = await asyncio.to_thread(get_current_chat)
+        except Exception:
+            await asyncio.to_thread(lease.release)
+            raise
+        if current_chat:
+            return current_chat, lease
+        await asyncio.to_thread(lease.release)
+    current_chat = await asyncio.to_thread(create_new_chat)
+    return current_chat, await chat_locks.aacquire(current_chat['id'])
+
+def append_chat_message(current_chat: dict, message: dict):
+    """Persist a message and mirror it on the in-hand chat dict; indexing and titling run in the background"""
+    user_id = current_chat['user_id']
+    chat_id = current_chat['id']
+    message['id'] = chat_store.append_message(user_id, chat_id, message)
+    current_chat['messages'].append(message)
+    current_chat['message_count'] = current_chat.get('message_count', 0) + 1
+    current_chat['updated_at'] = message['timestamp']
+
+    background_tasks.submit('search_index', search_index.add_message, user_id, chat_id, message['content'],
+                            current_chat['message_count'] - 1, key=chat_id)
+    # Title a new chat from its first message while the model is still working on the reply
+    if current_chat['message_count'] == 1 and message['role'] == 'user' and current_chat['title'].startswith('New Chat'):
+        background_tasks.submit('title', title_new_chat, user_id, chat_id, message['content'], key=chat_id)
+
+def derive_chat_title(first_message: str) -> str:
+    """Chat title made from its first message"""
+    return first_message[:30] + "..." if len(first_message) > 30 else first_message
+
+def title_new_chat(user_id: str, chat_id: str, first_message: str):
+    """Background task: title a chat that still has its default name"""
+    current_chat = chat_store.get_chat(user_id, chat_id, message_limit=1)
+    if not current_chat or not current_chat['title'].startswith('New Chat'):
+        return  # Deleted or renamed meanwhile
+    title = derive_chat_title(first_message)
+    if chat_store.update_chat(user_id, chat_id, title=title):
+        search_index.rename_chat(user_id, chat_id, title)
 
 def update_chat_title(chat_id, title):
     """Update chat title"""
     user_id = session.get('user_id')
-    if user_id and chat_id in chat_sessions.get(user_id, {}):
-        chat_sessions[user_id][chat_id]['title'] = title
-        chat_sessions[user_id][chat_id]['updated_at'] = datetime.now().isoformat()
+    if user_id and chat_store.update_chat(user_id, chat_id, title=title, updated_at=datetime.now().isoformat()):
+        search_index.rename_chat(user_id, chat_id, title)
         return True
     return False
 
 # LangChain Weather Tool
-@tool
+weather_client = WeatherClient(async_client_factory=get_http_async_client)
+
+def format_weather_response(city_name: str, status_code: int, data: dict) -> str:
+    """Turn an OpenWeatherMap response into a human-readable sentence"""
+    if status_code == 200:
+        temp = data["main"]["temp"]
+        desc = data["weather"][0]["description"]
+        humidity = data["main"]["humidity"]
+        feels_like = data["main"]["feels_like"]
+        return f"The current weather in {city_name} is {temp}°C with {desc}. It feels like {feels_like}°C and humidity is {humidity}%."
+    elif status_code == 404:
+        return f"Could not find weather data for '{city_name}'. Please check the city name."
+    else:
+        return f"Error fetching weather data: HTTP {status_code}"
+
 def get_weather_for_city(city_name: str) -> str:
     """Get current weather information for a specific city.
 
@@ -133,45 +401,55 @@ def get_weather_for_city(city_name: str) -> str:
     Returns:
         A string containing the current weather information
     """
-    api_key = os.getenv("OPENWEATHER_API_KEY")
-    if not api_key:
+    if not os.getenv("OPENWEATHER_API_KEY"):
         return "Weather API key is missing. Please set OPENWEATHER_API_KEY."
 
-    url = f"http://api.openweathermap.org/data/2.5/weather?q={city_name}&appid={api_key}&units=metric"
+    import requests
 
     try:
-        response = requests.get(url, timeout=10)
-
-        if response.status_code == 200:
-            data = response.json()
-            temp = data["main"]["temp"]
-            desc = data["weather"][0]["description"]
-            humidity = data["main"]["humidity"]
-            feels_like = data["main"]["feels_like"]
-            return f"The current weather in {city_name} is {temp}°C with {desc}. It feels like {feels_like}°C and humidity is {humidity}%."
-        elif response.status_code == 404:
-            return f"Could not find weather data for '{city_name}'. Please check the city name."
-        else:
-            return f"Error fetching weather data: HTTP {response.status_code}"
+        status_code, data = weather_client.get(city_name)
+        return format_weather_response(city_name, status_code, data)
     except requests.exceptions.RequestException as e:
         return f"Error connecting to weather service: {str(e)}"
 
+async def aget_weather_for_city(city_name: str) -> str:
+    """Async variant of get_weather_for_city used by agent_executor.ainvoke"""
+    if not os.getenv("OPENWEATHER_API_KEY"):
+        return "Weather API key is missing. Please set OPENWEATHER_API_KEY."
+
+    try:
+        status_code, data = await weather_client.aget(city_name)
+        return format_weather_response(city_name, status_code, data)
+    except httpx.HTTPError as e:
+        return f"Error connecting to weather service: {str(e)}"
+
+def weather_tool():
+    """get_weather_for_city as a LangChain tool, built on first use (langchain_core.tools is slow to import)"""
+    def build():
+        from langchain_core.tools import StructuredTool
+        return StructuredTool.from_function(get_weather_for_city, coroutine=aget_weather_for_city)
+    return lazy_client('Weather tool', build)
+
 # Initialize LangChain tools and agent
-def initialize_langchain_agent(model_name: str = "llama3-8b-8192"):
+def initialize_langchain_agent(model_name: str = "llama3-8b-8192", temperature: float = 0.7, tools=None):
     """Initialize LangChain agent with weather tool"""
     try:
+        from langchain.agents import create_tool_calling_agent, AgentExecutor
+        from langchain_core.prompts import ChatPromptTemplate
+
+        langchain_llm = get_langchain_llm()
+        if langchain_llm is None:
+            return None
+
         # Update the LLM model if different from default
-        if langchain_llm.model_name != model_name:
-            updated_llm = ChatGroq(
-                api_key=os.getenv('GROQ_API_KEY'),
-                model_name=model_name,
-                temperature=0.7
-            )
+        if langchain_llm.model_name != model_name or langchain_llm.temperature != temperature:
+            updated_llm = build_chat_groq(model_name, temperature)
         else:
             updated_llm = langchain_llm
 
         # Define the tools available to the agent
-        tools = [get_weather_for_city]
+        if tools is None:
+            tools = [weather_tool()]
 
         # Create the prompt template
         prompt = ChatPromptTemplate.from_messages([
@@ -182,6 +460,7 @@ def initialize_langchain_agent(model_name: str = "llama3-8b-8192"):
             For general conversations, respond normally without using tools.
 
             Be conversational and helpful. If a user's name is provided, remember it throughout the conversation."""),
+            ("placeholder", "{chat_history}"),
             ("human", "{input}"),
             ("placeholder", "{agent_scratchpad}"),
         ])
@@ -195,6 +474,116 @@ def initialize_langchain_agent(model_name: str = "llama3-8b-8192"):
         logger.error(f"Failed to initialize LangChain agent: {e}")
         return None
 
+class AgentRegistry:
+    """Bounded, thread-safe cache of compiled agents keyed on (model, temperature, tool set)"""
+
+    def __init__(self, max_size: int = 16):
+        self.max_size = max_size
+        self._agents = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model_name: str, temperature: float = 0.7, tools=None):
+        """Return a cached agent executor, building it on first use"""
+        if tools is None:
+            tools = [weather_tool()]
+        key = (model_name, temperature, tuple(sorted(t.name for t in tools)))
+
+        with self._lock:
+            agent_executor = self._agents.get(key)
+            if agent_executor is not None:
+                self._agents.move_to_end(key)
+                self.hits += 1
+                return agent_executor
+            self.misses += 1
+
+        # Build outside the lock so a slow construction doesn't block other models
+        with metrics.span('agent_build', model=model_name):
+            agent_executor = initialize_langchain_agent(model_name, temperature, tools)
+        if agent_executor is None:
+            return None
+
+        with self._lock:
+            # Another thread may have built the same agent meanwhile; keep the first one
+            agent_executor = self._agents.setdefault(key, agent_executor)
+            self._agents.move_to_end(key)
+            while len(self._agents) > self.max_size:
+                self._agents.popitem(last=False)
+        return agent_executor
+
+    def warm_up(self, models):
+        """Pre-build agents for the given models"""
+        for model_name in models:
+            self.get(model_name)
+        logger.info(f"Warmed up {len(self._agents)} LangChain agents")
+
+    def stats(self):
+        """Return cache counters"""
+        with self._lock:
+            return {
+                'size': len(self._agents),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+# Sends tool-free messages straight to one Groq completion (see router.py)
+model_router = create_model_router()
+
+# Opt-in cache of replies to repeated prompts (RESPONSE_CACHE=memory|sqlite)
+response_cache = create_response_cache()
+
+# Concurrency and per-model rate limits of POST /chats/bulk
+bulk_runner = create_bulk_runner()
+BULK_MAX_JOBS = int(os.getenv('BULK_MAX_JOBS', '1000'))
+
+agent_registry = AgentRegistry(max_size=int(os.getenv('AGENT_CACHE_SIZE', '16')))
+
+class WarmUp:
+    """Builds the static assets, the Groq clients, the weather session and the agents once, off the request path"""
+
+    def __init__(self):
+        self.state = 'pending'  # pending -> running -> done | failed
+        self.seconds = None
+        self._lock = threading.Lock()
+
+    def run(self):
+        with self._lock:
+            if self.state != 'pending':
+                return
+            self.state = 'running'
+        start = time.perf_counter()
+        try:
+            static_assets.build()
+            with app.test_request_context('/'):
+                static_assets.page('index.html', models=AVAILABLE_MODELS)
+            get_groq_client()
+            get_async_groq_client()
+            weather_client.session
+            if get_langchain_llm() is not None:
+                agent_registry.warm_up(AVAILABLE_MODELS)
+            self.state = 'done'
+        except Exception as e:
+            logger.error(f"Warm-up failed: {e}")
+            self.state = 'failed'
+        self.seconds = round(time.perf_counter() - start, 3)
+        logger.info(f"Warm-up {self.state} in {self.seconds}s")
+
+    def start(self):
+        """Run the warm-up on a daemon thread"""
+        if self.state == 'pending':
+            threading.Thread(target=self.run, name='warm-up', daemon=True).start()
+
+    @property
+    def warm(self) -> bool:
+        return self.state == 'done'
+
+    def stats(self) -> dict:
+        return {'state': self.state, 'seconds': self.seconds}
+
+warm_up = WarmUp()
+
 @app.route('/')
 def index():
     """Render the main chat interface"""
@@ -204,7 +593,13 @@ def index():
     if not session.get('current_chat_id'):
         create_new_chat("New Chat")
 
-    return render_template('index.html', models=AVAILABLE_MODELS)
+    return static_assets.page('index.html', models=AVAILABLE_MODELS)
+
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    """Fingerprinted static file, precompressed and cached by browsers for a year"""
+    return static_assets.serve(filename)
+
 @app.route('/chat', methods=['POST'])
 def chat():
     """Handle chat messages and get AI responses using LangChain"""
@@ -212,168 +607,837 @@ def chat():
         data = request.get_json()
         user_message = data.get('message', '').strip()
         selected_model = data.get('model', 'llama3-8b-8192')
+        stream = bool(data.get('stream', False))
 
         if not user_message:
             return jsonify({'error': 'Message cannot be empty'}), 400
 
+        # Agents, breakers, admission queues and metric labels are kept per model
+        if selected_model not in AVAILABLE_MODELS:
+            return jsonify({'error': f'Unknown model: {selected_model}'}), 400
+
         initialize_session()
 
-        # Get or create current chat
-        current_chat = get_current_chat()
-        if not current_chat:
-            current_chat = create_new_chat()
+        # Fail fast, before storing the message, while the model's breaker is open or it is overloaded
+        circuit_breakers.get(selected_model).reject_if_open()
+        admission.reject_if_overloaded(selected_model, session['user_id'])
 
-        # Add user message to chat history
-        user_msg = {
-            'role': 'user',
-            'content': user_message,
-            'timestamp': datetime.now().isoformat()
-        }
-        current_chat['messages'].append(user_msg)
+        # Get or create current chat, waiting for any turn already running in it
+        current_chat, lease = lock_current_chat()
+        try:
+            # Add user message to chat history
+            user_msg = {
+                'role': 'user',
+                'content': user_message,
+                'timestamp': datetime.now().isoformat()
+            }
+            append_chat_message(current_chat, user_msg)
+
+            response = app.make_response(run_chat_turn(current_chat, user_message, selected_model, stream, lease))
+        except Exception:
+            lease.release()
+            raise
+        if not response.is_streamed:
+            # A streamed turn releases the lock itself once its reply is stored
+            lease.release()
+        return response
+
+    except Exception as e:
+        logger.error(f"Error in chat endpoint: {e}")
+        logger.error(f"Error type: {type(e).__name__}")
+        import traceback
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        return chat_error_response(e)
 
-        # Initialize LangChain agent with selected model
-        agent_executor = initialize_langchain_agent(selected_model)
+def prepare_chat_turn(current_chat: dict, user_message: str, selected_model: str) -> tuple:
+    """Route the user message just appended to current_chat; return (route, window, reply_key, cached reply)"""
+    route = route_message(user_message, selected_model, current_chat)
+    window = build_context(current_chat, selected_model)
+    reply_key = reply_cache_key(selected_model, route, window)
+    cached = response_cache.get(reply_key) if reply_key else None
+    return route, window, reply_key, cached
 
-        if not agent_executor:
-            # Fallback to direct Groq API if LangChain fails
-            return fallback_to_groq_api(user_message, selected_model, current_chat)
+def run_chat_turn(current_chat: dict, user_message: str, selected_model: str, stream: bool = False, lease=None):
+    """Answer the user message just appended to current_chat: from the cache, directly or via the agent.
 
-        # Prepare conversation context for LangChain
-        user_profile = session.get('user_profile', {})
-        user_name = user_profile.get('name', '')
+    A streamed reply takes over lease, the chat's turn lock, and releases it when the turn is done.
+    """
+    route, window, reply_key, cached = prepare_chat_turn(current_chat, user_message, selected_model)
+    if cached:
+        return cached_chat_reply(current_chat, cached, selected_model, route, stream)
 
-        # Build context from recent conversation history
-        context_messages = []
-        recent_messages = current_chat['messages'][-10:]  # Last 10 messages for context
-        for msg in recent_messages[:-1]:  # Exclude the current message we just added
-            if msg['role'] == 'user':
-                context_messages.append(f"User: {msg['content']}")
-            else:
-                context_messages.append(f"Assistant: {msg['content']}")
-
-        # Create input with context
-        context_str = "\n".join(context_messages) if context_messages else ""
-        user_input = user_message
-        if user_name:
-            user_input = f"[User's name is {user_name}] {user_message}"
-        if context_str:
-            user_input = f"Previous conversation:\n{context_str}\n\nCurrent message: {user_input}"
-
-        # Get response from LangChain agent
-        logger.info(f"Sending request to LangChain agent with model: {selected_model}")
-        response = agent_executor.invoke({"input": user_input})
-        ai_response = response.get("output", "I apologize, but I couldn't generate a response.")
-
-        # Determine if weather tool was used
-        model_used = selected_model
-        if "weather" in user_message.lower() and any(keyword in ai_response.lower() for keyword in ["temperature", "°c", "humidity", "feels like"]):
-            model_used = f"{selected_model} + weather-api"
-
-        # Add AI response to chat history
-        ai_msg = {
-            'role': 'assistant',
-            'content': ai_response,
-            'timestamp': datetime.now().isoformat(),
-            'model': model_used
-        }
-        current_chat['messages'].append(ai_msg)
-        current_chat['updated_at'] = datetime.now().isoformat()
+    if stream:
+        return stream_chat_response(user_message, selected_model, current_chat, route, window, reply_key, lease)
 
-        # Auto-generate chat title if this is the first exchange
-        if len(current_chat['messages']) == 2 and current_chat['title'].startswith('New Chat'):
-            first_msg = current_chat['messages'][0]['content']
-            new_title = first_msg[:30] + "..." if len(first_msg) > 30 else first_msg
-            current_chat['title'] = new_title
+    if route == DIRECT:
+        logger.info(f"Routing message straight to Groq with model: {selected_model}")
+        return direct_completion_response(selected_model, current_chat, window, reply_key=reply_key)
 
-        session.modified = True
+    # Get the cached LangChain agent for the selected model
+    agent_executor = agent_registry.get(selected_model)
 
-        logger.info("Successfully generated AI response using LangChain")
-        return jsonify({
-            'response': ai_response,
-            'model_used': model_used,
-            'chat_id': current_chat['id']
-        })
+    if not agent_executor:
+        # Fallback to direct Groq API if LangChain fails
+        return fallback_to_groq_api(user_message, selected_model, current_chat, window)
+
+    agent_input = build_agent_input(window, get_user_name())
 
+    # Get response from LangChain agent
+    logger.info(f"Sending request to LangChain agent with model: {selected_model}")
+    breaker = circuit_breakers.get(selected_model)
+    tool_results = ToolResultRecorder()
+    admit_groq_call(selected_model, agent_prompt_tokens(window), AGENT_ROUND_TRIPS)
+    try:
+        breaker.check()
+        with metrics.span('agent_invoke', model=selected_model, path='agent'):
+            response = agent_executor.invoke(
+                agent_input,
+                config={"callbacks": [tool_results] + metrics_callbacks(selected_model, 'agent')}
+            )
     except Exception as e:
-        logger.error(f"Error in chat endpoint: {e}")
-        logger.error(f"Error type: {type(e).__name__}")
-        import traceback
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        delay = plan_agent_recovery(e, selected_model)
+        if delay is None:
+            return chat_error_response(e)
+        time.sleep(delay)
+        return fallback_to_groq_api(user_message, selected_model, current_chat, window, tool_results.results)
+    breaker.record_success()
+    ai_response = response.get("output", "I apologize, but I couldn't generate a response.")
+
+    logger.info("Successfully generated AI response using LangChain")
+    return chat_reply(current_chat, ai_response, selected_model, tool_results.results, AGENT, reply_key)
+
+def describe_chat_error(e: Exception) -> tuple:
+    """Map an upstream exception to (message, HTTP status, retry-after seconds or None)"""
+    if isinstance(e, ChatBusy):
+        return 'This chat is still answering a previous message. Please try again shortly.', 409, e.retry_after
+    if isinstance(e, ChatStoreBusy):
+        return 'Your chats are still being saved. Please try again shortly.', 503, e.retry_after
+    error = classify_error(e)
+    if error.kind == CIRCUIT_OPEN:
+        return 'This model is temporarily unavailable. Please try again shortly or pick another model.', 503, error.retry_after
+    if error.kind == RATE_LIMITED:
+        return 'Rate limit exceeded. Please try again in a moment.', 429, error.retry_after
+    if error.kind == OVERLOADED:
+        return 'The model is busy right now. Please try again in a moment.', 503, error.retry_after
+    if error.status_code == 401:
+        return 'Invalid API key. Please check your Groq API key in the .env file.', 500, None
+    if error.status_code is not None:
+        return f'API Error (Status {error.status_code}): {str(e)}', 500, None
+    return f'An error occurred: {str(e)}', 500, None
+
+def chat_error_response(e: Exception):
+    """Map an upstream exception to a JSON error response"""
+    message, status_code, retry_after = describe_chat_error(e)
+    response = jsonify({'error': message})
+    response.status_code = status_code
+    if retry_after is not None:
+        response.headers['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+def plan_agent_recovery(e: Exception, selected_model: str):
+    """Classify a failed agent run; return seconds to wait before falling back, or None to give up.
+
+    The fallback is a single direct completion that reuses the tool results
+    gathered before the failure, so a failed turn costs at most one more
+    completion. Rate limits are waited out first, as long as Retry-After is
+    within the retry policy's max wait.
+    """
+    error = classify_error(e)
+    circuit_breakers.get(selected_model).record_failure(error)
+    metrics.inc('chat_agent_failures_total', model=selected_model, kind=error.kind)
+    logger.error(f"LangChain agent failed ({error.kind}): {e}")
+    if not error.fallback:
+        return None
+    if error.kind == RATE_LIMITED:
+        delay = retry_policy.delay(0, error.retry_after)
+        return delay if delay <= retry_policy.max_wait else None
+    return 0.0
+
+async def achat():
+    """Async variant of chat() served natively on the event loop by asgi.py"""
+    user_message = ''
+    selected_model = 'llama3-8b-8192'
+    try:
+        data = request.get_json()
+        user_message = data.get('message', '').strip()
+        selected_model = data.get('model', 'llama3-8b-8192')
+
+        if not user_message:
+            return jsonify({'error': 'Message cannot be empty'}), 400
 
-        # Try fallback to direct Groq API
+        # Agents, breakers, admission queues and metric labels are kept per model
+        if selected_model not in AVAILABLE_MODELS:
+            return jsonify({'error': f'Unknown model: {selected_model}'}), 400
+
+        initialize_session()
+
+        # Fail fast, before storing the message, while the model's breaker is open or it is overloaded
+        circuit_breakers.get(selected_model).reject_if_open()
+        admission.reject_if_overloaded(selected_model, session['user_id'])
+
+        # Get or create current chat, waiting for any turn already running in it
+        current_chat, lease = await alock_current_chat()
         try:
-            current_chat = get_current_chat()
-            if current_chat:
-                return fallback_to_groq_api(user_message, selected_model, current_chat)
-        except:
-            pass
-
-        if hasattr(e, 'status_code'):
-            if e.status_code == 401:
-                return jsonify({'error': 'Invalid API key. Please check your Groq API key in the .env file.'}), 500
-            elif e.status_code == 429:
-                return jsonify({'error': 'Rate limit exceeded. Please try again in a moment.'}), 500
-            else:
-                return jsonify({'error': f'API Error (Status {e.status_code}): {str(e)}'}), 500
-        else:
-            return jsonify({'error': f'An error occurred: {str(e)}'}), 500
+            return await arun_chat_turn(current_chat, user_message, selected_model)
+        finally:
+            await asyncio.to_thread(lease.release)
 
-def fallback_to_groq_api(user_message: str, selected_model: str, current_chat: dict):
-    """Fallback function to use direct Groq API when LangChain fails"""
+    except Exception as e:
+        logger.error(f"Error in async chat endpoint: {e}")
+        return chat_error_response(e)
+
+async def arun_chat_turn(current_chat: dict, user_message: str, selected_model: str):
+    """Async variant of run_chat_turn() that also stores the user message.
+
+    Only the Groq calls are awaited on the event loop. Store, profile and
+    response cache reads and writes, the summarizer and cold agent builds
+    can block, so they run on worker threads.
+    """
+    # Add user message to chat history
+    user_msg = {
+        'role': 'user',
+        'content': user_message,
+        'timestamp': datetime.now().isoformat()
+    }
+    await asyncio.to_thread(append_chat_message, current_chat, user_msg)
+
+    route, window, reply_key, cached = await asyncio.to_thread(prepare_chat_turn, current_chat, user_message,
+                                                               selected_model)
+    if cached:
+        return await asyncio.to_thread(cached_chat_reply, current_chat, cached, selected_model, route)
+
+    if route == DIRECT:
+        return await adirect_completion_response(selected_model, current_chat, window, reply_key=reply_key)
+
+    agent_executor = await asyncio.to_thread(agent_registry.get, selected_model)
+
+    if not agent_executor:
+        return await afallback_to_groq_api(user_message, selected_model, current_chat, window)
+
+    agent_input = build_agent_input(window, await asyncio.to_thread(get_user_name))
+
+    logger.info(f"Sending async request to LangChain agent with model: {selected_model}")
+    breaker = circuit_breakers.get(selected_model)
+    tool_results = ToolResultRecorder()
+    await aadmit_groq_call(selected_model, agent_prompt_tokens(window), AGENT_ROUND_TRIPS)
+    try:
+        breaker.check()
+        with metrics.span('agent_invoke', model=selected_model, path='agent'):
+            response = await agent_executor.ainvoke(
+                agent_input,
+                config={"callbacks": [tool_results] + metrics_callbacks(selected_model, 'agent')}
+            )
+    except Exception as e:
+        delay = plan_agent_recovery(e, selected_model)
+        if delay is None:
+            return chat_error_response(e)
+        await asyncio.sleep(delay)
+        return await afallback_to_groq_api(user_message, selected_model, current_chat, window, tool_results.results)
+    breaker.record_success()
+    ai_response = response.get("output", "I apologize, but I couldn't generate a response.")
+    return await asyncio.to_thread(chat_reply, current_chat, ai_response, selected_model, tool_results.results, AGENT,
+                                   reply_key)
+
+def get_user_name() -> str:
+    """Name from the user's profile, if set"""
+    user_id = session.get('user_id')
+    return (get_user_profile(user_id).get('name') if user_id else '') or ''
+
+def route_message(user_message: str, selected_model: str, current_chat: dict) -> str:
+    """Pick the agent or a single direct completion for the current message"""
+    if not (get_groq_client() and get_async_groq_client()):
+        return AGENT
+    history = current_chat['messages'][:-1]
+    previous_used_tools = bool(history) and '+ weather-api' in (history[-1].get('model') or '')
+    route = model_router.route(user_message, previous_used_tools)
+    metrics.inc('chat_routes_total', model=selected_model, route=route)
+    return route
+
+def estimate_prompt_tokens(messages: list, model_name: str) -> int:
+    """Estimated prompt tokens of an outgoing Groq message list"""
+    counter = context_builder.counter
+    return sum(counter.count_text(msg['content'], model_name) + MESSAGE_OVERHEAD_TOKENS for msg in messages)
+
+def agent_prompt_tokens(window) -> int:
+    """Estimated prompt tokens of each agent round trip: the context plus system prompt and tools"""
+    return (window.tokens + PROMPT_RESERVE_TOKENS) * AGENT_ROUND_TRIPS
+
+def admit_groq_call(selected_model: str, tokens: int, requests: int = 1, max_wait: float = None, user_id: str = None):
+    """Wait for the model's RPM/TPM budget in the user's fair-queue slot; raises AdmissionRejected"""
+    if user_id is None:
+        # Background tasks (summary folds) run outside any request and share one slot
+        user_id = session.get('user_id') if has_request_context() else 'background'
+    with metrics.span('admission_wait', model=selected_model):
+        admission.acquire(selected_model, user_id or 'anonymous', tokens, requests, max_wait)
+
+async def aadmit_groq_call(selected_model: str, tokens: int, requests: int = 1):
+    """Async variant of admit_groq_call"""
+    with metrics.span('admission_wait', model=selected_model):
+        await admission.aacquire(selected_model, session.get('user_id') or 'anonymous', tokens, requests)
+
+def summarize_turns(previous_summary: str, messages: list, model_name: str) -> str:
+    """Fold conversation turns into the rolling summary used by context_builder"""
+    transcript = "\n".join(f"{msg['role'].capitalize()}: {msg['content']}" for msg in messages)
     try:
+        groq_client = get_groq_client()
         if not groq_client:
+            raise RuntimeError("Groq client unavailable")
+        summary_messages = [
+            {"role": "system", "content": (
+                "You maintain a running summary of a conversation. Update the summary with the new "
+                "turns, keeping names, facts, preferences and open questions. Reply with the summary only."
+            )},
+            {"role": "user", "content": f"Current summary:\n{previous_summary or '(empty)'}\n\nNew turns:\n{transcript}"}
+        ]
+        # Never queue for a summary: the extractive fallback below is better than waiting
+        admit_groq_call(model_name, estimate_prompt_tokens(summary_messages, model_name), max_wait=0)
+        with metrics.span('groq_completion', model=model_name, path='summary'):
+            # A single attempt: the extractive fallback below is better than waiting
+            chat_completion = call_with_retry(
+                lambda: groq_client.chat.completions.create(
+                    messages=summary_messages,
+                    model=model_name,
+                    max_tokens=SUMMARY_MAX_TOKENS,
+                    temperature=0.2
+                ),
+                circuit_breakers.get(model_name),
+                retry_policy,
+                max_attempts=1
+            )
+        metrics.record_tokens(chat_completion.usage, model=model_name, path='summary')
+        return chat_completion.choices[0].message.content.strip()
+    except Exception as e:
+        logger.warning(f"Summarization failed, keeping a truncated transcript instead: {e}")
+        excerpt = "\n".join(f"{msg['role'].capitalize()}: {msg['content'][:200]}" for msg in messages)
+        combined = f"{previous_summary}\n{excerpt}".strip()
+        return combined[-SUMMARY_MAX_TOKENS * 4:]
+
+context_builder = ContextBuilder(summarize_turns, state_store=chat_store if MULTI_WORKER else None)
+
+def older_messages(user_id: str, chat_id: str):
+    """fetch_older(before, limit) callback of context_builder for a chat"""
+    return lambda before, limit: chat_store.get_messages(user_id, chat_id, before=before, limit=limit) or []
+
+def build_context(current_chat: dict, selected_model: str):
+    """Token-budgeted context window for the current chat"""
+    with metrics.span('context_build', model=selected_model):
+        window = context_builder.build(
+            current_chat,
+            selected_model,
+            older_messages(current_chat['user_id'], current_chat['id'])
+        )
+    # Bytes and tokens of the history sent this turn, split into the part repeated from the previous turn and the rest
+    metrics.inc('prompt_history_bytes_total', window.prefix_bytes, model=selected_model, part='prefix')
+    metrics.inc('prompt_history_bytes_total', window.bytes - window.prefix_bytes, model=selected_model, part='new')
+    metrics.inc('prompt_history_tokens_total', window.prefix_tokens, model=selected_model, part='prefix')
+    metrics.inc('prompt_history_tokens_total', window.tokens - window.prefix_tokens, model=selected_model, part='new')
+    return window
+
+def build_agent_input(window, user_name: str) -> dict:
+    """Agent input with the current message and role-tagged history.
+
+    The history messages are the window's own dicts, so they reach the model
+    exactly as formatted on earlier turns.
+    """
+    notes = []
+    if user_name:
+        notes.append(f"The user's name is {user_name}.")
+    if window.summary:
+        notes.append(f"Summary of the earlier conversation: {window.summary}")
+
+    chat_history = [{"role": "system", "content": " ".join(notes)}] if notes else []
+    chat_history.extend(window.history)
+
+    return {"input": window.messages[-1]['content'], "chat_history": chat_history}
+
+def build_groq_messages(window, user_name: str, tool_results=None) -> list:
+    """Build the message list sent to the direct Groq API.
+
+    Everything that varies per call goes after the conversation, so the
+    system message and history stay a stable prefix across turns.
+    """
+    system_message = "You are a helpful AI assistant. Provide clear, concise, and helpful responses."
+    if user_name:
+        system_message += f" The user's name is {user_name}. Remember this information throughout the conversation."
+    if window.summary:
+        system_message += f"\n\nSummary of the earlier conversation: {window.summary}"
+
+    messages = [{"role": "system", "content": system_message}] + window.messages
+    if tool_results:
+        # Results a failed agent run already fetched; answer from them instead of refetching
+        lines = "\n".join(f"- {name}({tool_input}): {output}" for name, tool_input, output in tool_results)
+        messages.append({"role": "system", "content": f"Tool results already retrieved for the user's latest message:\n{lines}"})
+    return messages
+
+def record_ai_response(current_chat: dict, ai_response: str, model_used: str, selected_model: str):
+    """Append the assistant reply to the chat and queue the summary fold the next turn may need"""
+    ai_msg = {
+        'role': 'assistant',
+        'content': ai_response,
+        'timestamp': datetime.now().isoformat(),
+        'model': model_used
+    }
+    append_chat_message(current_chat, ai_msg)
+    background_tasks.submit('summary', prefold_summary, current_chat['user_id'], current_chat['id'], selected_model,
+                            key=current_chat['id'])
+
+def prefold_summary(user_id: str, chat_id: str, selected_model: str):
+    """Background task: fold the chat's rolling summary now if the next turn would have to"""
+    current_chat = chat_store.get_chat(user_id, chat_id, message_limit=CONTEXT_MESSAGE_LIMIT)
+    if current_chat:
+        context_builder.prefold(current_chat, selected_model, older_messages(user_id, chat_id))
+
+def cache_reply(reply_key: str, ai_response: str, model_used: str, used_tools: bool = False):
+    """Store a reply in the response cache on a background task"""
+    background_tasks.submit('response_cache', response_cache.set, reply_key, ai_response, model_used, used_tools)
+
+def model_used_label(selected_model: str, tool_results, path: str) -> str:
+    """model_used label of a reply, from the tool calls that actually ran"""
+    model_used = selected_model
+    if any(name == get_weather_for_city.__name__ for name, _, _ in tool_results or ()):
+        model_used += " + weather-api"
+    if path == 'fallback':
+        model_used += " (fallback)"
+    return model_used
+
+def chat_reply(current_chat: dict, ai_response: str, selected_model: str, tool_results, path: str, reply_key: str = None):
+    """Store the assistant reply, cache it under reply_key, and build the /chat JSON response"""
+    model_used = model_used_label(selected_model, tool_results, path)
+    record_ai_response(current_chat, ai_response, model_used, selected_model)
+    if reply_key and path != 'fallback':
+        cache_reply(reply_key, ai_response, model_used, used_tools=bool(tool_results))
+    return jsonify({
+        'response': ai_response,
+        'model_used': model_used,
+        'route': path,
+        'chat_id': current_chat['id']
+    })
+
+def reply_cache_key(selected_model: str, route: str, window):
+    """Response cache key of the current message, or None when the cache is off"""
+    if not response_cache.enabled:
+        return None
+    context = {'summary': window.summary, 'history': window.history, 'user_name': get_user_name()}
+    return cache_key(selected_model, route, window.messages[-1]['content'], context)
+
+def cached_chat_reply(current_chat: dict, cached: tuple, selected_model: str, route: str, stream: bool = False):
+    """Answer from the response cache, as JSON or as a one-token SSE stream"""
+    ai_response, model_used = cached
+    model_used = f"{model_used} (cached)"
+    record_ai_response(current_chat, ai_response, model_used, selected_model)
+    payload = {
+        'response': ai_response,
+        'model_used': model_used,
+        'route': route,
+        'cached': True,
+        'chat_id': current_chat['id']
+    }
+    if not stream:
+        return jsonify(payload)
+    return Response(
+        sse_event('token', {'token': ai_response}) + sse_event('done', payload),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def direct_completion_response(selected_model: str, current_chat: dict, window=None, tool_results=None, path: str = DIRECT, reply_key: str = None):
+    """Answer with one direct Groq completion: the router's direct path and the agent fallback"""
+    if window is None:
+        window = build_context(current_chat, selected_model)
+    messages = build_groq_messages(window, get_user_name(), tool_results)
+    admit_groq_call(selected_model, estimate_prompt_tokens(messages, selected_model))
+
+    groq_client = get_groq_client()
+    with metrics.span('groq_completion', model=selected_model, path=path):
+        chat_completion = call_with_retry(
+            lambda: groq_client.chat.completions.create(
+                messages=messages,
+                model=selected_model,
+                max_tokens=1024,
+                temperature=0.7,
+                top_p=1,
+                stream=False
+            ),
+            circuit_breakers.get(selected_model),
+            retry_policy
+        )
+    metrics.record_tokens(chat_completion.usage, model=selected_model, path=path)
+
+    ai_response = chat_completion.choices[0].message.content
+    return chat_reply(current_chat, ai_response, selected_model, tool_results, path, reply_key)
+
+def fallback_to_groq_api(user_message: str, selected_model: str, current_chat: dict, window=None, tool_results=None):
+    """Fallback function to use direct Groq API when LangChain fails.
+
+    window and tool_results come from a failed agent run, when there was one,
+    so the context is not rebuilt and finished tool calls are not repeated.
+    """
+    try:
+        if not get_groq_client():
             return jsonify({'error': 'Both LangChain and Groq API clients are unavailable.'}), 500
 
         logger.info("Using fallback Groq API")
+        metrics.inc('chat_fallbacks_total', model=selected_model)
+        return direct_completion_response(selected_model, current_chat, window, tool_results, path='fallback')
+
+    except Exception as fallback_error:
+        logger.error(f"Fallback Groq API also failed: {fallback_error}")
+        return fallback_error_response(fallback_error)
+
+def fallback_error_response(e: Exception):
+    """Error response once the fallback failed too"""
+    if classify_error(e).kind in (CIRCUIT_OPEN, OVERLOADED, RATE_LIMITED):
+        return chat_error_response(e)
+    return jsonify({'error': 'Both LangChain and fallback API failed. Please try again.'}), 500
+
+async def adirect_completion_response(selected_model: str, current_chat: dict, window=None, tool_results=None, path: str = DIRECT, reply_key: str = None):
+    """Async variant of direct_completion_response using the async Groq client"""
+    user_name = await asyncio.to_thread(get_user_name)
+    if window is None:
+        window = await asyncio.to_thread(build_context, current_chat, selected_model)
+    messages = build_groq_messages(window, user_name, tool_results)
+    await aadmit_groq_call(selected_model, estimate_prompt_tokens(messages, selected_model))
+
+    async_groq_client = await asyncio.to_thread(get_async_groq_client)
+    with metrics.span('groq_completion', model=selected_model, path=path):
+        chat_completion = await acall_with_retry(
+            lambda: async_groq_client.chat.completions.create(
+                messages=messages,
+                model=selected_model,
+                max_tokens=1024,
+                temperature=0.7,
+                top_p=1,
+                stream=False
+            ),
+            circuit_breakers.get(selected_model),
+            retry_policy
+        )
+    metrics.record_tokens(chat_completion.usage, model=selected_model, path=path)
+
+    ai_response = chat_completion.choices[0].message.content
+    return await asyncio.to_thread(chat_reply, current_chat, ai_response, selected_model, tool_results, path, reply_key)
+
+async def afallback_to_groq_api(user_message: str, selected_model: str, current_chat: dict, window=None, tool_results=None):
+    """Async variant of fallback_to_groq_api using the async Groq client"""
+    try:
+        if not await asyncio.to_thread(get_async_groq_client):
+            return jsonify({'error': 'Both LangChain and Groq API clients are unavailable.'}), 500
+
+        logger.info("Using async fallback Groq API")
+        metrics.inc('chat_fallbacks_total', model=selected_model)
+        return await adirect_completion_response(selected_model, current_chat, window, tool_results, path='fallback')
+
+    except Exception as fallback_error:
+        logger.error(f"Async fallback Groq API also failed: {fallback_error}")
+        return fallback_error_response(fallback_error)
+
+def sse_event(event: str, data: dict) -> str:
+    """Format a single Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+class SSEStreamHandler(BaseCallbackHandler):
+    """Forward LLM tokens and tool calls from a running agent into a queue"""
+
+    def __init__(self, events: queue.Queue):
+        self.events = events
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        if token:
+            self.events.put(('token', {'token': token}))
 
-        # Prepare messages for Groq API
-        user_profile = session.get('user_profile', {})
-        user_name = user_profile.get('name', '')
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        self.events.put(('tool_start', {'tool': (serialized or {}).get('name'), 'input': input_str}))
+
+    def on_tool_end(self, output, **kwargs):
+        self.events.put(('tool_end', {'output': str(output)}))
+
+def stream_chat_response(user_message: str, selected_model: str, current_chat: dict, route: str = AGENT,
+                         window=None, reply_key: str = None, lease=None):
+    """Stream the assistant reply as Server-Sent Events.
+
+    The turn runs on a thread of its own, which stores the reply and then
+    releases lease whether or not the client is still reading. The response
+    body only forwards that thread's events, so a client that disconnects
+    midway still finds the whole reply in the chat, and the chat stays locked
+    until it is stored.
+    """
+    agent_executor = agent_registry.get(selected_model) if route == AGENT else None
+    user_id = session.get('user_id')
+    user_name = get_user_name()
+    if window is None:
+        window = build_context(current_chat, selected_model)
+    agent_input = build_agent_input(window, user_name)
+    breaker = circuit_breakers.get(selected_model)
+    tool_results = ToolResultRecorder()
+
+    def generate():
+        tokens_sent = False
+        if agent_executor:
+            events = queue.Queue()
+            result = {}
+
+            def run_agent():
+                try:
+                    callbacks = [SSEStreamHandler(events), tool_results] + metrics_callbacks(selected_model, 'agent')
+                    admit_groq_call(selected_model, agent_prompt_tokens(window), AGENT_ROUND_TRIPS, user_id=user_id)
+                    breaker.check()
+                    with metrics.span('agent_invoke', model=selected_model, path='agent'):
+                        response = agent_executor.invoke(agent_input, config={"callbacks": callbacks})
+                    breaker.record_success()
+                    result['output'] = response.get("output", "I apologize, but I couldn't generate a response.")
+                except Exception as e:
+                    result['error'] = e
+                finally:
+                    events.put(None)
+
+            logger.info(f"Streaming request to LangChain agent with model: {selected_model}")
+            threading.Thread(target=run_agent, daemon=True).start()
+
+            while True:
+                item = events.get()
+                if item is None:
+                    break
+                event, payload = item
+                if event == 'token':
+                    tokens_sent = True
+                elif event == 'tool_start':
+                    # Tokens streamed before a tool call belong to the planning step
+                    tokens_sent = False
+                yield sse_event(event, payload)
+
+            if 'error' not in result:
+                ai_response = result['output']
+                model_used = model_used_label(selected_model, tool_results.results, AGENT)
+                record_ai_response(current_chat, ai_response, model_used, selected_model)
+                if reply_key:
+                    cache_reply(reply_key, ai_response, model_used, used_tools=bool(tool_results.results))
+                yield sse_event('done', {
+                    'response': ai_response,
+                    'model_used': model_used,
+                    'route': AGENT,
+                    'chat_id': current_chat['id']
+                })
+                return
+
+            delay = plan_agent_recovery(result['error'], selected_model)
+            if delay is None:
+                yield sse_event('error', {'error': describe_chat_error(result['error'])[0]})
+                return
+            time.sleep(delay)
+
+        # Direct Groq API streaming: the router's direct path, or the fallback
+        path = DIRECT if route == DIRECT else 'fallback'
+        groq_client = get_groq_client()
+        if not groq_client:
+            yield sse_event('error', {'error': 'Both LangChain and Groq API clients are unavailable.'})
+            return
 
-        system_message = "You are a helpful AI assistant. Provide clear, concise, and helpful responses."
-        if user_name:
-            system_message += f" The user's name is {user_name}. Remember this information throughout the conversation."
+        if tokens_sent:
+            yield sse_event('reset', {})
 
-        messages = [{"role": "system", "content": system_message}]
-        recent_messages = current_chat['messages'][-20:]
-        for msg in recent_messages:
-            messages.append({
-                "role": msg['role'],
-                "content": msg['content']
+        try:
+            if path == 'fallback':
+                logger.info("Using fallback Groq API (streaming)")
+                metrics.inc('chat_fallbacks_total', model=selected_model)
+            start = time.perf_counter()
+            # Only opening the stream is retried; a stream that breaks midway is not restarted
+            groq_messages = build_groq_messages(window, user_name, tool_results.results)
+            admit_groq_call(selected_model, estimate_prompt_tokens(groq_messages, selected_model), user_id=user_id)
+            completion = call_with_retry(
+                lambda: groq_client.chat.completions.create(
+                    messages=groq_messages,
+                    model=selected_model,
+                    max_tokens=1024,
+                    temperature=0.7,
+                    top_p=1,
+                    stream=True
+                ),
+                breaker,
+                retry_policy
+            )
+            parts = []
+            for chunk in completion:
+                token = chunk.choices[0].delta.content if chunk.choices else None
+                if token:
+                    parts.append(token)
+                    yield sse_event('token', {'token': token})
+                # Groq reports usage on the final chunk
+                x_groq = getattr(chunk, 'x_groq', None)
+                metrics.record_tokens(getattr(x_groq, 'usage', None), model=selected_model, path=path)
+            metrics.record_span('groq_completion', time.perf_counter() - start, model=selected_model, path=path)
+
+            ai_response = "".join(parts)
+            model_used = model_used_label(selected_model, tool_results.results, path)
+            record_ai_response(current_chat, ai_response, model_used, selected_model)
+            if reply_key and path == DIRECT:
+                cache_reply(reply_key, ai_response, model_used)
+            yield sse_event('done', {
+                'response': ai_response,
+                'model_used': model_used,
+                'route': path,
+                'chat_id': current_chat['id']
             })
+        except Exception as fallback_error:
+            logger.error(f"Direct Groq API streaming failed ({path}): {fallback_error}")
+            if path == DIRECT or classify_error(fallback_error).kind in (CIRCUIT_OPEN, OVERLOADED, RATE_LIMITED):
+                yield sse_event('error', {'error': describe_chat_error(fallback_error)[0]})
+            else:
+                yield sse_event('error', {'error': 'Both LangChain and fallback API failed. Please try again.'})
 
-        # Call Groq API
-        chat_completion = groq_client.chat.completions.create(
-            messages=messages,
-            model=selected_model,
-            max_tokens=1024,
-            temperature=0.7,
-            top_p=1,
-            stream=False
-        )
+    replies = queue.Queue()
 
-        ai_response = chat_completion.choices[0].message.content
+    def run_turn():
+        try:
+            for event in generate():
+                replies.put(event)
+        except Exception as e:
+            logger.error(f"Streamed chat turn failed: {e}")
+            replies.put(sse_event('error', {'error': describe_chat_error(e)[0]}))
+        finally:
+            if lease is not None:
+                lease.release()
+            replies.put(None)
+
+    def forward():
+        while True:
+            event = replies.get()
+            if event is None:
+                return
+            yield event
+
+    # Copy the context so the turn's spans still reach the request's timing trace
+    threading.Thread(target=contextvars.copy_context().run, args=(run_turn,), name='chat-turn', daemon=True).start()
+    return Response(
+        forward(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
-        ai_msg = {
-            'role': 'assistant',
-            'content': ai_response,
-            'timestamp': datetime.now().isoformat(),
-            'model': f"{selected_model} (fallback)"
-        }
-        current_chat['messages'].append(ai_msg)
-        current_chat['updated_at'] = datetime.now().isoformat()
+@app.route('/chats/bulk', methods=['POST'])
+def bulk_chat():
+    """Run many (chat_id, message, model) jobs concurrently and stream each result as an NDJSON line.
 
-        session.modified = True
+    The body is either {"jobs": [...], "concurrency": n} or NDJSON with one job
+    per line (Content-Type: application/x-ndjson, ?concurrency=n). Jobs without
+    a chat_id each start a new chat of the session's user.
+    """
+    initialize_session()
+    try:
+        if request.mimetype == 'application/x-ndjson':
+            raw_jobs = [json.loads(line) for line in request.get_data(as_text=True).splitlines() if line.strip()]
+            concurrency = request.args.get('concurrency', type=int)
+        else:
+            data = request.get_json(silent=True) or {}
+            raw_jobs = data.get('jobs')
+            concurrency = int(data.get('concurrency') or request.args.get('concurrency', 0, type=int))
+        jobs = parse_jobs(raw_jobs, 'llama3-8b-8192', BULK_MAX_JOBS, AVAILABLE_MODELS)
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': f'Invalid bulk request: {str(e)}'}), 400
+
+    logger.info(f"Running {len(jobs)} bulk jobs for user {session['user_id']}")
+
+    def generate():
+        start = time.perf_counter()
+        succeeded = 0
+        for result in bulk_runner.run(jobs, run_bulk_job, concurrency, wrap=copy_current_request_context):
+            if result['status'] < 400:
+                succeeded += 1
+            yield json.dumps(result) + '\n'
+        yield json.dumps({
+            'done': True,
+            'jobs': len(jobs),
+            'succeeded': succeeded,
+            'failed': len(jobs) - succeeded,
+            'seconds': round(time.perf_counter() - start, 3)
+        }) + '\n'
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
-        return jsonify({
-            'response': ai_response,
-            'model_used': f"{selected_model} (fallback)",
-            'chat_id': current_chat['id']
+def run_bulk_job(job: dict) -> dict:
+    """Run one bulk job in its chat, or a new chat, and describe the outcome as a dict"""
+    user_id = session['user_id']
+    selected_model = job['model']
+    current_chat = None
+    lease = None
+    try:
+        circuit_breakers.get(selected_model).reject_if_open()
+        admission.reject_if_overloaded(selected_model, user_id)
+        if job['chat_id']:
+            lease = chat_locks.acquire(job['chat_id'])
+            current_chat = chat_store.get_chat(user_id, job['chat_id'], message_limit=CONTEXT_MESSAGE_LIMIT)
+            if not current_chat:
+                return {'status': 404, 'chat_id': job['chat_id'], 'error': 'Chat not found'}
+        else:
+            current_chat = create_chat_for_user(user_id, job['title'] or 'New Chat')
+
+        append_chat_message(current_chat, {
+            'role': 'user',
+            'content': job['message'],
+            'timestamp': datetime.now().isoformat()
         })
+        response = app.make_response(run_chat_turn(current_chat, job['message'], selected_model))
+    except Exception as e:
+        logger.error(f"Bulk job {job['index']} failed: {e}")
+        message, status_code, retry_after = describe_chat_error(e)
+        result = {'status': status_code, 'error': message}
+        if retry_after is not None:
+            result['retry_after'] = math.ceil(retry_after)
+    else:
+        result = dict(response.get_json(), status=response.status_code)
+        if 'Retry-After' in response.headers:
+            result['retry_after'] = int(response.headers['Retry-After'])
+    finally:
+        if lease:
+            lease.release()
+
+    if current_chat:
+        result.setdefault('chat_id', current_chat['id'])
+    metrics.inc('bulk_jobs_total', model=selected_model, status=result['status'])
+    return result
+
+@app.route('/chats/export', methods=['GET'])
+def export_user_chats():
+    """Stream every chat of the session's user as NDJSON: a header line, then each chat followed by its messages"""
+    initialize_session()
+    user_id = session['user_id']
+    try:
+        source = chat_store.export_source(user_id)
+    except ChatStoreBusy as e:
+        return chat_error_response(e)
+    logger.info(f"Exporting chats of user {user_id}")
+    return Response(
+        stream_with_context(export_chats(source, user_id)),
+        mimetype='application/x-ndjson',
+        headers={
+            'Cache-Control': 'no-cache',
+            'Content-Disposition': 'attachment; filename="chats.ndjson"',
+            'X-Accel-Buffering': 'no'
+        }
+    )
 
-    except Exception as fallback_error:
-        logger.error(f"Fallback Groq API also failed: {fallback_error}")
-        return jsonify({'error': 'Both LangChain and fallback API failed. Please try again.'}), 500
+@app.route('/chats/import', methods=['POST'])
+def import_user_chats():
+    """Add the chats of an NDJSON export (see GET /chats/export) to the session's user, reading it line by line"""
+    initialize_session()
+    user_id = session['user_id']
+    try:
+        imported = import_chats(request.stream, chat_store, search_index, user_id)
+    except ImportFormatError as e:
+        return jsonify({'error': f'Invalid import: {str(e)}', 'line': e.line_number, 'imported': e.imported}), 400
+    except Exception as e:
+        logger.error(f"Error importing chats: {e}")
+        return jsonify({'error': 'Failed to import chats'}), 500
+
+    logger.info(f"Imported {imported['chats']} chats and {imported['messages']} messages for user {user_id}")
+    if not session.get('current_chat_id'):
+        chats = chat_store.list_chats(user_id, limit=1)
+        if chats:
+            session['current_chat_id'] = chats[0]['id']
+    return jsonify(dict(imported, message='Chats imported successfully'))
 
 @app.route('/chats/new', methods=['POST'])
 def new_chat():
@@ -400,48 +1464,57 @@ def new_chat():
         logger.error(f"Traceback: {traceback.format_exc()}")
         return jsonify({'error': f'Failed to create new chat: {str(e)}'}), 500
 
+def encode_cursor(chat_summary: dict) -> str:
+    """Opaque pagination cursor pointing after a chat in recency order"""
+    raw = json.dumps([chat_summary['updated_at'], chat_summary['id']])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    """Inverse of encode_cursor"""
+    try:
+        updated_at, chat_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (updated_at, chat_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
 @app.route('/chats', methods=['GET'])
 def get_chats():
     """Get all chat sessions for the current user"""
     try:
         initialize_session()
         user_id = session.get('user_id')
-        user_chats = chat_sessions.get(user_id, {})
+        limit = max(1, min(request.args.get('limit', CHAT_PAGE_SIZE, type=int), MAX_CHAT_PAGE_SIZE))
+        cursor = request.args.get('cursor')
+        try:
+            before = decode_cursor(cursor) if cursor else None
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+        # Fetch one extra row to know whether another page follows
+        chats_list = chat_store.list_chats(user_id, limit=limit + 1, before=before)
 
         # Create a default chat if none exists
-        if not user_chats and not session.get('current_chat_id'):
+        if not chats_list and not cursor and not session.get('current_chat_id'):
             logger.info("No chats found, creating default chat")
             create_new_chat("New Chat")
-            user_chats = chat_sessions.get(user_id, {})
-
-        # Convert to list and sort by updated_at
-        chats_list = []
-        for chat_id, chat_data in user_chats.items():
-            # Add preview text (first user message)
-            preview = ""
-            for msg in chat_data['messages']:
-                if msg['role'] == 'user':
-                    preview = msg['content'][:50] + "..." if len(msg['content']) > 50 else msg['content']
-                    break
+            chats_list = chat_store.list_chats(user_id, limit=limit + 1)
 
-            chat_summary = {
-                'id': chat_data['id'],
-                'title': chat_data['title'],
-                'preview': preview,
-                'created_at': chat_data['created_at'],
-                'updated_at': chat_data['updated_at'],
-                'message_count': len(chat_data['messages'])
-            }
-            chats_list.append(chat_summary)
+        next_cursor = None
+        if len(chats_list) > limit:
+            chats_list = chats_list[:limit]
+            next_cursor = encode_cursor(chats_list[-1])
 
-        # Sort by updated_at (most recent first)
-        chats_list.sort(key=lambda x: x['updated_at'], reverse=True)
-
-        logger.info(f"Returning {len(chats_list)} chats for user {user_id}")
-        return jsonify({
+        response = jsonify({
             'chats': chats_list,
-            'current_chat_id': session.get('current_chat_id')
+            'current_chat_id': session.get('current_chat_id'),
+            'next_cursor': next_cursor
         })
+
+        # Let the sidebar revalidate cheaply: unchanged pages return 304
+        response.add_etag()
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
     except Exception as e:
         logger.error(f"Error getting chats: {e}")
         return jsonify({'error': 'Failed to get chats'}), 500
@@ -452,7 +1525,7 @@ def get_chat(chat_id):
     try:
         initialize_session()
         user_id = session.get('user_id')
-        chat_data = chat_sessions.get(user_id, {}).get(chat_id)
+        chat_data = get_chat_with_last_page(user_id, chat_id)
 
         if not chat_data:
             return jsonify({'error': 'Chat not found'}), 404
@@ -462,6 +1535,36 @@ def get_chat(chat_id):
         logger.error(f"Error getting chat {chat_id}: {e}")
         return jsonify({'error': 'Failed to get chat'}), 500
 
+def get_chat_with_last_page(user_id: str, chat_id: str):
+    """Chat metadata plus only its most recent page of messages"""
+    chat_data = chat_store.get_chat(user_id, chat_id, message_limit=MESSAGE_PAGE_SIZE)
+    if chat_data:
+        chat_data['has_more'] = chat_data['message_count'] > len(chat_data['messages'])
+    return chat_data
+
+@app.route('/chats/<chat_id>/messages', methods=['GET'])
+def get_chat_messages(chat_id):
+    """Get a page of messages older than ?before=<message id>"""
+    try:
+        initialize_session()
+        user_id = session.get('user_id')
+        before = request.args.get('before', type=int)
+        limit = max(1, min(request.args.get('limit', MESSAGE_PAGE_SIZE, type=int), MAX_MESSAGE_PAGE_SIZE))
+
+        # Fetch one extra message to know whether older ones remain
+        messages = chat_store.get_messages(user_id, chat_id, before=before, limit=limit + 1)
+        if messages is None:
+            return jsonify({'error': 'Chat not found'}), 404
+
+        has_more = len(messages) > limit
+        if has_more:
+            messages = messages[1:]
+
+        return jsonify({'messages': messages, 'has_more': has_more})
+    except Exception as e:
+        logger.error(f"Error getting messages for chat {chat_id}: {e}")
+        return jsonify({'error': 'Failed to get messages'}), 500
+
 @app.route('/chats/<chat_id>/switch', methods=['POST'])
 def switch_chat(chat_id):
     """Switch to a different chat session"""
@@ -469,13 +1572,12 @@ def switch_chat(chat_id):
         initialize_session()
         user_id = session.get('user_id')
 
-        if chat_id not in chat_sessions.get(user_id, {}):
+        chat_data = get_chat_with_last_page(user_id, chat_id)
+        if not chat_data:
             return jsonify({'error': 'Chat not found'}), 404
 
         session['current_chat_id'] = chat_id
-        session.modified = True
 
-        chat_data = chat_sessions[user_id][chat_id]
         return jsonify({
             'message': 'Chat switched successfully',
             'chat': chat_data
@@ -510,21 +1612,20 @@ def delete_chat(chat_id):
         initialize_session()
         user_id = session.get('user_id')
 
-        if user_id not in chat_sessions or chat_id not in chat_sessions[user_id]:
+        if not chat_store.delete_chat(user_id, chat_id):
             return jsonify({'error': 'Chat not found'}), 404
-
-        del chat_sessions[user_id][chat_id]
+        search_index.remove_chat(user_id, chat_id)
+        context_builder.forget(chat_id)
 
         # If this was the current chat, switch to another one or create new
         if session.get('current_chat_id') == chat_id:
-            remaining_chats = list(chat_sessions.get(user_id, {}).keys())
+            remaining_chats = chat_store.list_chats(user_id)
             if remaining_chats:
-                session['current_chat_id'] = remaining_chats[0]
+                session['current_chat_id'] = remaining_chats[0]['id']
             else:
                 # Create a new chat if no chats remain
                 create_new_chat("New Chat")
 
-        session.modified = True
         return jsonify({'message': 'Chat deleted successfully'})
     except Exception as e:
         logger.error(f"Error deleting chat {chat_id}: {e}")
@@ -535,7 +1636,7 @@ def get_profile():
     """Get user profile"""
     try:
         initialize_session()
-        return jsonify({'profile': session.get('user_profile', {})})
+        return jsonify({'profile': get_user_profile(session['user_id'])})
     except Exception as e:
         logger.error(f"Error getting profile: {e}")
         return jsonify({'error': 'Failed to get profile'}), 500
@@ -546,17 +1647,20 @@ def update_profile():
     try:
         initialize_session()
         data = request.get_json()
+        user_id = session['user_id']
+        profile = dict(get_user_profile(user_id))
+        profile['preferences'] = dict(profile.get('preferences', {}))
 
         if 'name' in data:
-            session['user_profile']['name'] = data['name'].strip()
+            profile['name'] = data['name'].strip()
 
         if 'preferences' in data:
-            session['user_profile']['preferences'].update(data['preferences'])
+            profile['preferences'].update(data['preferences'])
 
-        session.modified = True
+        save_user_profile(user_id, profile)
         return jsonify({
             'message': 'Profile updated successfully',
-            'profile': session['user_profile']
+            'profile': profile
         })
     except Exception as e:
         logger.error(f"Error updating profile: {e}")
@@ -573,20 +1677,28 @@ def search_chats():
             return jsonify({'chats': []})
 
         user_id = session.get('user_id')
-        user_chats = chat_sessions.get(user_id, {})
+        limit = min(request.args.get('limit', 20, type=int), 100)
+        terms = tokenize(query)
 
         matching_chats = []
-        for chat_id, chat_data in user_chats.items():
-            # Search in title and messages
-            if query in chat_data['title'].lower():
-                matching_chats.append(chat_data)
+        for chat_id, score, msg_no in search_index.search(user_id, query, limit=limit):
+            chat_data = chat_store.get_chat(user_id, chat_id, message_limit=0)
+            if not chat_data:
                 continue
 
-            # Search in message content
-            for msg in chat_data['messages']:
-                if query in msg['content'].lower():
-                    matching_chats.append(chat_data)
-                    break
+            message = chat_store.get_message(user_id, chat_id, msg_no)
+            snippet = make_snippet(message['content'] if message else chat_data['title'], terms)
+
+            matching_chats.append({
+                'id': chat_data['id'],
+                'title': chat_data['title'],
+                'preview': snippet,
+                'snippet': snippet,
+                'score': round(score, 3),
+                'created_at': chat_data['created_at'],
+                'updated_at': chat_data['updated_at'],
+                'message_count': chat_data['message_count']
+            })
 
         return jsonify({'chats': matching_chats})
     except Exception as e:
@@ -595,11 +1707,169 @@ def search_chats():
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
-    return jsonify({
+    """Health check endpoint; with ?ready=1 it returns 503 until the warm-up has finished.
+
+    readiness is "booted" once the app serves requests and "warm" once the
+    Groq clients and agents are built.
+    """
+    response = jsonify({
         'status': 'healthy',
-        'groq_client_initialized': groq_client is not None
+        'readiness': 'warm' if warm_up.warm else 'booted',
+        'worker_mode': WORKER_MODE,
+        'pid': os.getpid(),
+        'boot_seconds': BOOT_SECONDS,
+        'warm_up': warm_up.stats(),
+        'groq_client_initialized': clients.get('Groq client') is not None,
+        'agent_cache': agent_registry.stats(),
+        'circuit_breakers': circuit_breakers.stats(),
+        'admission': admission.stats(),
+        'router': model_router.stats(),
+        'response_cache': response_cache.stats(),
+        'bulk_rate_limit': bulk_runner.rate_limiter.stats(),
+        'background_tasks': background_tasks.stats(),
+        'chat_store': chat_store.stats(),
+        'chat_locks': chat_locks.stats(),
+        'context': context_builder.stats(),
+        'search_index': search_index.stats(),
+        'static_assets': static_assets.stats(),
+        'weather': weather_client.stats()
     })
+    if request.args.get('ready') and not warm_up.warm:
+        response.status_code = 503
+    return response
+
+@app.route('/memory', methods=['GET'])
+def memory_report():
+    """Bytes held by chat history: totals, the largest users (anonymized) and the current user's chats"""
+    try:
+        initialize_session()
+        top = max(1, min(request.args.get('top', 10, type=int), 100))
+        return jsonify(chat_store.memory_report(session['user_id'], top=top))
+    except Exception as e:
+        logger.error(f"Error building memory report: {e}")
+        return jsonify({'error': 'Failed to build memory report'}), 500
+
+def weather_metrics() -> list:
+    """Exposition lines for the weather client's cache counters and upstream latency"""
+    stats = weather_client.stats()
+    lines = []
+    for name in ('hits', 'misses', 'coalesced', 'errors'):
+        lines.append(f'# TYPE weather_cache_{name}_total counter')
+        lines.append(f'weather_cache_{name}_total {stats[name]}')
+    latency = stats['upstream_latency']
+    lines.append('# TYPE weather_upstream_duration_seconds histogram')
+    for bound, count in latency['buckets'].items():
+        lines.append(f'weather_upstream_duration_seconds_bucket{{le="{bound}"}} {count}')
+    lines.append(f'weather_upstream_duration_seconds_sum {latency["sum"]}')
+    lines.append(f'weather_upstream_duration_seconds_count {latency["count"]}')
+    return lines
+
+def circuit_breaker_metrics() -> list:
+    """Exposition lines for the per-model circuit breakers"""
+    lines = ['# TYPE groq_circuit_breaker_open gauge']
+    for model_name, stats in circuit_breakers.stats().items():
+        lines.append(f'groq_circuit_breaker_open{{model="{model_name}"}} {int(stats["state"] == "open")}')
+    lines.append('# TYPE groq_circuit_breaker_trips_total counter')
+    for model_name, stats in circuit_breakers.stats().items():
+        lines.append(f'groq_circuit_breaker_trips_total{{model="{model_name}"}} {stats["trips"]}')
+    return lines
+
+def admission_metrics() -> list:
+    """Exposition lines for admission control: queue depth, admitted and shed calls per model"""
+    stats = admission.stats()
+    lines = ['# TYPE groq_admission_queued gauge']
+    for model_name, model_stats in stats.items():
+        lines.append(f'groq_admission_queued{{model="{model_name}"}} {model_stats["queued"]}')
+    lines.append('# TYPE groq_admission_admitted_total counter')
+    for model_name, model_stats in stats.items():
+        lines.append(f'groq_admission_admitted_total{{model="{model_name}"}} {model_stats["admitted"]}')
+    lines.append('# TYPE groq_admission_rejected_total counter')
+    for model_name, model_stats in stats.items():
+        for reason, count in model_stats['rejected'].items():
+            lines.append(f'groq_admission_rejected_total{{model="{model_name}",reason="{reason}"}} {count}')
+    return lines
+
+def chat_lock_metrics() -> list:
+    """Exposition lines for per-chat turn locks: acquisitions, contention, timeouts and wait time"""
+    stats = chat_locks.stats()
+    lines = []
+    for name in ('acquired', 'contended', 'timeouts'):
+        lines.append(f'# TYPE chat_lock_{name}_total counter')
+        lines.append(f'chat_lock_{name}_total {stats[name]}')
+    lines.append('# TYPE chat_lock_wait_seconds_total counter')
+    lines.append(f'chat_lock_wait_seconds_total {stats["waited_seconds"]}')
+    return lines
+
+def chat_journal_metrics() -> list:
+    """Exposition lines for the write-behind journal: backlog, committed writes, batches and commit time"""
+    if chat_store.backend != 'journal':
+        return []
+    stats = chat_store.stats()['journal']
+    lines = ['# TYPE chat_journal_pending gauge', f'chat_journal_pending {stats["pending"]}']
+    for name in ('committed', 'batches', 'errors'):
+        lines.append(f'# TYPE chat_journal_{name}_total counter')
+        lines.append(f'chat_journal_{name}_total {stats[name]}')
+    lines.append('# TYPE chat_journal_commit_seconds_total counter')
+    lines.append(f'chat_journal_commit_seconds_total {stats["commit_seconds"]}')
+    return lines
+
+def background_task_metrics() -> list:
+    """Exposition lines for the background task queue: depth, tasks run inline and tasks finished by outcome"""
+    stats = background_tasks.stats()
+    lines = ['# TYPE background_queue_depth gauge', f'background_queue_depth {stats["depth"]}']
+    lines.append('# TYPE background_tasks_inline_total counter')
+    lines.append(f'background_tasks_inline_total {stats["inline"]}')
+    lines.append('# TYPE background_tasks_total counter')
+    for name, counts in stats['tasks'].items():
+        for status in ('completed', 'failed'):
+            lines.append(f'background_tasks_total{{task="{name}",status="{status}"}} {counts[status]}')
+    return lines
+
+def response_cache_metrics() -> list:
+    """Exposition lines for the response cache's hit ratio and counters"""
+    if not response_cache.enabled:
+        return []
+    stats = response_cache.stats()
+    lines = []
+    for name in ('hits', 'misses', 'stores'):
+        lines.append(f'# TYPE response_cache_{name}_total counter')
+        lines.append(f'response_cache_{name}_total {stats[name]}')
+    lines.append('# TYPE response_cache_hit_ratio gauge')
+    lines.append(f'response_cache_hit_ratio {stats["hit_ratio"]}')
+    return lines
+
+metrics.add_collector(weather_metrics)
+metrics.add_collector(response_cache_metrics)
+metrics.add_collector(circuit_breaker_metrics)
+metrics.add_collector(admission_metrics)
+metrics.add_collector(chat_lock_metrics)
+metrics.add_collector(chat_journal_metrics)
+metrics.add_collector(background_task_metrics)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text exposition of request latencies, stage spans and token usage"""
+    if not metrics.enabled:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def create_app():
+    """Application factory for WSGI/ASGI servers, e.g. gunicorn 'app:create_app()'.
+
+    WARM_UP=background (the default) builds the Groq clients and agents on a
+    background thread so the worker serves requests right away; eager builds
+    them before returning; off leaves them to the first requests that need them.
+    """
+    mode = os.getenv('WARM_UP', 'background').lower()
+    if mode == 'eager':
+        warm_up.run()
+    elif mode == 'background':
+        warm_up.start()
+    elif mode != 'off':
+        raise ValueError(f"Unknown WARM_UP mode: {mode}")
+    return app
+
+BOOT_SECONDS = round(time.perf_counter() - IMPORT_STARTED, 3)
 
 if __name__ == '__main__':
     # Check if required environment variables are set
@@ -612,4 +1882,4 @@ if __name__ == '__main__':
     logger.info("Starting Flask application...")
     debug_mode = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
     logger.info(f"Debug mode: {debug_mode}")
-    app.run(debug=debug_mode, host='0.0.0.0', port=5000)
+    create_app().run(debug=debug_mode, host='0.0.0.0', port=5000)
@@ -0,0 +1,177 @@
+"""ASGI entry point for running the chat app on an asyncio server.
+
+POST /chat is served natively on the event loop (agent_executor.ainvoke, the
+async Groq client and an async HTTP client for the weather tool), so a slow
+LLM call no longer pins a worker thread. The blocking parts of that path,
+session, chat store and response cache I/O, the summarizer and cold agent
+builds, run on worker threads, so a slow SQLite write does not hold up the
+other requests on the loop. Every other route, including
+streaming /chat requests, is delegated to the regular Flask WSGI app on a
+worker thread.
+
+Run with any ASGI server, e.g.:
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+import io
+import json
+import sys
+from urllib.parse import unquote
+
+import anyio
+from werkzeug.test import run_wsgi_app
+
+from app import achat, create_app, logger
+
+app = create_app()
+
+# Body chunks of a WSGI response buffered between the worker thread and the event loop
+WSGI_BUFFER_CHUNKS = 16
+
+
+def build_environ(scope, body: bytes) -> dict:
+    """Build a WSGI environ from an ASGI HTTP scope"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': unquote(scope['path']),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = f'HTTP_{name}'
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def read_body(receive) -> bytes:
+    """Read the full request body from the ASGI receive channel"""
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+
+def is_async_chat_request(scope, body: bytes) -> bool:
+    """Whether this request can be served by the native async /chat path"""
+    if scope['method'] != 'POST' or scope['path'] != '/chat':
+        return False
+    try:
+        return not json.loads(body or b'{}').get('stream', False)
+    except (ValueError, AttributeError):
+        return False
+
+
+async def dispatch_async_chat(environ: dict):
+    """Run achat() inside a Flask request context and return a Flask response"""
+    ctx = app.request_context(environ)
+    # The session store may be SQLite, so the session is loaded and saved on a worker thread
+    ctx.session = await anyio.to_thread.run_sync(app.session_interface.open_session, app, ctx.request)
+    with ctx:
+        try:
+            rv = app.preprocess_request()
+            if rv is None:
+                rv = await achat()
+            response = app.make_response(rv)
+            return await anyio.to_thread.run_sync(app.process_response, response)
+        except Exception as e:
+            logger.error(f"Unhandled error in async chat dispatch: {e}")
+            return app.make_response(app.handle_exception(e))
+
+
+async def send_flask_response(send, response):
+    """Send a buffered Flask response over ASGI"""
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in response.headers.items()],
+    })
+    await send({'type': 'http.response.body', 'body': response.get_data()})
+
+
+def run_wsgi_app_into(send_stream, environ: dict):
+    """Worker thread: run the Flask WSGI app and pass its status and headers, then each body chunk, to send_stream.
+
+    The app is called and its whole body iterated on this one thread, in one
+    context, so a generator that pushed a request context (stream_with_context)
+    still finds it for every chunk and when it is closed.
+    """
+    try:
+        app_iter, status, headers = run_wsgi_app(app, environ, buffered=False)
+        try:
+            anyio.from_thread.run(send_stream.send, (status, headers))
+            for chunk in app_iter:
+                if chunk:
+                    anyio.from_thread.run(send_stream.send, chunk)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+    finally:
+        anyio.from_thread.run_sync(send_stream.close)
+
+
+async def send_wsgi_response(send, environ: dict):
+    """Run the Flask WSGI app on a worker thread and stream its output over ASGI"""
+    # A few chunks of buffer; a slow client holds back the worker thread instead of filling memory
+    send_stream, receive_stream = anyio.create_memory_object_stream(WSGI_BUFFER_CHUNKS)
+    async with anyio.create_task_group() as task_group:
+        task_group.start_soon(anyio.to_thread.run_sync, run_wsgi_app_into, send_stream, environ)
+        # Closing the receiving end on the way out (e.g. the client went away) stops the worker thread
+        async with receive_stream:
+            try:
+                status, headers = await receive_stream.receive()
+            except anyio.EndOfStream:
+                return  # The app raised before responding; the task group re-raises its error
+            await send({
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers.items()],
+            })
+            async for chunk in receive_stream:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+
+
+async def application(scope, receive, send):
+    """ASGI application"""
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    if scope['type'] != 'http':
+        return
+
+    body = await read_body(receive)
+    environ = build_environ(scope, body)
+
+    if is_async_chat_request(scope, body):
+        response = await dispatch_async_chat(environ)
+        await send_flask_response(send, response)
+    else:
+        await send_wsgi_response(send, environ)
@@ -0,0 +1,116 @@
+"""Concurrency vs latency benchmark: sync Flask (WSGI) vs async (ASGI) /chat.
+
+Starts the local fake LLM with a fixed per-call latency, then at each
+concurrency level sends one /chat message per virtual user, all at once:
+
+- sync: the Flask app served by a fixed pool of worker threads, like a
+  threaded WSGI server (--workers)
+- async: asgi.application on a single event loop
+
+    python benchmarks/bench_async.py --latency 0.5 --levels 1,10,50,100,200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_llm import start_server
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def summarize(mode, concurrency, latencies, elapsed):
+    return {
+        'mode': mode,
+        'concurrency': concurrency,
+        'p50_ms': round(statistics.median(latencies) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'wall_s': round(elapsed, 2),
+    }
+
+
+def run_sync(app, concurrency, workers):
+    clients = []
+    for _ in range(concurrency):
+        client = app.test_client()
+        client.get('/')
+        clients.append(client)
+
+    # Latency is measured from the moment the batch arrives, so time spent
+    # waiting for a free worker thread is included
+    start = time.perf_counter()
+
+    def send(client):
+        response = client.post('/chat', json={'message': 'hello', 'model': 'llama3-8b-8192'})
+        assert response.status_code == 200, response.data
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        latencies = list(pool.map(send, clients))
+    return summarize(f'sync ({workers} threads)', concurrency, latencies, time.perf_counter() - start)
+
+
+async def run_async(application, levels):
+    import httpx
+
+    results = []
+    for concurrency in levels:
+        clients = []
+        for _ in range(concurrency):
+            client = httpx.AsyncClient(transport=httpx.ASGITransport(app=application), base_url='http://bench')
+            await client.get('/')
+            clients.append(client)
+
+        async def send(client):
+            start = time.perf_counter()
+            response = await client.post('/chat', json={'message': 'hello', 'model': 'llama3-8b-8192'})
+            assert response.status_code == 200, response.text
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(send(client) for client in clients))
+        results.append(summarize('async', concurrency, latencies, time.perf_counter() - start))
+        for client in clients:
+            await client.aclose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sync vs async /chat latency under concurrency')
+    parser.add_argument('--latency', type=float, default=0.5, help='fake LLM latency per call in seconds')
+    parser.add_argument('--levels', default='1,10,50,100,200', help='comma-separated concurrency levels')
+    parser.add_argument('--workers', type=int, default=8, help='thread count for the sync server')
+    args = parser.parse_args()
+    levels = [int(level) for level in args.levels.split(',')]
+
+    server = start_server(latency=args.latency)
+    os.environ['GROQ_API_KEY'] = 'fake-key'
+    os.environ['GROQ_BASE_URL'] = f'http://127.0.0.1:{server.server_address[1]}'
+    os.environ.setdefault('GROQ_RPM', '0')
+    os.environ.setdefault('GROQ_TPM', '0')
+
+    import logging
+    logging.disable(logging.INFO)
+    from app import create_app
+    app = create_app()
+    from asgi import application
+
+    results = [run_sync(app, concurrency, args.workers) for concurrency in levels]
+    results += asyncio.run(run_async(application, levels))
+
+    print(f"{'mode':<20}{'concurrency':>12}{'p50 ms':>10}{'p99 ms':>10}{'wall s':>9}")
+    for row in results:
+        print(f"{row['mode']:<20}{row['concurrency']:>12}{row['p50_ms']:>10}{row['p99_ms']:>10}{row['wall_s']:>9}")
+
+
+if __name__ == '__main__':
+    main()
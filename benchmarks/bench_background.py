@@ -0,0 +1,145 @@
+"""Post-response work benchmark: /chat latency with BACKGROUND_WORKERS=0 (inline) vs background workers.
+
+For each worker count, a child process imports the app against the fake Groq
+server and runs --users sessions at once through Flask's test client. Each
+session sends --turns messages, pausing --think seconds between them like a
+user reading the reply. A small CONTEXT_TOKEN_BUDGET makes the rolling
+summary fold every few turns, and each fold is a completion on the fake
+server. CHAT_STORE=sqlite and RESPONSE_CACHE=sqlite give the titles and cache
+writes a real cost.
+
+It reports the mean and p50/p90/p99 /chat latency, how many summary folds ran inside a
+request and how many ran ahead of time on a background task, and the
+queue's peak depth and inline runs. Once the queue has drained, it checks
+that every chat got its title and that search finds each chat's last
+message. Exits with status 1 if a check fails.
+
+    python benchmarks/bench_background.py --workers 0,2 --users 8 --turns 12 --json background.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def measure(args):
+    """Child process: run the sessions and return latencies, fold counts and problems"""
+    import logging
+    logging.disable(logging.ERROR)
+    import fake_llm
+
+    server = fake_llm.start_server(0, latency=args.latency)
+    os.environ['GROQ_BASE_URL'] = f'http://127.0.0.1:{server.server_address[1]}'
+    import app
+
+    latencies = []
+    sessions = []
+    lock = threading.Lock()
+
+    def session(user):
+        client = app.app.test_client()
+        client.get('/')
+        timings = []
+        for turn in range(args.turns):
+            message = f'user{user} turn{turn} ' + ' '.join(f'word{n}' for n in range(args.words))
+            start = time.perf_counter()
+            response = client.post('/chat', json={'message': message})
+            timings.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise RuntimeError(f'/chat returned {response.status_code}: {response.get_data(as_text=True)}')
+            time.sleep(args.think)
+        with lock:
+            latencies.extend(timings)
+            sessions.append((user, client, message))
+
+    threads = [threading.Thread(target=session, args=(user,)) for user in range(args.users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    app.background_tasks.drain(30)
+
+    problems = []
+    for user, client, last_message in sessions:
+        chats = client.get('/chats').get_json()['chats']
+        if not chats or chats[0]['title'].startswith('New Chat'):
+            problems.append(f'user{user}: chat was not titled')
+        found = client.get('/chats/search', query_string={'q': f'user{user} turn{args.turns - 1}'}).get_json()['chats']
+        if not found:
+            problems.append(f'user{user}: search does not find the last message')
+
+    latencies.sort()
+    context = app.context_builder.stats()
+    tasks = app.background_tasks.stats()
+    return {
+        'turns': len(latencies),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 1),
+        'p90_ms': round(latencies[int(len(latencies) * 0.9) - 1] * 1000, 1),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 1),
+        'folds_in_request': context['folds'],
+        'prefolds': context['prefolds'],
+        'max_depth': tasks['max_depth'],
+        'inline': tasks['inline'],
+        'task_seconds': {name: counts['seconds'] for name, counts in tasks['tasks'].items()},
+        'problems': problems
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='/chat latency with post-response work inline vs in the background')
+    parser.add_argument('--workers', default='0,2', help='comma-separated BACKGROUND_WORKERS values')
+    parser.add_argument('--users', type=int, default=8, help='sessions chatting at once')
+    parser.add_argument('--turns', type=int, default=12, help='messages per session')
+    parser.add_argument('--words', type=int, default=40, help='words per message')
+    parser.add_argument('--think', type=float, default=0.3, help='seconds between a reply and the next message')
+    parser.add_argument('--latency', type=float, default=0.2, help='fake Groq latency per completion')
+    parser.add_argument('--budget', type=int, default=600, help='CONTEXT_TOKEN_BUDGET')
+    parser.add_argument('--json', dest='json_path', help='write results to this file')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args)))
+        return
+
+    results = []
+    for workers in args.workers.split(','):
+        data_dir = tempfile.mkdtemp(prefix='bench_background_')
+        env = dict(os.environ, BACKGROUND_WORKERS=workers, CONTEXT_TOKEN_BUDGET=str(args.budget),
+                   CHAT_STORE='sqlite', CHAT_STORE_PATH=os.path.join(data_dir, 'chats.db'), RESPONSE_CACHE='sqlite',
+                   RESPONSE_CACHE_PATH=os.path.join(data_dir, 'chats.db'),
+                   GROQ_API_KEY='fake-key', GROQ_RPM='0', GROQ_TPM='0', WARM_UP='eager')
+        command = [sys.executable, os.path.abspath(__file__), '--child', '--users', str(args.users),
+                   '--turns', str(args.turns), '--words', str(args.words), '--think', str(args.think),
+                   '--latency', str(args.latency)]
+        output = subprocess.run(command, env=env, capture_output=True, text=True, check=True).stdout
+        results.append(dict(json.loads(output.splitlines()[-1]), workers=int(workers)))
+
+    print(f"{'workers':<9}{'turns':>7}{'mean ms':>9}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'folds in request':>18}{'prefolds':>10}"
+          f"{'max depth':>11}{'inline':>8}")
+    for row in results:
+        print(f"{row['workers']:<9}{row['turns']:>7}{row['mean_ms']:>9}{row['p50_ms']:>9}{row['p90_ms']:>9}{row['p99_ms']:>9}"
+              f"{row['folds_in_request']:>18}{row['prefolds']:>10}{row['max_depth']:>11}{row['inline']:>8}")
+
+    problems = [f"workers={row['workers']}: {problem}" for row in results for problem in row['problems']]
+    for problem in problems[:5]:
+        print(f'    {problem}')
+    if args.json_path:
+        with open(args.json_path, 'w') as output:
+            json.dump({'python': platform.python_version(), 'latency': args.latency, 'think': args.think,
+                       'budget': args.budget, 'results': results}, output, indent=2)
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""Write-behind journal benchmark: message append latency, crash recovery and streaming export.
+
+Runs directly against the chat stores, without the web app. There are three
+parts:
+
+- appends: --threads threads each append --messages messages to their own
+  chat. This runs once on CHAT_STORE=sqlite, where each append is a
+  transaction, and once on CHAT_STORE=journal, where an append goes to memory
+  and the journal file and a background thread group-commits to SQLite. It
+  reports append latency p50/p99, appends/sec and, for the journal, the time
+  until SQLite has caught up and the average commit batch.
+- crash: a child process journals --crash-writes writes with commits held
+  back, then exits without flushing, like a killed worker. The parent reopens
+  the store and checks that every write was recovered into SQLite.
+- export: writes --export-chats chats of --export-messages messages, streams
+  them through the NDJSON export into a fresh store with the import, and
+  compares the two. It reports the peak Python memory of the export next to
+  the size of the history it streamed.
+
+Exits with status 1 if a check fails.
+
+    python benchmarks/bench_journal.py --threads 8 --messages 500 --json journal.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_export import export_chats, import_chats
+from chat_store import InMemoryChatStore, SQLiteChatStore
+from write_behind import WriteBehindChatStore
+
+TIMESTAMP = '2024-01-01T00:00:00'
+
+
+class NullIndex:
+    """Stand-in for the search index, which the import keeps current"""
+
+    def add_chat(self, user_id, chat_id, title):
+        pass
+
+    def add_message(self, user_id, chat_id, content):
+        pass
+
+
+def open_store(backend, path, **options):
+    if backend == 'sqlite':
+        return SQLiteChatStore(path)
+    return WriteBehindChatStore(SQLiteChatStore(path), InMemoryChatStore(), path + '.journal', **options)
+
+
+def message(index, words=30):
+    role = 'user' if index % 2 == 0 else 'assistant'
+    return {'role': role, 'content': ' '.join(f'word{index}x{n}' for n in range(words)), 'timestamp': TIMESTAMP}
+
+
+def run_appends(backend, args, data_dir):
+    store = open_store(backend, os.path.join(data_dir, f'{backend}.db'))
+    latencies = []
+    lock = threading.Lock()
+
+    def append(thread):
+        user_id, chat_id = f'user-{thread}', f'chat-{thread}'
+        store.create_chat(user_id, chat_id, f'Chat {thread}', TIMESTAMP)
+        timings = []
+        for index in range(args.messages):
+            start = time.perf_counter()
+            store.append_message(user_id, chat_id, message(index))
+            timings.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(timings)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=append, args=(thread,)) for thread in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+
+    result = {'backend': backend, 'appends': len(latencies)}
+    if backend == 'journal':
+        store.flush()
+        result['durable_seconds'] = round(time.perf_counter() - start, 3)
+        result['avg_batch'] = store.journal.stats()['avg_batch']
+        store.close()
+    latencies.sort()
+    result.update(
+        p50_us=round(statistics.median(latencies) * 1e6, 1),
+        p99_us=round(latencies[int(len(latencies) * 0.99) - 1] * 1e6, 1),
+        appends_per_sec=round(len(latencies) / seconds)
+    )
+
+    durable = SQLiteChatStore(os.path.join(data_dir, f'{backend}.db'))
+    stored = sum(chat['message_count'] for thread in range(args.threads) for chat in durable.list_chats(f'user-{thread}'))
+    result['problems'] = [] if stored == len(latencies) else [f'{backend}: {stored} of {len(latencies)} appends in SQLite']
+    return result
+
+
+def crash_child(path, writes):
+    """Child process: journal writes that are never committed, then die without flushing"""
+    store = open_store('journal', path, batch_size=writes + 1, commit_interval=3600)
+    store.create_chat('crash-user', 'crash-chat', 'Crash', TIMESTAMP)
+    for index in range(writes - 1):
+        store.append_message('crash-user', 'crash-chat', message(index, words=5))
+    os._exit(0)
+
+
+def run_crash(args, data_dir):
+    path = os.path.join(data_dir, 'crash.db')
+    subprocess.run([sys.executable, os.path.abspath(__file__), '--crash-child', path, str(args.crash_writes)],
+                   check=True)
+    committed_before = SQLiteChatStore(path).journal_checkpoint()
+
+    start = time.perf_counter()
+    store = open_store('journal', path)
+    recovery_ms = (time.perf_counter() - start) * 1000
+    recovered = store.journal.stats()['recovered']
+    store.close()
+
+    chat = SQLiteChatStore(path).get_chat('crash-user', 'crash-chat')
+    problems = []
+    if chat is None or chat['message_count'] != args.crash_writes - 1:
+        problems.append(f"crash: {chat['message_count'] if chat else 'no chat'} of {args.crash_writes - 1} "
+                        f"messages recovered")
+    return {'writes': args.crash_writes, 'committed_before_crash': committed_before, 'recovered': recovered,
+            'recovery_ms': round(recovery_ms, 1), 'problems': problems}
+
+
+def run_export(args, data_dir):
+    source = InMemoryChatStore()
+    for number in range(args.export_chats):
+        source.create_chat('export-user', f'chat-{number}', f'Chat {number}', TIMESTAMP)
+        for index in range(args.export_messages):
+            source.append_message('export-user', f'chat-{number}', message(index))
+
+    export_path = os.path.join(data_dir, 'export.ndjson')
+    with open(export_path, 'w', encoding='utf-8') as exported:
+        tracemalloc.start()
+        start = time.perf_counter()
+        for line in export_chats(source, 'export-user'):
+            exported.write(line)
+        export_seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    size = os.path.getsize(export_path)
+
+    target = open_store('journal', os.path.join(data_dir, 'import.db'))
+    start = time.perf_counter()
+    with open(export_path, 'rb') as exported:
+        imported = import_chats(exported, target, NullIndex(), 'import-user')
+    import_seconds = time.perf_counter() - start
+    target.flush()
+
+    problems = []
+    # Imported chats get new ids, so match them up by title
+    copies = {chat['title']: chat for chat in target.list_chats('import-user')}
+    for original in source.list_chats('export-user'):
+        copy = copies.get(original['title'])
+        if copy is None or (original['updated_at'], original['message_count'], original['preview']) != \
+                (copy['updated_at'], copy['message_count'], copy['preview']):
+            problems.append(f"export: {original['title']} differs after import")
+    if imported != {'chats': args.export_chats, 'messages': args.export_chats * args.export_messages}:
+        problems.append(f'export: imported {imported}')
+    target.close()
+    return {'chats': args.export_chats, 'messages': args.export_chats * args.export_messages,
+            'export_bytes': size, 'export_peak_bytes': peak, 'export_seconds': round(export_seconds, 3),
+            'import_seconds': round(import_seconds, 3), 'problems': problems}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write-behind journal: append latency, crash recovery, export')
+    parser.add_argument('--threads', type=int, default=8, help='threads appending at once, one chat each')
+    parser.add_argument('--messages', type=int, default=500, help='messages appended per thread')
+    parser.add_argument('--crash-writes', type=int, default=2000, help='writes journaled before the simulated crash')
+    parser.add_argument('--export-chats', type=int, default=200)
+    parser.add_argument('--export-messages', type=int, default=100, help='messages per exported chat')
+    parser.add_argument('--json', dest='json_path', help='write results to this file')
+    parser.add_argument('--crash-child', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.crash_child:
+        crash_child(args.crash_child[0], int(args.crash_child[1]))
+        return
+
+    data_dir = tempfile.mkdtemp(prefix='bench_journal_')
+    appends = [run_appends(backend, args, data_dir) for backend in ('sqlite', 'journal')]
+    crash = run_crash(args, data_dir)
+    export = run_export(args, data_dir)
+
+    print(f"{'backend':<10}{'appends':>9}{'p50 us':>10}{'p99 us':>10}{'appends/s':>11}{'durable s':>11}{'avg batch':>11}")
+    for row in appends:
+        print(f"{row['backend']:<10}{row['appends']:>9}{row['p50_us']:>10}{row['p99_us']:>10}"
+              f"{row['appends_per_sec']:>11}{row.get('durable_seconds', '-'):>11}{row.get('avg_batch', '-'):>11}")
+    print(f"crash: {crash['writes']} writes journaled, {crash['committed_before_crash']} committed before the "
+          f"crash, {crash['recovered']} recovered in {crash['recovery_ms']} ms")
+    print(f"export: {export['chats']} chats, {export['messages']} messages, {export['export_bytes']} bytes in "
+          f"{export['export_seconds']}s (peak memory {export['export_peak_bytes']} bytes); "
+          f"import {export['import_seconds']}s")
+
+    problems = [problem for row in appends for problem in row['problems']] + crash['problems'] + export['problems']
+    for problem in problems[:5]:
+        print(f'    {problem}')
+    if args.json_path:
+        with open(args.json_path, 'w') as output:
+            json.dump({'python': platform.python_version(), 'appends': appends, 'crash': crash, 'export': export},
+                      output, indent=2)
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
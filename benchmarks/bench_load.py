@@ -0,0 +1,291 @@
+"""Mixed-workload load test of the app against the local fake Groq/OpenWeather server.
+
+Runs app.py in a child process behind a threaded WSGI server. Virtual users
+with their own cookie jars then drive the app over HTTP at a fixed
+concurrency. Each stage first grows the total number of chats to a target,
+then runs a timed mix of requests:
+
+- POST /chat (a share of the messages ask about the weather)
+- GET /chats
+- GET /chats/search
+- POST /chats/<id>/switch
+- DELETE /chats/<id>/delete, followed by POST /chats/new
+
+For every stage it reports requests/sec and p50/p95/p99 latency per
+operation, plus the RSS of the app process. --json writes the results in a
+machine-readable form, and --baseline prints the change against an earlier
+result file.
+
+    python benchmarks/bench_load.py --chats 100,1000,5000 --concurrency 32 --duration 20 --json load.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_llm import start_server
+
+WORDS = ['python', 'flask', 'weather', 'travel', 'recipe', 'budget', 'garden', 'music', 'physics', 'history',
+         'football', 'coffee', 'database', 'holiday', 'painting', 'running', 'startup', 'camera', 'novel', 'sql']
+
+# Relative weight of each operation in the timed mix
+MIX = {'chat': 40, 'list': 20, 'search': 20, 'switch': 15, 'delete': 5}
+
+WEATHER_SHARE = 0.1
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def read_rss_kb(pid):
+    """Resident set size of a process in kB, or None where /proc is unavailable"""
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def serve(port):
+    """Child process: serve app.py on a threaded WSGI server"""
+    import logging
+    logging.disable(logging.INFO)
+    from werkzeug.serving import make_server
+    from app import create_app
+    app = create_app()
+
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    print('ready', flush=True)
+    server.serve_forever()
+
+
+def start_app(port, env):
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve', '--port', str(port)],
+        env=env, stdout=subprocess.PIPE, text=True
+    )
+    if process.stdout.readline().strip() != 'ready':
+        process.kill()
+        raise RuntimeError('app process failed to start')
+    return process
+
+
+class VirtualUser:
+    """One browser session: a cookie jar plus the ids of its chats"""
+
+    def __init__(self, base_url, rng):
+        self.client = httpx.Client(base_url=base_url, timeout=120.0)
+        self.rng = rng
+        self.chat_ids = []
+        self.lock = threading.Lock()
+        response = self.client.get('/chats')
+        self.chat_ids = [chat['id'] for chat in response.json()['chats']]
+
+    def sentence(self):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(8))
+
+    def new_chat(self):
+        response = self.client.post('/chats/new', json={})
+        with self.lock:
+            self.chat_ids.append(response.json()['chat']['id'])
+        return response
+
+    def send_message(self):
+        if self.rng.random() < WEATHER_SHARE:
+            message = f'What is the weather in {self.rng.choice(["London", "Paris", "Tokyo", "Lima"])}?'
+        else:
+            message = self.sentence()
+        return self.client.post('/chat', json={'message': message, 'model': 'llama3-8b-8192'})
+
+    def run(self, operation):
+        """Perform one operation and return its response"""
+        if operation == 'chat':
+            return self.send_message()
+        if operation == 'list':
+            return self.client.get('/chats')
+        if operation == 'search':
+            return self.client.get('/chats/search', params={'q': self.rng.choice(WORDS)[:4]})
+        with self.lock:
+            chat_id = self.rng.choice(self.chat_ids) if self.chat_ids else None
+        if chat_id is None:
+            return self.new_chat()
+        if operation == 'switch':
+            return self.client.post(f'/chats/{chat_id}/switch')
+        response = self.client.delete(f'/chats/{chat_id}/delete')
+        with self.lock:
+            if chat_id in self.chat_ids:
+                self.chat_ids.remove(chat_id)
+        self.new_chat()
+        return response
+
+
+def grow(users, target, concurrency):
+    """Create chats with one exchange each until the users own target chats in total"""
+    missing = target - sum(len(user.chat_ids) for user in users)
+    if missing <= 0:
+        return
+
+    def seed(index):
+        user = users[index % len(users)]
+        user.new_chat()
+        user.send_message()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(seed, range(missing)))
+
+
+def run_stage(users, concurrency, duration, rng):
+    """Timed mixed workload; returns {operation: [latencies]} and {operation: errors}"""
+    operations = list(MIX)
+    weights = [MIX[operation] for operation in operations]
+    latencies = {operation: [] for operation in operations}
+    errors = {operation: 0 for operation in operations}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(index):
+        user = users[index % len(users)]
+        local_rng = random.Random(rng.random())
+        while time.perf_counter() < deadline:
+            operation = local_rng.choices(operations, weights)[0]
+            start = time.perf_counter()
+            try:
+                ok = user.run(operation).status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies[operation].append(elapsed)
+                if not ok:
+                    errors[operation] += 1
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    return latencies, errors
+
+
+def summarize(latencies, errors, duration):
+    rows = {}
+    everything = []
+    for operation, values in latencies.items():
+        everything.extend(values)
+        rows[operation] = summarize_values(values, errors[operation], duration)
+    rows['all'] = summarize_values(everything, sum(errors.values()), duration)
+    return rows
+
+
+def summarize_values(values, errors, duration):
+    if not values:
+        return {'requests': 0, 'errors': errors, 'rps': 0.0, 'p50_ms': None, 'p95_ms': None, 'p99_ms': None}
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'rps': round(len(values) / duration, 1),
+        'p50_ms': round(percentile(values, 50) * 1000, 1),
+        'p95_ms': round(percentile(values, 95) * 1000, 1),
+        'p99_ms': round(percentile(values, 99) * 1000, 1),
+    }
+
+
+def compare(results, baseline):
+    """Print rps and p99 changes against an earlier --json result, stage by stage"""
+    print(f"\n{'stage':>7} {'op':<8}{'rps':>16}{'p99 ms':>20}")
+    for stage, old_stage in zip(results['stages'], baseline['stages']):
+        for operation, row in stage['operations'].items():
+            old = old_stage['operations'].get(operation)
+            if not old or not old['rps'] or not old['p99_ms'] or not row['p99_ms']:
+                continue
+            rps_change = (row['rps'] - old['rps']) / old['rps'] * 100
+            p99_change = (row['p99_ms'] - old['p99_ms']) / old['p99_ms'] * 100
+            print(f"{stage['chats']:>7} {operation:<8}{old['rps']:>7} {rps_change:>+7.1f}%"
+                  f"{old['p99_ms']:>11} {p99_change:>+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mixed-workload load test against a local fake Groq/OpenWeather')
+    parser.add_argument('--chats', default='100,1000', help='comma-separated total chat counts, one stage each')
+    parser.add_argument('--users', type=int, default=50, help='number of virtual users (sessions)')
+    parser.add_argument('--concurrency', type=int, default=32, help='concurrent requests in flight')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds of timed load per stage')
+    parser.add_argument('--latency', type=float, default=0.05, help='fake LLM latency per call in seconds')
+    parser.add_argument('--weather-latency', type=float, default=0.02, help='fake weather latency in seconds')
+    parser.add_argument('--port', type=int, default=5055, help='port of the app process')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', dest='json_path', help='write results to this file')
+    parser.add_argument('--baseline', help='earlier --json result to compare against')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port)
+        return
+
+    fake = start_server(latency=args.latency, weather_latency=args.weather_latency)
+    fake_url = f'http://127.0.0.1:{fake.server_address[1]}'
+    env = dict(os.environ, GROQ_API_KEY='fake-key', GROQ_BASE_URL=fake_url,
+               OPENWEATHER_API_KEY='fake-key', OPENWEATHER_BASE_URL=fake_url)
+    # Measure the app itself, not Groq's rate limits (set GROQ_RPM / GROQ_TPM to include admission control)
+    env.setdefault('GROQ_RPM', '0')
+    env.setdefault('GROQ_TPM', '0')
+    process = start_app(args.port, env)
+
+    rng = random.Random(args.seed)
+    results = {
+        'config': {key: value for key, value in vars(args).items() if key not in ('serve', 'json_path', 'baseline')},
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'chat_store': os.getenv('CHAT_STORE', 'memory'),
+            'session_store': os.getenv('SESSION_STORE', 'memory'),
+        },
+        'stages': [],
+    }
+    try:
+        users = [VirtualUser(f'http://127.0.0.1:{args.port}', random.Random(rng.random())) for _ in range(args.users)]
+        for target in [int(count) for count in args.chats.split(',')]:
+            grow(users, target, args.concurrency)
+            latencies, errors = run_stage(users, args.concurrency, args.duration, rng)
+            results['stages'].append({
+                'chats': sum(len(user.chat_ids) for user in users),
+                'rss_kb': read_rss_kb(process.pid),
+                'operations': summarize(latencies, errors, args.duration),
+            })
+    finally:
+        process.terminate()
+        process.wait()
+
+    print(f"{'chats':>7} {'op':<8}{'requests':>9}{'errors':>8}{'rps':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'rss MB':>9}")
+    for stage in results['stages']:
+        rss = f"{stage['rss_kb'] / 1024:.1f}" if stage['rss_kb'] else '-'
+        for operation, row in stage['operations'].items():
+            print(f"{stage['chats']:>7} {operation:<8}{row['requests']:>9}{row['errors']:>8}{row['rps']:>8}"
+                  f"{row['p50_ms'] or '-':>9}{row['p95_ms'] or '-':>9}{row['p99_ms'] or '-':>9}{rss:>9}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as output:
+            json.dump(results, output, indent=2)
+        print(f"Results written to {args.json_path}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            compare(results, json.load(baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Prompt assembly benchmark: per-chat prefix cache on vs off.
+
+Replays a long conversation through ContextBuilder twice, once with the
+append-only prompt prefix cache and once rebuilding the window every turn.
+The summarizer is a local stand-in, so no API is called. For each mode it
+reports, per turn:
+
+- the time spent assembling the context window
+- the bytes and estimated tokens of history sent
+- how much of that repeats the previous turn's prompt, both as reported by
+  the builder and as measured on the serialized request body (the part an
+  upstream prefix cache could reuse)
+
+Both modes must produce identical prompts; the benchmark exits with status 1
+if they differ.
+
+    python benchmarks/bench_prompt.py --turns 300 --words 40
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_store import InMemoryChatStore
+from context_builder import ContextBuilder
+
+USER_ID = 'bench-user'
+CHAT_ID = 'bench-chat'
+MODEL = 'llama3-8b-8192'
+SYSTEM_PROMPT = 'You are a helpful AI assistant. Provide clear, concise, and helpful responses.'
+
+
+def summarize(previous_summary, messages, model_name):
+    """Deterministic stand-in for the LLM summarizer"""
+    excerpt = ' '.join(message['content'][:40] for message in messages)
+    return f'{previous_summary} {excerpt}'.strip()[-1200:]
+
+
+def request_body(window):
+    """JSON body of a direct completion for this window, as the SDK would send it"""
+    system = SYSTEM_PROMPT
+    if window.summary:
+        system += f'\n\nSummary of the earlier conversation: {window.summary}'
+    messages = [{'role': 'system', 'content': system}] + window.messages
+    return json.dumps({'model': MODEL, 'messages': messages}, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def common_prefix(a: bytes, b: bytes) -> int:
+    return len(os.path.commonprefix([a, b]))
+
+
+def run(prefix_cache, turns, words, budget, seed):
+    rng = random.Random(seed)
+    vocabulary = [''.join(rng.choice('abcdefghij') for _ in range(rng.randint(3, 9))) for _ in range(2000)]
+    store = InMemoryChatStore()
+    store.create_chat(USER_ID, CHAT_ID, 'Bench', '2024-01-01T00:00:00')
+    builder = ContextBuilder(summarize, budget=budget, prefix_cache=prefix_cache)
+
+    totals = {'build_us': 0.0, 'bytes': 0, 'prefix_bytes': 0, 'tokens': 0, 'prefix_tokens': 0,
+              'body_bytes': 0, 'body_prefix_bytes': 0}
+    prompts = []
+    previous_body = b''
+    for turn in range(turns):
+        content = ' '.join(rng.choice(vocabulary) for _ in range(rng.randint(words // 2, words * 3 // 2)))
+        store.append_message(USER_ID, CHAT_ID, {'role': 'user', 'content': content,
+                                                'timestamp': '2024-01-01T00:00:00'})
+        chat = store.get_chat(USER_ID, CHAT_ID, message_limit=20)
+
+        start = time.perf_counter()
+        window = builder.build(
+            chat, MODEL, lambda before, limit: store.get_messages(USER_ID, CHAT_ID, before=before, limit=limit) or []
+        )
+        totals['build_us'] += (time.perf_counter() - start) * 1e6
+
+        body = request_body(window)
+        totals['bytes'] += window.bytes
+        totals['prefix_bytes'] += window.prefix_bytes
+        totals['tokens'] += window.tokens
+        totals['prefix_tokens'] += window.prefix_tokens
+        totals['body_bytes'] += len(body)
+        totals['body_prefix_bytes'] += common_prefix(previous_body, body)
+        previous_body = body
+        prompts.append(body)
+
+        reply = ' '.join(rng.choice(vocabulary) for _ in range(words))
+        store.append_message(USER_ID, CHAT_ID, {'role': 'assistant', 'content': reply,
+                                                'timestamp': '2024-01-01T00:00:00', 'model': MODEL})
+    return {key: value / turns for key, value in totals.items()}, prompts, builder.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prompt assembly with and without the per-chat prefix cache')
+    parser.add_argument('--turns', type=int, default=300, help='conversation turns to replay')
+    parser.add_argument('--words', type=int, default=40, help='average words per message')
+    parser.add_argument('--budget', type=int, default=3000, help='context token budget')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    results = {}
+    prompts = {}
+    for mode, enabled in (('rebuild', False), ('prefix cache', True)):
+        results[mode], prompts[mode], stats = run(enabled, args.turns, args.words, args.budget, args.seed)
+        results[mode]['hits'] = stats['prefix_hits']
+
+    print(f"{'mode':<14}{'build us':>10}{'bytes':>9}{'repeated':>10}{'tokens':>8}{'repeated':>10}"
+          f"{'body bytes':>12}{'shared w/ prev':>16}{'hits':>6}")
+    for mode, row in results.items():
+        print(f"{mode:<14}{row['build_us']:>10.1f}{row['bytes']:>9.0f}{row['prefix_bytes'] / row['bytes']:>10.0%}"
+              f"{row['tokens']:>8.0f}{row['prefix_tokens'] / row['tokens']:>10.0%}{row['body_bytes']:>12.0f}"
+              f"{row['body_prefix_bytes'] / row['body_bytes']:>16.0%}{row['hits']:>6}")
+
+    if prompts['rebuild'] != prompts['prefix cache']:
+        print('prompts differ between modes')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Search benchmark: linear scan (ChatStore.search_chats) vs SearchIndex.
+
+Fills an in-memory chat store with one user's history of N messages, then
+replays search-as-you-type queries (every prefix of a few words) against
+both implementations.
+
+    python benchmarks/bench_search.py --messages 10000,100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_store import InMemoryChatStore
+from search_index import SearchIndex
+
+USER_ID = 'bench-user'
+MESSAGES_PER_CHAT = 50
+WORDS_PER_MESSAGE = 40
+
+
+def make_vocabulary(size, rng):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [''.join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(size)]
+
+
+def fill_store(store, total_messages, vocabulary, rng):
+    for chat_no in range(total_messages // MESSAGES_PER_CHAT):
+        chat_id = f'chat-{chat_no}'
+        store.create_chat(USER_ID, chat_id, f'Chat {chat_no}', '2024-01-01T00:00:00')
+        for msg_no in range(MESSAGES_PER_CHAT):
+            content = ' '.join(rng.choice(vocabulary) for _ in range(WORDS_PER_MESSAGE))
+            store.append_message(USER_ID, chat_id, {
+                'role': 'user' if msg_no % 2 == 0 else 'assistant',
+                'content': content,
+                'timestamp': f'2024-01-01T00:{msg_no // 60:02d}:{msg_no % 60:02d}'
+            })
+
+
+def typing_queries(words):
+    return [word[:length] for word in words for length in range(1, len(word) + 1)]
+
+
+def time_queries(search, queries):
+    start = time.perf_counter()
+    for query in queries:
+        search(query)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Linear scan vs inverted index search')
+    parser.add_argument('--messages', default='10000,100000', help='comma-separated history sizes')
+    parser.add_argument('--vocabulary', type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    vocabulary = make_vocabulary(args.vocabulary, rng)
+    queries = typing_queries(rng.sample(vocabulary, 5) + ['zzzzzz'])
+
+    print(f"{'messages':>10}{'scan ms/query':>16}{'index ms/query':>17}{'index build s':>16}{'speedup':>10}")
+    for total in (int(n) for n in args.messages.split(',')):
+        store = InMemoryChatStore()
+        fill_store(store, total, vocabulary, rng)
+
+        index = SearchIndex(store)
+        start = time.perf_counter()
+        index.search(USER_ID, 'warmup')  # Builds the user's index from the store
+        build_seconds = time.perf_counter() - start
+
+        scan_ms = time_queries(lambda q: store.search_chats(USER_ID, q), queries)
+        index_ms = time_queries(lambda q: index.search(USER_ID, q), queries)
+        print(f"{total:>10}{scan_ms:>16.2f}{index_ms:>17.2f}{build_seconds:>16.2f}{scan_ms / index_ms:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
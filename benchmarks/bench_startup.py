@@ -0,0 +1,145 @@
+"""Cold-start benchmark of the app against the local fake Groq server.
+
+For each WARM_UP mode (off, background, eager), starts a fresh child process
+that imports app.py, calls create_app() and serves it on a threaded WSGI
+server. The benchmark reports:
+
+- import_ms: time to import app.py in the child
+- factory_ms: time spent in create_app() (the eager warm-up runs here)
+- first_health_ms: time from process start to the first 200 from /health
+- warm_ms: time from process start until /health reports readiness "warm"
+  (not measured for WARM_UP=off, which never runs the warm-up)
+- first_chat_ms: latency of the first POST /chat, sent as soon as /health answers
+
+Each mode is run --runs times and the median of each measurement is
+printed. --json writes the results in a machine-readable form.
+
+    python benchmarks/bench_startup.py --runs 5 --json startup.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_llm import start_server
+
+MODES = ('off', 'background', 'eager')
+
+
+def serve(port):
+    """Child process: import the app, build it and serve it, printing the phase timings"""
+    import logging
+    logging.disable(logging.INFO)
+
+    start = time.perf_counter()
+    import app as app_module
+    imported = time.perf_counter()
+    application = app_module.create_app()
+    built = time.perf_counter()
+
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', port, application, threaded=True)
+    print(json.dumps({
+        'import_ms': round((imported - start) * 1000, 1),
+        'factory_ms': round((built - imported) * 1000, 1)
+    }), flush=True)
+    server.serve_forever()
+
+
+def wait_for(client, predicate, deadline):
+    """Poll /health until predicate(response) holds; return the time it did"""
+    while time.perf_counter() < deadline:
+        try:
+            response = client.get('/health')
+            if predicate(response):
+                return time.perf_counter()
+        except httpx.TransportError:
+            pass
+        time.sleep(0.005)
+    raise RuntimeError('app process did not become ready in time')
+
+
+def run_once(mode, port, env, timeout):
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve', '--port', str(port)],
+        env=dict(env, WARM_UP=mode), stdout=subprocess.PIPE, text=True
+    )
+    try:
+        phases = json.loads(process.stdout.readline())
+        deadline = started + timeout
+        with httpx.Client(base_url=f'http://127.0.0.1:{port}', timeout=60.0) as client:
+            first_health = wait_for(client, lambda response: response.status_code == 200, deadline)
+
+            chat_start = time.perf_counter()
+            response = client.post('/chat', json={'message': 'Hello there', 'model': 'llama3-8b-8192'})
+            first_chat_ms = (time.perf_counter() - chat_start) * 1000
+            if response.status_code != 200:
+                raise RuntimeError(f'first /chat failed with {response.status_code}: {response.text[:200]}')
+
+            warm_ms = None
+            if mode != 'off':
+                warm = wait_for(client, lambda response: response.json().get('readiness') == 'warm', deadline)
+                warm_ms = round((warm - started) * 1000, 1)
+        return dict(
+            phases,
+            first_health_ms=round((first_health - started) * 1000, 1),
+            first_chat_ms=round(first_chat_ms, 1),
+            warm_ms=warm_ms
+        )
+    finally:
+        process.kill()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold-start benchmark against a local fake Groq')
+    parser.add_argument('--modes', default=','.join(MODES), help='comma-separated WARM_UP modes')
+    parser.add_argument('--runs', type=int, default=3, help='fresh processes per mode')
+    parser.add_argument('--latency', type=float, default=0.05, help='fake LLM latency per call in seconds')
+    parser.add_argument('--port', type=int, default=5056, help='port of the app process')
+    parser.add_argument('--timeout', type=float, default=60.0, help='seconds to wait for each process')
+    parser.add_argument('--json', dest='json_path', help='write results to this file')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port)
+        return
+
+    server = start_server(latency=args.latency)
+    fake_url = f'http://127.0.0.1:{server.server_address[1]}'
+    env = dict(os.environ, GROQ_API_KEY='fake-key', GROQ_BASE_URL=fake_url,
+               OPENWEATHER_API_KEY='fake-key', OPENWEATHER_BASE_URL=fake_url)
+    env.setdefault('GROQ_RPM', '0')
+    env.setdefault('GROQ_TPM', '0')
+
+    fields = ('import_ms', 'factory_ms', 'first_health_ms', 'first_chat_ms', 'warm_ms')
+    results = []
+    for mode in args.modes.split(','):
+        runs = [run_once(mode, args.port, env, args.timeout) for _ in range(args.runs)]
+        medians = {}
+        for field in fields:
+            values = [run[field] for run in runs if run[field] is not None]
+            medians[field] = statistics.median(values) if values else '-'
+        results.append(dict(medians, mode=mode, runs=runs))
+
+    print(f"{'mode':<12}" + ''.join(f'{field:>17}' for field in fields))
+    for row in results:
+        print(f"{row['mode']:<12}" + ''.join(f'{row[field]:>17}' for field in fields))
+
+    if args.json_path:
+        with open(args.json_path, 'w') as output:
+            json.dump({'python': platform.python_version(), 'results': results}, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
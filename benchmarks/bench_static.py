@@ -0,0 +1,153 @@
+"""Page-load benchmark: bytes transferred and requests per load, STATIC_ASSETS=plain vs fingerprint.
+
+For each mode, a child process imports the app and loads the chat page
+through Flask's test client, acting as a browser with an HTTP cache. It
+fetches / and then every local stylesheet and script the page links to. It
+reuses cached responses while Cache-Control says they are fresh, and
+otherwise revalidates them with If-None-Match / If-Modified-Since. The first
+visit starts with an empty cache; the --visits repeat visits reuse it.
+
+For the first visit and the average repeat visit, it reports the requests
+sent, the response body bytes and the bytes including response headers. It
+also reports the server time of GET /. External resources (the Font Awesome
+CDN) are the same in both modes and are not counted.
+
+    python benchmarks/bench_static.py --visits 10 --json static.json
+"""
+import argparse
+import gzip
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODES = ('plain', 'fingerprint')
+LOCAL_RESOURCE_RE = re.compile(r'<(?:link[^>]+href|script[^>]+src)="(/[^"]+)"')
+
+
+class Browser:
+    """Test client plus an HTTP cache that honors max-age and revalidates with validators"""
+
+    def __init__(self, client, accept_encoding):
+        self.client = client
+        self.accept_encoding = accept_encoding
+        self.cache = {}  # url -> {'fresh_until', 'etag', 'last_modified', 'encoding', 'body'}
+
+    def get(self, url, totals):
+        entry = self.cache.get(url)
+        if entry and entry['fresh_until'] > time.monotonic():
+            return entry['body']
+
+        headers = {'Accept-Encoding': self.accept_encoding}
+        if entry and entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        start = time.perf_counter()
+        response = self.client.get(url, headers=headers)
+        elapsed = time.perf_counter() - start
+
+        body = response.get_data()
+        header_bytes = len(f'HTTP/1.1 {response.status}\r\n') + sum(
+            len(name) + len(value) + 4 for name, value in response.headers.items()
+        ) + 2
+        totals['requests'] += 1
+        totals['body_bytes'] += len(body)
+        totals['bytes'] += len(body) + header_bytes
+        if url == '/':
+            totals['index_ms'] += elapsed * 1000
+
+        if response.status_code == 304:
+            entry['fresh_until'] = self.fresh_until(response)
+            return entry['body']
+        self.cache[url] = {
+            'fresh_until': self.fresh_until(response),
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'encoding': response.headers.get('Content-Encoding'),
+            'body': body
+        }
+        return body
+
+    @staticmethod
+    def fresh_until(response):
+        cache_control = response.cache_control
+        if cache_control.no_cache or cache_control.no_store or not cache_control.max_age:
+            return 0
+        return time.monotonic() + cache_control.max_age
+
+    def load_page(self):
+        totals = {'requests': 0, 'body_bytes': 0, 'bytes': 0, 'index_ms': 0.0}
+        self.get('/', totals)
+        html = decompress(self.cache['/']['body'], self.cache['/']['encoding']).decode()
+        for url in LOCAL_RESOURCE_RE.findall(html):
+            self.get(url, totals)
+        return totals
+
+
+def decompress(body, encoding):
+    if encoding == 'gzip':
+        return gzip.decompress(body)
+    if encoding == 'br':
+        import brotli
+        return brotli.decompress(body)
+    return body
+
+
+def measure(visits, accept_encoding):
+    """Child process: load the page once cold and visits times warm; return the totals"""
+    import logging
+    logging.disable(logging.INFO)
+    from app import create_app
+
+    application = create_app()
+    browser = Browser(application.test_client(), accept_encoding)
+    first = browser.load_page()
+    repeats = [browser.load_page() for _ in range(visits)]
+    repeat = {key: sum(run[key] for run in repeats) / visits for key in first}
+    return {'first': first, 'repeat': repeat}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bytes and requests per page load, plain vs fingerprinted assets')
+    parser.add_argument('--modes', default=','.join(MODES), help='comma-separated STATIC_ASSETS modes')
+    parser.add_argument('--visits', type=int, default=10, help='repeat visits after the first one')
+    parser.add_argument('--accept-encoding', default='gzip, deflate, br')
+    parser.add_argument('--json', dest='json_path', help='write results to this file')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.visits, args.accept_encoding)))
+        return
+
+    results = []
+    for mode in args.modes.split(','):
+        env = dict(os.environ, STATIC_ASSETS=mode, WARM_UP='eager', GROQ_API_KEY='fake-key')
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', '--visits', str(args.visits),
+             '--accept-encoding', args.accept_encoding],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        results.append(dict(json.loads(output.splitlines()[-1]), mode=mode))
+
+    print(f"{'mode':<13}{'visit':<8}{'requests':>10}{'body bytes':>12}{'total bytes':>13}{'GET / ms':>10}")
+    for row in results:
+        for visit in ('first', 'repeat'):
+            totals = row[visit]
+            print(f"{row['mode']:<13}{visit:<8}{totals['requests']:>10.1f}{totals['body_bytes']:>12.0f}"
+                  f"{totals['bytes']:>13.0f}{totals['index_ms']:>10.2f}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as output:
+            json.dump({'python': platform.python_version(), 'accept_encoding': args.accept_encoding,
+                       'visits': args.visits, 'results': results}, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""Multi-worker consistency and throughput check against the local fake Groq server.
+
+For each worker count, starts that many app processes on one fresh SQLite
+database (WORKER_MODE=multi) and drives them like a load balancer without
+sticky sessions. Every request goes to the next worker in turn. Each virtual
+user has one chat and sends its messages from several threads at once, so
+turns of the same chat race across workers.
+
+Afterwards every chat is checked through the workers:
+
+- the user still has exactly one chat (no chat was forked on a worker that
+  did not know the session)
+- every message sent was stored once, and each user message is followed by
+  its assistant reply (turns never interleave)
+- every worker's search finds the user's last message
+
+It reports turns/sec for each worker count and its speedup over the first
+stage (which cannot exceed the number of CPUs), and exits with status 1 if any check failed. --worker-mode single runs the
+same load against the default in-process stores, which shows the failures
+multi mode prevents.
+
+    python benchmarks/bench_workers.py --workers 1,2,4 --users 16 --messages 8 --json workers.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_llm import start_server
+
+
+def serve(port):
+    """Child process: serve app.py on a threaded WSGI server"""
+    import logging
+    logging.disable(logging.INFO)
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    server = make_server('127.0.0.1', port, create_app(), threaded=True)
+    print('ready', flush=True)
+    server.serve_forever()
+
+
+def start_workers(count, base_port, env):
+    processes = []
+    for index in range(count):
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--serve', '--port', str(base_port + index)],
+            env=env, stdout=subprocess.PIPE, text=True
+        )
+        processes.append(process)
+        if process.stdout.readline().strip() != 'ready':
+            for started in processes:
+                started.kill()
+            raise RuntimeError('worker process failed to start')
+    return processes
+
+
+class VirtualUser:
+    """One browser session whose requests are spread over every worker"""
+
+    def __init__(self, number, urls):
+        self.number = number
+        self.urls = urls
+        self.client = httpx.Client(timeout=120.0)
+        self.sent = []
+        self.errors = []
+        self._next = number
+        self._lock = threading.Lock()
+        self.chat_id = self.client.post(f'{urls[0]}/chats/new', json={'title': f'User {number}'}).json()['chat']['id']
+
+    def url(self):
+        """Round-robin over the workers, like a load balancer without sticky sessions"""
+        with self._lock:
+            self._next += 1
+            return self.urls[self._next % len(self.urls)]
+
+    def send(self, sender, count):
+        for index in range(count):
+            message = f'user {self.number} sender {sender} message {index} marker{self.number}x{sender}x{index}'
+            response = self.client.post(f'{self.url()}/chat', json={'message': message, 'model': 'llama3-8b-8192'})
+            with self._lock:
+                if response.status_code == 200:
+                    self.sent.append(message)
+                else:
+                    self.errors.append(response.status_code)
+
+    def verify(self):
+        """Return a list of problems with this user's history as seen through the workers"""
+        problems = []
+        chats = self.client.get(f'{self.urls[-1]}/chats', params={'limit': 200}).json()['chats']
+        if len(chats) != 1:
+            problems.append(f'user {self.number}: {len(chats)} chats instead of 1')
+
+        messages = []
+        before = None
+        while True:
+            params = {'limit': 200}
+            if before is not None:
+                params['before'] = before
+            page = self.client.get(f'{self.urls[0]}/chats/{self.chat_id}/messages', params=params)
+            if page.status_code != 200:
+                problems.append(f'user {self.number}: chat not found ({page.status_code})')
+                return problems
+            page = page.json()
+            messages = page['messages'] + messages
+            if not page.get('has_more') or not page['messages']:
+                break
+            before = page['messages'][0]['id']
+
+        stored = [message['content'] for message in messages if message['role'] == 'user']
+        if sorted(stored) != sorted(self.sent):
+            problems.append(f'user {self.number}: {len(stored)} user messages stored, {len(self.sent)} sent')
+        roles = [message['role'] for message in messages]
+        if roles != ['user', 'assistant'] * (len(roles) // 2) or len(roles) % 2:
+            problems.append(f'user {self.number}: turns interleaved ({"".join(role[0] for role in roles)})')
+
+        if self.sent:
+            marker = self.sent[-1].rsplit(' ', 1)[1]
+            for url in self.urls:
+                found = self.client.get(f'{url}/chats/search', params={'q': marker}).json().get('chats', [])
+                if self.chat_id not in [chat['id'] for chat in found]:
+                    problems.append(f'user {self.number}: search on {url} misses the last message')
+        return problems
+
+
+def run_stage(workers, args, env):
+    data_dir = tempfile.mkdtemp(prefix='bench_workers_')
+    env = dict(env, CHAT_STORE_PATH=os.path.join(data_dir, 'chats.db'),
+               SESSION_STORE_PATH=os.path.join(data_dir, 'sessions.db'))
+    processes = start_workers(workers, args.base_port, env)
+    try:
+        urls = [f'http://127.0.0.1:{args.base_port + index}' for index in range(workers)]
+        users = [VirtualUser(number, urls) for number in range(args.users)]
+        per_sender = args.messages // args.senders
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.users * args.senders) as pool:
+            futures = [pool.submit(user.send, sender, per_sender)
+                       for user in users for sender in range(args.senders)]
+            for future in futures:
+                future.result()
+        seconds = time.perf_counter() - start
+
+        problems = [problem for user in users for problem in user.verify()]
+        turns = sum(len(user.sent) for user in users)
+        errors = sum(len(user.errors) for user in users)
+        return {
+            'workers': workers,
+            'turns': turns,
+            'errors': errors,
+            'seconds': round(seconds, 3),
+            'turns_per_sec': round(turns / seconds, 1),
+            'problems': problems
+        }
+    finally:
+        for process in processes:
+            process.kill()
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Multi-worker consistency and throughput check')
+    parser.add_argument('--workers', default='1,2,4', help='comma-separated worker process counts, one stage each')
+    parser.add_argument('--users', type=int, default=16, help='virtual users, one chat each')
+    parser.add_argument('--messages', type=int, default=8, help='messages sent per user')
+    parser.add_argument('--senders', type=int, default=2, help='threads sending each user\'s messages at once')
+    parser.add_argument('--latency', type=float, default=0.05, help='fake LLM latency per call in seconds')
+    parser.add_argument('--worker-mode', default='multi', choices=('multi', 'single'))
+    parser.add_argument('--base-port', type=int, default=5100, help='port of the first worker')
+    parser.add_argument('--json', dest='json_path', help='write results to this file')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port)
+        return
+
+    fake = start_server(latency=args.latency)
+    fake_url = f'http://127.0.0.1:{fake.server_address[1]}'
+    env = dict(os.environ, GROQ_API_KEY='fake-key', GROQ_BASE_URL=fake_url,
+               OPENWEATHER_API_KEY='fake-key', OPENWEATHER_BASE_URL=fake_url,
+               WORKER_MODE=args.worker_mode, WARM_UP='eager')
+    if args.worker_mode == 'multi':
+        env.update(CHAT_STORE='sqlite', SESSION_STORE='sqlite')
+    env.setdefault('GROQ_RPM', '0')
+    env.setdefault('GROQ_TPM', '0')
+
+    results = [run_stage(int(workers), args, env) for workers in args.workers.split(',')]
+    baseline = results[0]['turns_per_sec']
+
+    print(f'{os.cpu_count()} CPUs; worker mode {args.worker_mode}')
+    print(f"{'workers':>8}{'turns':>8}{'errors':>8}{'turns/s':>10}{'speedup':>9}{'problems':>10}")
+    for row in results:
+        row['speedup'] = round(row['turns_per_sec'] / baseline, 2) if baseline else None
+        print(f"{row['workers']:>8}{row['turns']:>8}{row['errors']:>8}{row['turns_per_sec']:>10}"
+              f"{row['speedup']:>9}{len(row['problems']):>10}")
+        for problem in row['problems'][:5]:
+            print(f'    {problem}')
+
+    if args.json_path:
+        with open(args.json_path, 'w') as output:
+            json.dump({'python': platform.python_version(), 'cpus': os.cpu_count(), 'worker_mode': args.worker_mode,
+                       'results': results}, output, indent=2)
+    if any(row['problems'] for row in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""Local fake of the Groq and OpenWeatherMap APIs for offline benchmarks.
+
+Implements POST /openai/v1/chat/completions with configurable latency. If the
+request carries tools and the last user message mentions the weather, the
+first completion is a tool call to get_weather_for_city; otherwise it returns
+a fixed reply. Both plain and streamed (SSE) responses are supported.
+
+Also implements GET /data/2.5/weather with its own latency. Cities whose name
+starts with "unknown" get a 404, like a misspelled city would.
+
+Point the app at it with GROQ_BASE_URL=http://127.0.0.1:<port> and
+OPENWEATHER_BASE_URL=http://127.0.0.1:<port>.
+
+    python benchmarks/fake_llm.py --port 8765 --latency 0.5 --weather-latency 0.1
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+REPLY = "This is a canned reply from the local fake LLM server."
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    weather_latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != '/data/2.5/weather':
+            self.send_json({'error': 'not found'}, status=404)
+            return
+        time.sleep(self.weather_latency)
+
+        city = parse_qs(url.query).get('q', [''])[0]
+        if not city or city.lower().startswith('unknown'):
+            self.send_json({'cod': '404', 'message': 'city not found'}, status=404)
+            return
+        self.send_json({
+            'name': city,
+            'main': {'temp': 18.5, 'feels_like': 17.9, 'humidity': 64},
+            'weather': [{'main': 'Clouds', 'description': 'scattered clouds'}],
+            'cod': 200,
+        })
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        time.sleep(self.latency)
+
+        message, finish_reason = self.build_message(body)
+        if body.get('stream'):
+            self.send_stream(body, message, finish_reason)
+        else:
+            self.send_json({
+                'id': 'chatcmpl-fake',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': body.get('model'),
+                'choices': [{'index': 0, 'message': message, 'finish_reason': finish_reason}],
+                'usage': self.usage(body),
+            })
+
+    def build_message(self, body):
+        """Return the assistant message and finish reason for a request"""
+        messages = body.get('messages', [])
+        last = messages[-1] if messages else {}
+        wants_weather = (
+            body.get('tools')
+            and last.get('role') == 'user'
+            and 'weather' in str(last.get('content', '')).lower()
+        )
+        if wants_weather:
+            return {
+                'role': 'assistant',
+                'content': None,
+                'tool_calls': [{
+                    'id': 'call_fake',
+                    'type': 'function',
+                    'function': {'name': 'get_weather_for_city', 'arguments': json.dumps({'city_name': 'London'})},
+                }],
+            }, 'tool_calls'
+        return {'role': 'assistant', 'content': REPLY}, 'stop'
+
+    def usage(self, body):
+        prompt_tokens = sum(len(str(m.get('content') or '')) // 4 for m in body.get('messages', []))
+        completion_tokens = len(REPLY) // 4
+        return {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+        }
+
+    def send_json(self, payload, status=200):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_stream(self, body, message, finish_reason):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def chunk(delta, finish=None, extra=None):
+            payload = {
+                'id': 'chatcmpl-fake',
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': body.get('model'),
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish}],
+            }
+            if extra:
+                payload.update(extra)
+            self.write_chunk(f"data: {json.dumps(payload)}\n\n")
+
+        if message.get('tool_calls'):
+            tool_call = dict(message['tool_calls'][0], index=0)
+            chunk({'role': 'assistant', 'tool_calls': [tool_call]})
+        else:
+            for word in message['content'].split(' '):
+                chunk({'content': word + ' '})
+        chunk({}, finish_reason, {'x_groq': {'usage': self.usage(body)}})
+        self.write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b'0\r\n\r\n')
+
+    def write_chunk(self, text):
+        data = text.encode()
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+
+
+def start_server(port: int = 0, latency: float = 0.0, weather_latency: float = 0.0):
+    """Start the fake server on a background thread and return it"""
+    handler = type('Handler', (FakeLLMHandler,), {'latency': latency, 'weather_latency': weather_latency})
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds to wait before each completion')
+    parser.add_argument('--weather-latency', type=float, default=0.0, help='seconds to wait before each weather response')
+    args = parser.parse_args()
+
+    server = start_server(args.port, args.latency, args.weather_latency)
+    print(f"Fake LLM listening on http://127.0.0.1:{server.server_address[1]} "
+          f"(latency {args.latency}s, weather latency {args.weather_latency}s)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,112 @@
+"""Concurrent execution of bulk chat jobs for POST /chats/bulk.
+
+A bulk request carries many (chat_id, message, model) jobs. Jobs are grouped
+by chat. Each group runs in order on one worker, so the turns of a
+conversation are never interleaved, while different chats run concurrently
+up to the request's concurrency limit. Before each job the worker takes a
+token from the model's rate limiter (see rate_limit.py). Results are yielded
+in completion order so the endpoint can stream them as NDJSON.
+
+When the client disconnects, the runner stops starting new jobs; jobs
+already in flight still finish and are persisted.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from rate_limit import ModelRateLimiter
+
+
+class BulkJobError(ValueError):
+    """A malformed bulk request or job"""
+
+
+def parse_jobs(raw_jobs, default_model: str, max_jobs: int, models: list = None) -> list:
+    """Validate raw job dicts into {'index', 'id', 'chat_id', 'message', 'model', 'title'}; models lists the allowed ones"""
+    if not isinstance(raw_jobs, list) or not raw_jobs:
+        raise BulkJobError('Expected a non-empty list of jobs')
+    if len(raw_jobs) > max_jobs:
+        raise BulkJobError(f'Too many jobs: {len(raw_jobs)} (limit {max_jobs})')
+
+    jobs = []
+    for index, raw in enumerate(raw_jobs):
+        if not isinstance(raw, dict):
+            raise BulkJobError(f'Job {index} must be an object')
+        message = raw.get('message')
+        if not isinstance(message, str) or not message.strip():
+            raise BulkJobError(f'Job {index}: message cannot be empty')
+        for field in ('chat_id', 'model', 'title'):
+            if raw.get(field) is not None and not isinstance(raw[field], str):
+                raise BulkJobError(f'Job {index}: {field} must be a string')
+        model = raw.get('model') or default_model
+        if models is not None and model not in models:
+            raise BulkJobError(f'Job {index}: unknown model {model}')
+        jobs.append({
+            'index': index,
+            'id': raw.get('id'),
+            'chat_id': raw.get('chat_id') or None,
+            'message': message.strip(),
+            'model': model,
+            'title': raw.get('title')
+        })
+    return jobs
+
+
+class BulkRunner:
+    """Fans bulk jobs out over a thread pool under a concurrency cap and per-model rate limits"""
+
+    def __init__(self, rate_limiter: ModelRateLimiter, max_concurrency: int = 8):
+        self.rate_limiter = rate_limiter
+        self.max_concurrency = max_concurrency
+
+    def run(self, jobs: list, handle, concurrency: int = None, wrap=None):
+        """Yield handle(job) results, each tagged with the job's index and id, as jobs complete.
+
+        handle(job) returns a result dict. wrap, if given, is applied to every
+        worker function, e.g. to carry the Flask request context into the pool.
+        """
+        concurrency = max(1, min(concurrency or self.max_concurrency, self.max_concurrency))
+
+        # Jobs of one chat run in order on a single worker; jobs without a chat each get their own
+        groups = {}
+        for job in jobs:
+            key = job['chat_id'] or ('new', job['index'])
+            groups.setdefault(key, []).append(job)
+
+        results = queue.Queue()
+        cancelled = threading.Event()
+
+        def run_group(group):
+            for job in group:
+                if cancelled.is_set():
+                    return
+                start = time.perf_counter()
+                try:
+                    if self.rate_limiter.acquire(job['model'], cancelled) is None:
+                        return
+                    result = handle(job)
+                except Exception as e:
+                    result = {'status': 500, 'error': f'An error occurred: {str(e)}'}
+                result = dict(result, index=job['index'], id=job['id'],
+                              ms=round((time.perf_counter() - start) * 1000, 1))
+                results.put(result)
+
+        pool = ThreadPoolExecutor(max_workers=min(concurrency, len(groups)), thread_name_prefix='bulk')
+        try:
+            for group in groups.values():
+                pool.submit(wrap(run_group) if wrap else run_group, group)
+            for _ in range(len(jobs)):
+                yield results.get()
+        finally:
+            cancelled.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def create_bulk_runner() -> BulkRunner:
+    """Runner configured by BULK_MAX_CONCURRENCY / BULK_MODEL_RPM (0 disables rate limiting)"""
+    return BulkRunner(
+        ModelRateLimiter(float(os.getenv('BULK_MODEL_RPM', '60'))),
+        max_concurrency=int(os.getenv('BULK_MAX_CONCURRENCY', '8'))
+    )
@@ -0,0 +1,154 @@
+"""Streaming NDJSON export and import of a user's chats for GET /chats/export and POST /chats/import.
+
+An export is one JSON object per line: a header, then each chat followed by
+its messages, oldest first:
+
+    {"type": "export", "version": 1}
+    {"type": "chat", "id": "...", "title": "...", "created_at": "...", "updated_at": "..."}
+    {"type": "message", "chat_id": "...", "role": "user", "content": "...", "timestamp": "..."}
+
+Both directions work a page at a time. The export walks the sidebar list and
+reads each chat forwards in pages of messages, from the store's
+export_source(). For CHAT_STORE=sqlite and CHAT_STORE=journal that is SQLite,
+so exporting thousands of chats takes the memory of one page; the journal
+store waits for the user's uncommitted writes and does not load the user into
+its memory cache. CHAT_STORE=memory holds every history in memory anyway. The
+import stores each line as it is read, so it buffers one line, but the chats
+it stores end up in memory with the memory and journal stores.
+
+Imported chats get new ids, so an export can be imported next to the chats it
+came from, or by another user, without clashing.
+"""
+import json
+import uuid
+from datetime import datetime
+
+EXPORT_VERSION = 1
+CHAT_PAGE_SIZE = 100
+MESSAGE_PAGE_SIZE = 200
+
+# Longest import line accepted; a message line carries one message
+MAX_LINE_BYTES = 1 << 20
+
+ROLES = ('user', 'assistant')
+
+
+class ImportFormatError(ValueError):
+    """A malformed import line; imported holds the counts stored before it"""
+
+    def __init__(self, line_number: int, reason: str, imported: dict):
+        super().__init__(f'Line {line_number}: {reason}')
+        self.line_number = line_number
+        self.imported = imported
+
+
+def dump_line(record: dict) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def export_chats(chat_store, user_id: str, chat_page: int = CHAT_PAGE_SIZE, message_page: int = MESSAGE_PAGE_SIZE):
+    """Yield the NDJSON lines of the user's chats, most recently updated first"""
+    yield dump_line({'type': 'export', 'version': EXPORT_VERSION})
+    before = None
+    while True:
+        chats = chat_store.list_chats(user_id, limit=chat_page, before=before)
+        for summary in chats:
+            yield dump_line({'type': 'chat', 'id': summary['id'], 'title': summary['title'],
+                             'created_at': summary['created_at'], 'updated_at': summary['updated_at']})
+            after = 0
+            while True:
+                messages = chat_store.get_messages(user_id, summary['id'], after=after, limit=message_page)
+                if not messages:
+                    break  # Done, or the chat was deleted meanwhile
+                for message in messages:
+                    record = {'type': 'message', 'chat_id': summary['id']}
+                    record.update((key, message[key]) for key in ('role', 'content', 'timestamp', 'model')
+                                  if key in message)
+                    yield dump_line(record)
+                if len(messages) < message_page:
+                    break
+                after = messages[-1]['id']
+        if len(chats) < chat_page:
+            return
+        before = (chats[-1]['updated_at'], chats[-1]['id'])
+
+
+def _string(record: dict, field: str, required: bool = True):
+    value = record.get(field)
+    if value is None and not required:
+        return None
+    if not isinstance(value, str) or (required and not value):
+        raise ValueError(f'{field} must be a non-empty string')
+    return value
+
+
+def _timestamp(record: dict, field: str) -> str:
+    value = _string(record, field)
+    datetime.fromisoformat(value)  # ValueError if malformed
+    return value
+
+
+def import_chats(stream, chat_store, search_index, user_id: str, max_line_bytes: int = MAX_LINE_BYTES) -> dict:
+    """Store the chats of an export read line by line from a binary stream; return the counts imported.
+
+    Raises ImportFormatError at the first malformed line; what came before it stays imported.
+    """
+    imported = {'chats': 0, 'messages': 0}
+    current = None  # (exported id, new id, exported updated_at)
+
+    def finish_chat():
+        # Appends moved updated_at to the last message; restore the exported one
+        if current:
+            chat_store.update_chat(user_id, current[1], updated_at=current[2])
+
+    lines = iter(lambda: stream.readline(max_line_bytes + 1), b'')
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            if len(line) > max_line_bytes:
+                raise ValueError(f'line is longer than {max_line_bytes} bytes')
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise ValueError('not valid JSON')
+            if not isinstance(record, dict):
+                raise ValueError('expected a JSON object')
+            kind = record.get('type')
+            if kind == 'export':
+                if record.get('version') != EXPORT_VERSION:
+                    raise ValueError(f"unsupported export version {record.get('version')!r}")
+            elif kind == 'chat':
+                exported_id = _string(record, 'id')
+                title = _string(record, 'title')
+                created_at = _timestamp(record, 'created_at')
+                updated_at = _timestamp(record, 'updated_at')
+                finish_chat()
+                chat_id = str(uuid.uuid4())
+                chat_store.create_chat(user_id, chat_id, title, created_at)
+                search_index.add_chat(user_id, chat_id, title)
+                current = (exported_id, chat_id, updated_at)
+                imported['chats'] += 1
+            elif kind == 'message':
+                if current is None or record.get('chat_id') != current[0]:
+                    raise ValueError('message does not follow its chat')
+                if record.get('role') not in ROLES:
+                    raise ValueError(f"role must be one of {', '.join(ROLES)}")
+                message = {
+                    'role': record['role'],
+                    'content': _string(record, 'content', required=False) or '',
+                    'timestamp': _timestamp(record, 'timestamp')
+                }
+                model = _string(record, 'model', required=False)
+                if model is not None:
+                    message['model'] = model
+                chat_store.append_message(user_id, current[1], message)
+                search_index.add_message(user_id, current[1], message['content'])
+                imported['messages'] += 1
+            else:
+                raise ValueError(f'unknown record type {kind!r}')
+        except ValueError as e:
+            finish_chat()
+            raise ImportFormatError(line_number, str(e), imported)
+    finish_chat()
+    return imported
@@ -0,0 +1,232 @@
+"""Per-chat locks that keep the turns of one conversation from interleaving.
+
+A chat turn appends the user message, builds the context, waits for the model
+and appends the reply. Two turns of the same chat running at once, e.g. a
+double submit or two tabs, would otherwise store user, user, assistant,
+assistant and build each reply without the other. app.py holds the chat's
+lock for the whole turn, so a second message waits for the first reply.
+
+InMemoryChatLocks serves a single process. SQLiteChatLocks keeps leases in
+the shared chat database, so the lock holds across every worker process
+(WORKER_MODE=multi). A lease expires after CHAT_LOCK_TTL_SECONDS, so a worker
+that dies mid-turn cannot lock its chat forever. A turn that cannot get the
+lock within CHAT_LOCK_TIMEOUT_SECONDS fails with ChatBusy.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# Backoff between attempts to take a held lock
+MIN_POLL_SECONDS = 0.002
+MAX_POLL_SECONDS = 0.05
+
+
+class ChatBusy(Exception):
+    """Another turn of the chat held its lock for longer than the wait timeout"""
+
+    status_code = 409
+
+    def __init__(self, chat_id: str, retry_after: float):
+        super().__init__(f"Chat {chat_id} is busy with another message")
+        self.chat_id = chat_id
+        self.retry_after = retry_after
+
+
+class ChatLease:
+    """A held chat lock; release() is idempotent"""
+
+    def __init__(self, locks, chat_id: str, token: str):
+        self.locks = locks
+        self.chat_id = chat_id
+        self.token = token
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.locks.release(self.chat_id, self.token)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+
+class ChatLocks:
+    """Interface implemented by every chat lock backend"""
+
+    def __init__(self, ttl_seconds: float = 120.0, timeout_seconds: float = 30.0):
+        self.ttl_seconds = ttl_seconds
+        self.timeout_seconds = timeout_seconds
+        self.acquired = 0
+        self.contended = 0
+        self.timeouts = 0
+        self.waited_seconds = 0.0
+        self._stats_lock = threading.Lock()
+
+    def try_acquire(self, chat_id: str):
+        """Take the chat's lock if it is free; return its token, or None"""
+        raise NotImplementedError
+
+    async def atry_acquire(self, chat_id: str):
+        """Async variant of try_acquire(), for backends whose try_acquire() blocks"""
+        return self.try_acquire(chat_id)
+
+    def release(self, chat_id: str, token: str):
+        raise NotImplementedError
+
+    def _wait(self, seconds: float):
+        time.sleep(seconds)
+
+    def _record(self, waited: float, contended: bool, timed_out: bool = False):
+        with self._stats_lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.acquired += 1
+            self.contended += contended
+            self.waited_seconds += waited
+
+    def acquire(self, chat_id: str, timeout: float = None) -> ChatLease:
+        """Wait for the chat's lock; raises ChatBusy after timeout seconds"""
+        start = time.monotonic()
+        deadline = start + (self.timeout_seconds if timeout is None else timeout)
+        delay = MIN_POLL_SECONDS
+        while True:
+            token = self.try_acquire(chat_id)
+            now = time.monotonic()
+            if token is not None:
+                self._record(now - start, delay > MIN_POLL_SECONDS)
+                return ChatLease(self, chat_id, token)
+            if now >= deadline:
+                self._record(now - start, True, timed_out=True)
+                raise ChatBusy(chat_id, retry_after=1.0)
+            self._wait(min(delay, deadline - now))
+            delay = min(delay * 2, MAX_POLL_SECONDS)
+
+    async def aacquire(self, chat_id: str, timeout: float = None) -> ChatLease:
+        """Async variant of acquire() that waits without blocking the event loop"""
+        start = time.monotonic()
+        deadline = start + (self.timeout_seconds if timeout is None else timeout)
+        delay = MIN_POLL_SECONDS
+        while True:
+            token = await self.atry_acquire(chat_id)
+            now = time.monotonic()
+            if token is not None:
+                self._record(now - start, delay > MIN_POLL_SECONDS)
+                return ChatLease(self, chat_id, token)
+            if now >= deadline:
+                self._record(now - start, True, timed_out=True)
+                raise ChatBusy(chat_id, retry_after=1.0)
+            await asyncio.sleep(min(delay, deadline - now))
+            delay = min(delay * 2, MAX_POLL_SECONDS)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                'backend': self.backend,
+                'acquired': self.acquired,
+                'contended': self.contended,
+                'timeouts': self.timeouts,
+                'waited_seconds': round(self.waited_seconds, 3)
+            }
+
+
+class InMemoryChatLocks(ChatLocks):
+    """Locks shared by the threads of one process"""
+
+    backend = 'memory'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._held = {}  # chat_id -> (token, expires_at)
+        self._released = threading.Condition()
+
+    def try_acquire(self, chat_id):
+        now = time.monotonic()
+        with self._released:
+            held = self._held.get(chat_id)
+            if held is not None and held[1] > now:
+                return None
+            token = uuid.uuid4().hex
+            self._held[chat_id] = (token, now + self.ttl_seconds)
+            return token
+
+    def release(self, chat_id, token):
+        with self._released:
+            held = self._held.get(chat_id)
+            if held is not None and held[0] == token:
+                del self._held[chat_id]
+            self._released.notify_all()
+
+    def _wait(self, seconds):
+        with self._released:
+            self._released.wait(seconds)
+
+
+class SQLiteChatLocks(ChatLocks):
+    """Leases in a SQLite table, shared by every worker process using the same file"""
+
+    backend = 'sqlite'
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS chat_locks (
+            chat_id TEXT PRIMARY KEY,
+            token TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        );
+    """
+
+    def __init__(self, path: str = 'chats.db', **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def try_acquire(self, chat_id):
+        # Leases use wall-clock time, the only clock every process agrees on
+        now = time.time()
+        token = uuid.uuid4().hex
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM chat_locks WHERE chat_id = ? AND expires_at < ?', (chat_id, now))
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO chat_locks (chat_id, token, expires_at) VALUES (?, ?, ?)',
+                (chat_id, token, now + self.ttl_seconds)
+            )
+        return token if cursor.rowcount == 1 else None
+
+    async def atry_acquire(self, chat_id):
+        # A SQLite write, which can wait on other workers' transactions
+        return await asyncio.to_thread(self.try_acquire, chat_id)
+
+    def release(self, chat_id, token):
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM chat_locks WHERE chat_id = ? AND token = ?', (chat_id, token))
+
+
+def create_chat_locks(shared: bool = False) -> ChatLocks:
+    """SQLite leases next to the chats when workers share the database, else in-process locks"""
+    options = {
+        'ttl_seconds': float(os.getenv('CHAT_LOCK_TTL_SECONDS', '120')),
+        'timeout_seconds': float(os.getenv('CHAT_LOCK_TIMEOUT_SECONDS', '30')),
+    }
+    if shared:
+        return SQLiteChatLocks(os.getenv('CHAT_STORE_PATH', 'chats.db'), **options)
+    return InMemoryChatLocks(**options)
@@ -0,0 +1,866 @@
+"""Pluggable storage backends for chat sessions.
+
+All chat reads and writes in app.py go through a ChatStore, so history can
+live in process memory (InMemoryChatStore), survive restarts and be shared
+across workers (SQLiteChatStore), or be served from memory and written to
+SQLite behind the request (WriteBehindChatStore in write_behind.py). Pick
+one with the CHAT_STORE environment variable; see create_chat_store().
+
+A shared store also keeps what workers would otherwise hold privately: the
+rolling summary of each chat and a revision counter per user, which tells a
+worker's search index that another worker changed the user's chats.
+
+The in-memory store keeps each message as a MessageRecord rather than a
+dict. Records use __slots__, share interned role and model strings, and
+hold the timestamp as integer epoch microseconds. Callers still see plain
+dicts with ISO timestamps. memory_report() tells how many bytes the history
+of each user and chat takes.
+"""
+import bisect
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+
+def make_preview(content: str) -> str:
+    """Sidebar preview text for a chat's first user message"""
+    return content[:50] + "..." if len(content) > 50 else content
+
+
+class ChatStore:
+    """Interface implemented by every chat storage backend.
+
+    Chats are plain dicts with id, title, created_at, updated_at, user_id,
+    preview, message_count and messages. Every stored message gets an integer
+    id that is stable and increases within its chat. get_chat() returns a copy; callers
+    must write changes back through append_message() / update_chat(), which
+    also keep the preview and message_count summary fields current.
+    """
+
+    backend = None
+
+    # Whether every worker process sees the same data (see WORKER_MODE in app.py)
+    shared = False
+
+    def create_chat(self, user_id: str, chat_id: str, title: str, created_at: str) -> dict:
+        raise NotImplementedError
+
+    def get_chat(self, user_id: str, chat_id: str, message_limit: int = None):
+        """Return the chat with its last message_limit messages (all if None), or None"""
+        raise NotImplementedError
+
+    def has_chat(self, user_id: str, chat_id: str) -> bool:
+        raise NotImplementedError
+
+    def get_message(self, user_id: str, chat_id: str, position: int):
+        """Return the message at 0-based position in the chat, or None"""
+        raise NotImplementedError
+
+    def get_messages(self, user_id: str, chat_id: str, before: int = None, limit: int = 50, after: int = None):
+        """Return up to limit messages with id < before (newest if None), oldest first, or None.
+
+        With after, return the first limit messages with id > after instead, for reading a chat forwards.
+        """
+        raise NotImplementedError
+
+    def append_message(self, user_id: str, chat_id: str, message: dict):
+        """Append one message, bump the chat's updated_at and return the new message id (None if no chat)"""
+        raise NotImplementedError
+
+    def update_chat(self, user_id: str, chat_id: str, **fields) -> bool:
+        """Update chat metadata (title, updated_at)"""
+        raise NotImplementedError
+
+    def list_chats(self, user_id: str, limit: int = None, before: tuple = None) -> list:
+        """Return chat summaries sorted by (updated_at, id), most recent first.
+
+        before is the (updated_at, id) of the last chat on the previous page.
+        """
+        raise NotImplementedError
+
+    def search_chats(self, user_id: str, query: str) -> list:
+        """Return chats whose title or any message contains query (case-insensitive)"""
+        raise NotImplementedError
+
+    def delete_chat(self, user_id: str, chat_id: str) -> bool:
+        raise NotImplementedError
+
+    def get_profile(self, user_id: str):
+        """Return the user's profile dict, or None"""
+        raise NotImplementedError
+
+    def save_profile(self, user_id: str, profile: dict):
+        raise NotImplementedError
+
+    def export_source(self, user_id: str) -> 'ChatStore':
+        """Store to page the user's chats from for an export"""
+        return self
+
+    def memory_report(self, user_id: str = None, top: int = 10) -> dict:
+        """Bytes held by chat history: totals, the top users by size and user_id's chats.
+
+        Top users are identified by anonymize_user() hashes only.
+        """
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {'backend': self.backend}
+
+    # Implemented by shared backends only
+
+    def revision(self, user_id: str) -> int:
+        """Counter bumped by every change to the user's chats or messages"""
+        raise NotImplementedError
+
+    def get_summary(self, chat_id: str):
+        """Return the chat's rolling summary state {'summary', 'through_id'}, or None"""
+        raise NotImplementedError
+
+    def save_summary(self, chat_id: str, summary: str, through_id: int, previous_through_id: int = 0) -> bool:
+        """Store the summary if the chat's stored one is still at previous_through_id; return whether it was"""
+        raise NotImplementedError
+
+
+def to_epoch_us(timestamp: str) -> int:
+    """ISO timestamp (naive local time, as written by app.py) to integer epoch microseconds"""
+    moment = datetime.fromisoformat(timestamp)
+    return int(moment.replace(microsecond=0).timestamp()) * 1_000_000 + moment.microsecond
+
+
+def from_epoch_us(epoch_us: int) -> str:
+    """Inverse of to_epoch_us"""
+    seconds, micros = divmod(epoch_us, 1_000_000)
+    return datetime.fromtimestamp(seconds).replace(microsecond=micros).isoformat()
+
+
+def anonymize_user(user_id: str) -> str:
+    """Stable short hash of a user id, for reports that must not leak session ids"""
+    return hashlib.sha256(user_id.encode()).hexdigest()[:12]
+
+
+class MessageRecord:
+    """Compact stored message: slots, interned role/model strings and an integer timestamp"""
+
+    __slots__ = ('id', 'role', 'content', 'timestamp_us', 'model')
+
+    def __init__(self, message_id: int, role: str, content: str, timestamp_us: int, model: str = None):
+        self.id = message_id
+        self.role = sys.intern(role)
+        self.content = content
+        self.timestamp_us = timestamp_us
+        self.model = sys.intern(model) if model is not None else None
+
+    @classmethod
+    def from_dict(cls, message_id: int, message: dict) -> 'MessageRecord':
+        return cls(message_id, message['role'], message['content'], to_epoch_us(message['timestamp']),
+                   message.get('model'))
+
+    def to_dict(self) -> dict:
+        message = {'id': self.id, 'role': self.role, 'content': self.content,
+                   'timestamp': from_epoch_us(self.timestamp_us)}
+        if self.model is not None:
+            message['model'] = self.model
+        return message
+
+    def size(self) -> int:
+        """Bytes owned by this record; the interned role and model strings are shared"""
+        return sys.getsizeof(self) + sys.getsizeof(self.content) + sys.getsizeof(self.timestamp_us)
+
+
+def summarize_chat(chat: dict) -> dict:
+    """Sidebar summary of a chat"""
+    return {
+        'id': chat['id'],
+        'title': chat['title'],
+        'preview': chat['preview'],
+        'created_at': chat['created_at'],
+        'updated_at': chat['updated_at'],
+        'message_count': chat['message_count']
+    }
+
+
+class InMemoryChatStore(ChatStore):
+    """Process-local store with LRU and idle-TTL eviction of whole users.
+
+    Each user keeps a list of (updated_at, chat_id) sorted by recency, so
+    listing a page of chats is a bisect plus a slice.
+    """
+
+    backend = 'memory'
+
+    def __init__(self, max_users: int = 10000, ttl_seconds: float = None):
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self._users = OrderedDict()  # user_id -> {'chats', 'recency': [(updated_at, chat_id)], 'profile', 'last_access'}
+        self._pinned = {}  # user_id -> pin count; pinned users are never evicted
+        self._lock = threading.RLock()
+
+    def _user(self, user_id: str, create: bool = False):
+        now = time.monotonic()
+        self._evict(now)
+        user = self._users.get(user_id)
+        if user is None:
+            if not create:
+                return None
+            user = {'chats': {}, 'recency': [], 'profile': None, 'last_access': now}
+            self._users[user_id] = user
+        user['last_access'] = now
+        self._users.move_to_end(user_id)
+        return user
+
+    def _evict(self, now: float):
+        excess = len(self._users) - self.max_users
+        evicted = []
+        # Least recently used first, so the idle users come first too
+        for user_id, user in self._users.items():
+            expired = self.ttl_seconds is not None and now - user['last_access'] > self.ttl_seconds
+            if excess <= len(evicted) and not expired:
+                break
+            if user_id not in self._pinned:
+                evicted.append(user_id)
+        for user_id in evicted:
+            del self._users[user_id]
+
+    def _chat(self, user_id: str, chat_id: str):
+        user = self._user(user_id)
+        return user['chats'].get(chat_id) if user else None
+
+    @staticmethod
+    def _touch(user: dict, chat: dict, updated_at: str):
+        """Set updated_at and move the chat to its new place in the recency list"""
+        recency = user['recency']
+        old_key = (chat['updated_at'], chat['id'])
+        index = bisect.bisect_left(recency, old_key)
+        if index < len(recency) and recency[index] == old_key:
+            del recency[index]
+        chat['updated_at'] = updated_at
+        bisect.insort(recency, (updated_at, chat['id']))
+
+    @staticmethod
+    def _copy(chat: dict, message_limit: int = None) -> dict:
+        messages = chat['messages']
+        if message_limit is not None:
+            # Not [-message_limit:], which is the whole list for 0
+            messages = messages[max(0, len(messages) - message_limit):]
+        copy = dict(chat, messages=[record.to_dict() for record in messages])
+        del copy['message_bytes']
+        return copy
+
+    def create_chat(self, user_id, chat_id, title, created_at):
+        chat = {
+            'id': chat_id,
+            'title': title,
+            'messages': [],  # MessageRecords
+            'created_at': created_at,
+            'updated_at': created_at,
+            'user_id': user_id,
+            'preview': '',
+            'message_count': 0,
+            'message_bytes': 0
+        }
+        with self._lock:
+            user = self._user(user_id, create=True)
+            user['chats'][chat_id] = chat
+            bisect.insort(user['recency'], (created_at, chat_id))
+            return self._copy(chat)
+
+    def get_chat(self, user_id, chat_id, message_limit=None):
+        with self._lock:
+            chat = self._chat(user_id, chat_id)
+            return self._copy(chat, message_limit) if chat else None
+
+    def has_chat(self, user_id, chat_id):
+        with self._lock:
+            return self._chat(user_id, chat_id) is not None
+
+    def get_message(self, user_id, chat_id, position):
+        with self._lock:
+            chat = self._chat(user_id, chat_id)
+            if chat is None or not 0 <= position < len(chat['messages']):
+                return None
+            return chat['messages'][position].to_dict()
+
+    def get_messages(self, user_id, chat_id, before=None, limit=50, after=None):
+        with self._lock:
+            chat = self._chat(user_id, chat_id)
+            if chat is None:
+                return None
+            if after is not None:
+                return [record.to_dict() for record in chat['messages'][max(0, after):max(0, after) + limit]]
+            # Message ids are 1-based positions, so id < before ends at index before - 1
+            end = len(chat['messages']) if before is None else max(0, min(before - 1, len(chat['messages'])))
+            return [record.to_dict() for record in chat['messages'][max(0, end - limit):end]]
+
+    def append_message(self, user_id, chat_id, message):
+        with self._lock:
+            chat = self._chat(user_id, chat_id)
+            if chat is None:
+                return None
+            message_id = len(chat['messages']) + 1
+            record = MessageRecord.from_dict(message_id, message)
+            chat['messages'].append(record)
+            chat['message_bytes'] += record.size()
+            chat['message_count'] += 1
+            if not chat['preview'] and message['role'] == 'user':
+                chat['preview'] = make_preview(message['content'])
+            self._touch(self._users[user_id], chat, message['timestamp'])
+            return message_id
+
+    def update_chat(self, user_id, chat_id, **fields):
+        with self._lock:
+            chat = self._chat(user_id, chat_id)
+            if chat is None:
+                return False
+            if 'title' in fields:
+                chat['title'] = fields['title']
+            if 'updated_at' in fields:
+                self._touch(self._users[user_id], chat, fields['updated_at'])
+            return True
+
+    def list_chats(self, user_id, limit=None, before=None):
+        with self._lock:
+            user = self._user(user_id)
+            if not user:
+                return []
+            recency = user['recency']
+            end = bisect.bisect_left(recency, tuple(before)) if before else len(recency)
+            start = 0 if limit is None else max(0, end - limit)
+            return [summarize_chat(user['chats'][chat_id]) for _, chat_id in reversed(recency[start:end])]
+
+    def search_chats(self, user_id, query):
+        query = query.lower()
+        with self._lock:
+            user = self._user(user_id)
+            if not user:
+                return []
+
+            matching_chats = []
+            for chat_data in user['chats'].values():
+                # Search in title and messages
+                if query in chat_data['title'].lower():
+                    matching_chats.append(self._copy(chat_data))
+                    continue
+
+                # Search in message content
+                for record in chat_data['messages']:
+                    if query in record.content.lower():
+                        matching_chats.append(self._copy(chat_data))
+                        break
+            return matching_chats
+
+    def delete_chat(self, user_id, chat_id):
+        with self._lock:
+            user = self._user(user_id)
+            if not user or chat_id not in user['chats']:
+                return False
+            chat = user['chats'].pop(chat_id)
+            key = (chat['updated_at'], chat_id)
+            index = bisect.bisect_left(user['recency'], key)
+            if index < len(user['recency']) and user['recency'][index] == key:
+                del user['recency'][index]
+            return True
+
+    def get_profile(self, user_id):
+        with self._lock:
+            user = self._user(user_id)
+            profile = user['profile'] if user else None
+            return dict(profile, preferences=dict(profile['preferences'])) if profile else None
+
+    def save_profile(self, user_id, profile):
+        with self._lock:
+            self._user(user_id, create=True)['profile'] = dict(profile, preferences=dict(profile.get('preferences', {})))
+
+    def has_user(self, user_id: str) -> bool:
+        with self._lock:
+            return self._user(user_id) is not None
+
+    def pin(self, user_id: str) -> bool:
+        """Keep the user from being evicted until unpin(); False if the user is not in the store"""
+        with self._lock:
+            if self._user(user_id) is None:
+                return False
+            self._pinned[user_id] = self._pinned.get(user_id, 0) + 1
+            return True
+
+    def unpin(self, user_id: str):
+        with self._lock:
+            self._pinned[user_id] -= 1
+            if not self._pinned[user_id]:
+                del self._pinned[user_id]
+
+    def load_user(self, user_id: str, chats: list, profile=None):
+        """Install a user's chats (dicts with all their messages) and profile, e.g. read from a durable store.
+
+        Messages are renumbered by position, which keeps the ids of a chat
+        whose messages were all appended through this store.
+        """
+        loaded = []
+        for chat in chats:
+            records = [MessageRecord.from_dict(number, message) for number, message in enumerate(chat['messages'], 1)]
+            loaded.append(dict(
+                {key: chat[key] for key in ('id', 'title', 'created_at', 'updated_at', 'user_id', 'preview')},
+                messages=records,
+                message_count=len(records),
+                message_bytes=sum(record.size() for record in records)
+            ))
+        with self._lock:
+            user = self._user(user_id, create=True)
+            for chat in loaded:
+                user['chats'][chat['id']] = chat
+                bisect.insort(user['recency'], (chat['updated_at'], chat['id']))
+            if profile is not None:
+                user['profile'] = dict(profile, preferences=dict(profile.get('preferences', {})))
+
+    @staticmethod
+    def _chat_bytes(chat: dict) -> int:
+        """Bytes of a chat: its dict, metadata strings, message list and message records"""
+        size = sys.getsizeof(chat) + sys.getsizeof(chat['messages']) + chat['message_bytes']
+        for key in ('id', 'title', 'created_at', 'updated_at', 'preview'):
+            size += sys.getsizeof(chat[key])
+        return size
+
+    def memory_report(self, user_id=None, top=10):
+        with self._lock:
+            users = []
+            current = None
+            for uid, user in self._users.items():
+                chats = [(chat, self._chat_bytes(chat)) for chat in user['chats'].values()]
+                row = {
+                    'user': anonymize_user(uid),
+                    'chats': len(chats),
+                    'messages': sum(chat['message_count'] for chat, _ in chats),
+                    # The recency list holds one (updated_at, id) tuple per chat
+                    'bytes': sum(size for _, size in chats) + sys.getsizeof(user['recency']) + 64 * len(chats)
+                }
+                users.append(row)
+                if uid == user_id:
+                    current = dict(row, chat_bytes=[
+                        {'id': chat['id'], 'title': chat['title'], 'messages': chat['message_count'], 'bytes': size}
+                        for chat, size in sorted(chats, key=lambda item: item[1], reverse=True)
+                    ])
+        return build_memory_report(self.backend, users, current, top)
+
+
+class SQLiteChatStore(ChatStore):
+    """SQLite-backed store in WAL mode; messages are rows, so appends are single inserts"""
+
+    backend = 'sqlite'
+    shared = True
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS chats (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            title TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            preview TEXT NOT NULL DEFAULT '',
+            message_count INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_chats_user_updated ON chats (user_id, updated_at, id);
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id TEXT NOT NULL REFERENCES chats (id) ON DELETE CASCADE,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            model TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_messages_chat ON messages (chat_id, id);
+        CREATE TABLE IF NOT EXISTS profiles (
+            user_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS user_revisions (
+            user_id TEXT PRIMARY KEY,
+            revision INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS chat_summaries (
+            chat_id TEXT PRIMARY KEY REFERENCES chats (id) ON DELETE CASCADE,
+            summary TEXT NOT NULL,
+            through_id INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS journal_checkpoint (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            seq INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, path: str = 'chats.db'):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+            self._migrate(conn)
+
+    def _migrate(self, conn):
+        """Add and backfill summary columns on databases created before they existed"""
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(chats)')}
+        if 'preview' in columns:
+            return
+        conn.execute("ALTER TABLE chats ADD COLUMN preview TEXT NOT NULL DEFAULT ''")
+        conn.execute('ALTER TABLE chats ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0')
+        conn.execute('UPDATE chats SET message_count = (SELECT COUNT(*) FROM messages m WHERE m.chat_id = chats.id)')
+        rows = conn.execute(
+            """
+            SELECT c.id, (SELECT content FROM messages m
+                           WHERE m.chat_id = c.id AND m.role = 'user' ORDER BY m.id LIMIT 1) AS first_user_message
+              FROM chats c
+            """
+        ).fetchall()
+        conn.executemany(
+            'UPDATE chats SET preview = ? WHERE id = ?',
+            [(make_preview(row['first_user_message'] or ''), row['id']) for row in rows]
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _bump(conn, user_id):
+        conn.execute(
+            'INSERT INTO user_revisions (user_id, revision) VALUES (?, 1) '
+            'ON CONFLICT (user_id) DO UPDATE SET revision = revision + 1',
+            (user_id,)
+        )
+
+    @staticmethod
+    def _message(row) -> dict:
+        message = {'id': row['id'], 'role': row['role'], 'content': row['content'], 'timestamp': row['timestamp']}
+        if row['model'] is not None:
+            message['model'] = row['model']
+        return message
+
+    def _messages(self, conn, chat_id, message_limit=None) -> list:
+        if message_limit is None:
+            rows = conn.execute(
+                'SELECT * FROM messages WHERE chat_id = ? ORDER BY id', (chat_id,)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                'SELECT * FROM messages WHERE chat_id = ? ORDER BY id DESC LIMIT ?', (chat_id, message_limit)
+            ).fetchall()[::-1]
+        return [self._message(row) for row in rows]
+
+    def _chat(self, conn, row, message_limit=None) -> dict:
+        return {
+            'id': row['id'],
+            'title': row['title'],
+            'messages': self._messages(conn, row['id'], message_limit),
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
+            'user_id': row['user_id'],
+            'preview': row['preview'],
+            'message_count': row['message_count']
+        }
+
+    def _create_chat(self, conn, user_id, chat_id, title, created_at, ignore_existing=False):
+        conn.execute(
+            f'INSERT {"OR IGNORE " if ignore_existing else ""}INTO chats '
+            '(id, user_id, title, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+            (chat_id, user_id, title, created_at, created_at)
+        )
+        self._bump(conn, user_id)
+
+    def _append_message(self, conn, user_id, chat_id, message):
+        preview = make_preview(message['content']) if message['role'] == 'user' else ''
+        cursor = conn.execute(
+            """
+            UPDATE chats
+               SET updated_at = ?,
+                   message_count = message_count + 1,
+                   preview = CASE WHEN preview = '' THEN ? ELSE preview END
+             WHERE id = ? AND user_id = ?
+            """,
+            (message['timestamp'], preview, chat_id, user_id)
+        )
+        if cursor.rowcount == 0:
+            return None
+        cursor = conn.execute(
+            'INSERT INTO messages (chat_id, role, content, timestamp, model) VALUES (?, ?, ?, ?, ?)',
+            (chat_id, message['role'], message['content'], message['timestamp'], message.get('model'))
+        )
+        self._bump(conn, user_id)
+        return cursor.lastrowid
+
+    def _update_chat(self, conn, user_id, chat_id, fields):
+        updates = {key: fields[key] for key in ('title', 'updated_at') if key in fields}
+        assignments = ', '.join(f'{key} = ?' for key in updates)
+        cursor = conn.execute(
+            f'UPDATE chats SET {assignments} WHERE id = ? AND user_id = ?',
+            (*updates.values(), chat_id, user_id)
+        )
+        if cursor.rowcount:
+            self._bump(conn, user_id)
+        return cursor.rowcount > 0
+
+    def _delete_chat(self, conn, user_id, chat_id):
+        cursor = conn.execute('DELETE FROM chats WHERE id = ? AND user_id = ?', (chat_id, user_id))
+        if cursor.rowcount:
+            self._bump(conn, user_id)
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def _save_profile(conn, user_id, profile):
+        conn.execute('INSERT OR REPLACE INTO profiles (user_id, data) VALUES (?, ?)', (user_id, json.dumps(profile)))
+
+    def create_chat(self, user_id, chat_id, title, created_at):
+        conn = self._connect()
+        with conn:
+            self._create_chat(conn, user_id, chat_id, title, created_at)
+        return {
+            'id': chat_id,
+            'title': title,
+            'messages': [],
+            'created_at': created_at,
+            'updated_at': created_at,
+            'user_id': user_id,
+            'preview': '',
+            'message_count': 0
+        }
+
+    def get_chat(self, user_id, chat_id, message_limit=None):
+        conn = self._connect()
+        row = conn.execute('SELECT * FROM chats WHERE id = ? AND user_id = ?', (chat_id, user_id)).fetchone()
+        return self._chat(conn, row, message_limit) if row else None
+
+    def has_chat(self, user_id, chat_id):
+        row = self._connect().execute(
+            'SELECT 1 FROM chats WHERE id = ? AND user_id = ?', (chat_id, user_id)
+        ).fetchone()
+        return row is not None
+
+    def get_message(self, user_id, chat_id, position):
+        if position < 0 or not self.has_chat(user_id, chat_id):
+            return None
+        row = self._connect().execute(
+            'SELECT * FROM messages WHERE chat_id = ? ORDER BY id LIMIT 1 OFFSET ?', (chat_id, position)
+        ).fetchone()
+        return self._message(row) if row else None
+
+    def get_messages(self, user_id, chat_id, before=None, limit=50, after=None):
+        if not self.has_chat(user_id, chat_id):
+            return None
+        sql = 'SELECT * FROM messages WHERE chat_id = ?'
+        params = [chat_id]
+        if after is not None:
+            rows = self._connect().execute(sql + ' AND id > ? ORDER BY id LIMIT ?', (chat_id, after, limit)).fetchall()
+            return [self._message(row) for row in rows]
+        if before is not None:
+            sql += ' AND id < ?'
+            params.append(before)
+        sql += ' ORDER BY id DESC LIMIT ?'
+        params.append(limit)
+        rows = self._connect().execute(sql, params).fetchall()[::-1]
+        return [self._message(row) for row in rows]
+
+    def append_message(self, user_id, chat_id, message):
+        conn = self._connect()
+        with conn:
+            return self._append_message(conn, user_id, chat_id, message)
+
+    def update_chat(self, user_id, chat_id, **fields):
+        if not any(key in fields for key in ('title', 'updated_at')):
+            return self.has_chat(user_id, chat_id)
+        conn = self._connect()
+        with conn:
+            return self._update_chat(conn, user_id, chat_id, fields)
+
+    def list_chats(self, user_id, limit=None, before=None):
+        sql = 'SELECT * FROM chats WHERE user_id = ?'
+        params = [user_id]
+        if before:
+            sql += ' AND (updated_at, id) < (?, ?)'
+            params.extend(before)
+        sql += ' ORDER BY updated_at DESC, id DESC'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        rows = self._connect().execute(sql, params).fetchall()
+        return [summarize_chat(dict(row)) for row in rows]
+
+    def search_chats(self, user_id, query):
+        escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        pattern = f"%{escaped}%"
+        conn = self._connect()
+        rows = conn.execute(
+            """
+            SELECT * FROM chats c
+             WHERE c.user_id = ?
+               AND (c.title LIKE ? ESCAPE '\\'
+                    OR EXISTS (SELECT 1 FROM messages m
+                                WHERE m.chat_id = c.id AND m.content LIKE ? ESCAPE '\\'))
+            """,
+            (user_id, pattern, pattern)
+        ).fetchall()
+        return [self._chat(conn, row) for row in rows]
+
+    def delete_chat(self, user_id, chat_id):
+        conn = self._connect()
+        with conn:
+            return self._delete_chat(conn, user_id, chat_id)
+
+    def get_profile(self, user_id):
+        row = self._connect().execute('SELECT data FROM profiles WHERE user_id = ?', (user_id,)).fetchone()
+        return json.loads(row['data']) if row else None
+
+    def save_profile(self, user_id, profile):
+        conn = self._connect()
+        with conn:
+            self._save_profile(conn, user_id, profile)
+
+    def journal_checkpoint(self) -> int:
+        """Sequence number of the last write-behind journal entry applied by apply_journal()"""
+        row = self._connect().execute('SELECT seq FROM journal_checkpoint WHERE id = 0').fetchone()
+        return row['seq'] if row else 0
+
+    def apply_journal(self, entries: list):
+        """Apply write-behind journal entries in one transaction and advance the checkpoint to the last one.
+
+        Entries are dicts with seq, op (create, append, update, delete or
+        profile), user, and the op's arguments (see write_behind.py). The
+        checkpoint commits with the writes, so after a crash each entry is
+        applied exactly once when the journal is replayed.
+        """
+        conn = self._connect()
+        with conn:
+            for entry in entries:
+                op, user_id = entry['op'], entry['user']
+                if op == 'create':
+                    self._create_chat(conn, user_id, entry['chat'], entry['title'], entry['created_at'],
+                                      ignore_existing=True)
+                elif op == 'append':
+                    self._append_message(conn, user_id, entry['chat'], entry['message'])
+                elif op == 'update':
+                    self._update_chat(conn, user_id, entry['chat'], entry['fields'])
+                elif op == 'delete':
+                    self._delete_chat(conn, user_id, entry['chat'])
+                elif op == 'profile':
+                    self._save_profile(conn, user_id, entry['profile'])
+                else:
+                    raise ValueError(f"Unknown journal op: {op}")
+            conn.execute(
+                'INSERT OR REPLACE INTO journal_checkpoint (id, seq) VALUES (0, ?)', (entries[-1]['seq'],)
+            )
+
+    def revision(self, user_id):
+        row = self._connect().execute(
+            'SELECT revision FROM user_revisions WHERE user_id = ?', (user_id,)
+        ).fetchone()
+        return row['revision'] if row else 0
+
+    def get_summary(self, chat_id):
+        row = self._connect().execute(
+            'SELECT summary, through_id FROM chat_summaries WHERE chat_id = ?', (chat_id,)
+        ).fetchone()
+        return {'summary': row['summary'], 'through_id': row['through_id']} if row else None
+
+    def save_summary(self, chat_id, summary, through_id, previous_through_id=0):
+        conn = self._connect()
+        try:
+            with conn:
+                # Compare-and-set: a fold that started from an older summary must not replace a newer one
+                cursor = conn.execute(
+                    """INSERT INTO chat_summaries (chat_id, summary, through_id) VALUES (?, ?, ?)
+                       ON CONFLICT (chat_id) DO UPDATE SET summary = excluded.summary, through_id = excluded.through_id
+                       WHERE chat_summaries.through_id = ?""",
+                    (chat_id, summary, through_id, previous_through_id)
+                )
+        except sqlite3.IntegrityError:
+            return False  # The chat was deleted meanwhile
+        return cursor.rowcount == 1
+
+    # Stored bytes of a message row: its text columns plus SQLite's per-row overhead
+    MESSAGE_BYTES_SQL = """
+        COALESCE(SUM(LENGTH(CAST(m.content AS BLOB)) + LENGTH(m.timestamp) + LENGTH(m.role)
+                     + COALESCE(LENGTH(m.model), 0) + 16), 0)
+    """
+    CHAT_BYTES_SQL = "LENGTH(c.id) + LENGTH(c.user_id) + LENGTH(CAST(c.title AS BLOB)) + LENGTH(c.created_at) * 2 + 64"
+
+    def memory_report(self, user_id=None, top=10):
+        conn = self._connect()
+        rows = conn.execute(
+            f"""
+            SELECT c.user_id, c.id, c.title, c.message_count,
+                   {self.CHAT_BYTES_SQL} + (SELECT {self.MESSAGE_BYTES_SQL} FROM messages m WHERE m.chat_id = c.id) AS bytes
+              FROM chats c
+            """
+        ).fetchall()
+        users = {}
+        current_chats = []
+        for row in rows:
+            entry = users.setdefault(row['user_id'], {
+                'user': anonymize_user(row['user_id']), 'chats': 0, 'messages': 0, 'bytes': 0
+            })
+            entry['chats'] += 1
+            entry['messages'] += row['message_count']
+            entry['bytes'] += row['bytes']
+            if row['user_id'] == user_id:
+                current_chats.append({
+                    'id': row['id'], 'title': row['title'], 'messages': row['message_count'], 'bytes': row['bytes']
+                })
+        current = None
+        if user_id in users:
+            current = dict(users[user_id], chat_bytes=sorted(current_chats, key=lambda chat: chat['bytes'], reverse=True))
+        report = build_memory_report(self.backend, list(users.values()), current, top)
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        report['file_bytes'] = conn.execute('PRAGMA page_count').fetchone()[0] * page_size
+        return report
+
+
+def build_memory_report(backend: str, users: list, current, top: int) -> dict:
+    """Assemble a memory_report() from per-user rows of {'user', 'chats', 'messages', 'bytes'}"""
+    total_bytes = sum(row['bytes'] for row in users)
+    total_messages = sum(row['messages'] for row in users)
+    return {
+        'backend': backend,
+        'users': len(users),
+        'chats': sum(row['chats'] for row in users),
+        'messages': total_messages,
+        'bytes': total_bytes,
+        'bytes_per_user': round(total_bytes / len(users)) if users else 0,
+        'bytes_per_message': round(total_bytes / total_messages) if total_messages else 0,
+        'top_users': sorted(users, key=lambda row: row['bytes'], reverse=True)[:top],
+        'user': current
+    }
+
+
+def create_chat_store() -> ChatStore:
+    """Build the chat store selected by the CHAT_STORE environment variable"""
+    backend = os.getenv('CHAT_STORE', 'memory').lower()
+    path = os.getenv('CHAT_STORE_PATH', 'chats.db')
+    ttl = os.getenv('CHAT_STORE_TTL_SECONDS')
+    cache_options = {
+        'max_users': int(os.getenv('CHAT_STORE_MAX_USERS', '10000')),
+        'ttl_seconds': float(ttl) if ttl else None
+    }
+    if backend == 'sqlite':
+        return SQLiteChatStore(path)
+    if backend == 'memory':
+        return InMemoryChatStore(**cache_options)
+    if backend == 'journal':
+        from write_behind import WriteBehindChatStore
+        return WriteBehindChatStore(
+            SQLiteChatStore(path),
+            InMemoryChatStore(**cache_options),
+            journal_path=os.getenv('CHAT_JOURNAL_PATH', path + '.journal'),
+            batch_size=int(os.getenv('CHAT_JOURNAL_BATCH_SIZE', '256')),
+            commit_interval=float(os.getenv('CHAT_JOURNAL_COMMIT_MS', '20')) / 1000,
+            load_timeout=float(os.getenv('CHAT_JOURNAL_LOAD_TIMEOUT_SECONDS', '10'))
+        )
+    raise ValueError(f"Unknown CHAT_STORE backend: {backend}")
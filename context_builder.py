@@ -0,0 +1,429 @@
+"""Token-budgeted conversation context shared by the agent and direct Groq paths.
+
+For each chat the builder keeps a rolling summary plus a "summarized through"
+message id. Every message newer than that id goes into the prompt verbatim
+as long as it fits the model's token budget. When it no longer fits, the
+oldest verbatim turns are folded into the summary until the rest fit within
+a low-water mark. This leaves headroom for the next few turns, so the
+summary is extended in batches instead of being regenerated every turn.
+prefold() does the same fold after a reply, on a background task, once the
+history passes PREFOLD_RATIO of the budget, so the next turn usually finds
+it done instead of waiting for the summarizer.
+
+Token counts are estimated per model family and cached per message.
+
+Between folds the window only grows at the end. A per-chat PromptPrefix
+keeps the formatted messages of the previous turn, so each turn formats and
+counts only the messages stored since then. The prompt therefore starts with
+the same bytes as the previous turn's, which lets upstream prefix caches
+reuse it. Each window reports its size in bytes and tokens and how much of it
+repeats the previous turn (PROMPT_PREFIX_CACHE=false turns the cache off).
+
+Summaries live in process memory unless a state store is given. With a
+shared chat store (WORKER_MODE=multi) they are read from and written back to
+the store, so every worker continues the same summary. Either way a fold is
+stored only if the summary it started from is still current, so a slow
+prefold() never replaces the newer fold of a turn.
+"""
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    import tiktoken
+except ImportError:  # Optional: falls back to a characters-per-token estimate
+    tiktoken = None
+
+# Context window sizes of the models in AVAILABLE_MODELS
+MODEL_CONTEXT_WINDOWS = {
+    'llama3-8b-8192': 8192,
+    'llama3-70b-8192': 8192,
+    'mixtral-8x7b-32768': 32768,
+    'gemma-7b-it': 8192,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Average characters per token of each family's tokenizer on English text
+CHARS_PER_TOKEN = {
+    'llama3': 4.0,
+    'mixtral': 3.5,
+    'gemma': 4.0,
+}
+DEFAULT_CHARS_PER_TOKEN = 3.5
+
+# Per-message formatting overhead (role markers, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Tokens kept free for the reply, the system prompt and tool definitions
+RESPONSE_RESERVE_TOKENS = 1024
+PROMPT_RESERVE_TOKENS = 512
+
+# After folding, keep verbatim turns within this fraction of the budget
+LOW_WATER_RATIO = 0.6
+
+# prefold() folds once history and summary pass this fraction of the budget
+PREFOLD_RATIO = 0.8
+
+SUMMARY_MAX_TOKENS = 400
+
+
+def model_family(model_name: str) -> str:
+    """Tokenizer family of a model, e.g. 'llama3' for 'llama3-70b-8192'"""
+    for family in CHARS_PER_TOKEN:
+        if model_name.startswith(family):
+            return family
+    return 'default'
+
+
+class TokenCounter:
+    """Per-model token estimates with a bounded per-message cache"""
+
+    def __init__(self, max_cached: int = 100000):
+        self.max_cached = max_cached
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._encoding = tiktoken.get_encoding('cl100k_base') if tiktoken else None
+
+    def count_text(self, text: str, model_name: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        ratio = CHARS_PER_TOKEN.get(model_family(model_name), DEFAULT_CHARS_PER_TOKEN)
+        return math.ceil(len(text) / ratio)
+
+    def count_message(self, chat_id: str, message: dict, model_name: str) -> int:
+        """Token count of a stored message, computed once per model family"""
+        key = (chat_id, message.get('id'), model_family(model_name))
+        if key[1] is not None:
+            with self._lock:
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    return cached
+
+        tokens = self.count_text(message['content'], model_name) + MESSAGE_OVERHEAD_TOKENS
+
+        if key[1] is not None:
+            with self._lock:
+                self._cache[key] = tokens
+                while len(self._cache) > self.max_cached:
+                    self._cache.popitem(last=False)
+        return tokens
+
+
+def message_bytes(message: dict) -> int:
+    """Serialized size of a prompt message in a JSON request body"""
+    return len(json.dumps(message, ensure_ascii=False, separators=(',', ':')).encode())
+
+
+class ContextWindow:
+    """Result of ContextBuilder.build()"""
+
+    def __init__(self, summary: str, messages: list, tokens: int, size: int = 0,
+                 prefix_tokens: int = 0, prefix_bytes: int = 0):
+        self.summary = summary
+        self.messages = messages  # Chronological, role-tagged, ending with the current user message
+        self.tokens = tokens
+        self.bytes = size
+        # Leading part of the window (summary, then messages) identical to the previous turn's
+        self.prefix_tokens = prefix_tokens
+        self.prefix_bytes = prefix_bytes
+
+    @property
+    def history(self) -> list:
+        """Messages before the current one"""
+        return self.messages[:-1]
+
+
+class PromptPrefix:
+    """Formatted messages of one chat after its summarized point, extended turn by turn.
+
+    Valid while the chat's summary and the model family are unchanged; each
+    turn then formats only the messages stored since the previous turn. A
+    cached prefix is never changed: build() extends a copy, so prefold() can
+    read it from a background task without a lock.
+    """
+
+    __slots__ = ('summary', 'through_id', 'family', 'stored', 'messages', 'tokens', 'bytes')
+
+    def __init__(self, summary: str, through_id: int, family: str):
+        self.summary = summary
+        self.through_id = through_id
+        self.family = family
+        self.stored = []    # Stored message dicts, oldest first
+        self.messages = []  # Their {'role', 'content'} prompt form
+        self.tokens = 0
+        self.bytes = 0
+
+    def extend(self, messages, count):
+        for message in messages:
+            formatted = {'role': message['role'], 'content': message['content']}
+            self.stored.append(message)
+            self.messages.append(formatted)
+            self.tokens += count(message)
+            self.bytes += message_bytes(formatted)
+
+    def extended(self, messages, count) -> 'PromptPrefix':
+        """Copy of this prefix with messages appended"""
+        prefix = PromptPrefix(self.summary, self.through_id, self.family)
+        prefix.stored = list(self.stored)
+        prefix.messages = list(self.messages)
+        prefix.tokens = self.tokens
+        prefix.bytes = self.bytes
+        prefix.extend(messages, count)
+        return prefix
+
+    def newer(self, messages: list):
+        """Messages after this prefix's last one, or None if it is not among them"""
+        last_id = self.stored[-1].get('id') if self.stored else None
+        if last_id is None:
+            return None
+        for index in range(len(messages) - 1, -1, -1):
+            if messages[index].get('id') == last_id:
+                return messages[index + 1:]
+        return None
+
+
+class ContextBuilder:
+    """Builds token-budgeted context windows and maintains rolling summaries"""
+
+    def __init__(self, summarizer, budget: int = None, max_chats: int = 10000, state_store=None,
+                 prefix_cache: bool = None, max_prefixes: int = None):
+        # summarizer(previous_summary, messages, model_name) -> new summary text
+        self.summarizer = summarizer
+        # Optional ChatStore with get_summary()/save_summary(), shared by every worker
+        self.state_store = state_store
+        self.budget = budget or int(os.getenv('CONTEXT_TOKEN_BUDGET', '3000'))
+        self.max_chats = max_chats
+        if prefix_cache is None:
+            prefix_cache = os.getenv('PROMPT_PREFIX_CACHE', 'true').lower() == 'true'
+        self.prefix_cache = prefix_cache
+        self.max_prefixes = max_prefixes or int(os.getenv('PROMPT_PREFIX_CACHE_CHATS', '2000'))
+        self.prefix_hits = 0
+        self.prefix_misses = 0
+        self.folds = 0     # Folds done by build(), on the request path
+        self.prefolds = 0  # Folds done ahead of time by prefold()
+        self.counter = TokenCounter()
+        self._summaries = OrderedDict()  # chat_id -> {'summary': str, 'through_id': int}
+        self._prefixes = OrderedDict()   # chat_id -> PromptPrefix
+        self._lock = threading.Lock()
+
+    def budget_for(self, model_name: str) -> int:
+        """Token budget for verbatim history plus summary"""
+        window = MODEL_CONTEXT_WINDOWS.get(model_name, DEFAULT_CONTEXT_WINDOW)
+        return min(self.budget, window - RESPONSE_RESERVE_TOKENS - PROMPT_RESERVE_TOKENS)
+
+    def _state(self, chat_id: str) -> dict:
+        if self.state_store is not None:
+            return self.state_store.get_summary(chat_id) or {'summary': '', 'through_id': 0}
+        with self._lock:
+            state = self._summaries.get(chat_id)
+            if state is None:
+                state = self._summaries[chat_id] = {'summary': '', 'through_id': 0}
+                while len(self._summaries) > self.max_chats:
+                    self._summaries.popitem(last=False)
+            self._summaries.move_to_end(chat_id)
+            return state
+
+    def _prefix(self, chat_id: str, state: dict, family: str):
+        """The chat's cached prefix if it still matches its summary state and model family"""
+        if not self.prefix_cache:
+            return None
+        with self._lock:
+            prefix = self._prefixes.get(chat_id)
+            if prefix is None:
+                return None
+            self._prefixes.move_to_end(chat_id)
+        if (prefix.summary, prefix.through_id, prefix.family) != (state['summary'], state['through_id'], family):
+            return None
+        return prefix
+
+    def _save_prefix(self, chat_id: str, prefix: PromptPrefix):
+        if not self.prefix_cache:
+            return
+        with self._lock:
+            self._prefixes[chat_id] = prefix
+            self._prefixes.move_to_end(chat_id)
+            while len(self._prefixes) > self.max_prefixes:
+                self._prefixes.popitem(last=False)
+
+    def forget(self, chat_id: str):
+        """Drop the summary state and cached prefix of a deleted chat"""
+        with self._lock:
+            self._summaries.pop(chat_id, None)
+            self._prefixes.pop(chat_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'prefix_cache': self.prefix_cache,
+                'cached_chats': len(self._prefixes),
+                'prefix_hits': self.prefix_hits,
+                'prefix_misses': self.prefix_misses,
+                'folds': self.folds,
+                'prefolds': self.prefolds
+            }
+
+    def _unsummarized(self, chat: dict, state: dict, budget: int, count, fetch_older) -> list:
+        """Stored messages after the summarized point, oldest first, stopping once well past the budget"""
+        pending = []
+        pending_tokens = 0
+        messages = list(chat['messages'])
+        while True:
+            for message in reversed(messages):
+                if message.get('id') is not None and message['id'] <= state['through_id']:
+                    break
+                pending.append(message)
+                pending_tokens += count(message)
+            else:
+                if messages and pending_tokens <= 2 * budget and messages[0].get('id', 1) > 1:
+                    messages = fetch_older(messages[0]['id'], 50)
+                    if messages:
+                        continue
+            break
+        pending.reverse()
+        return pending
+
+    def _fold(self, state: dict, pending: list, pending_tokens: int, summary_tokens: int, budget: int,
+              model_name: str, count) -> tuple:
+        """Fold the oldest pending turns into the summary until the rest fit under the low-water mark.
+
+        Returns the new state and the remaining messages and their tokens.
+        """
+        target = int(budget * LOW_WATER_RATIO) - min(summary_tokens, SUMMARY_MAX_TOKENS)
+        pending = list(pending)
+        fold = []
+        while len(pending) > 1 and pending_tokens > target:
+            message = pending.pop(0)
+            pending_tokens -= count(message)
+            fold.append(message)
+
+        summary = self.summarizer(state['summary'], fold, model_name)
+        through_id = fold[-1]['id'] if fold[-1].get('id') is not None else state['through_id']
+        return {'summary': summary, 'through_id': through_id}, pending, pending_tokens
+
+    def _commit(self, chat_id: str, previous: dict, state: dict) -> bool:
+        """Store a folded state unless another fold replaced previous meanwhile (or the chat was forgotten)"""
+        if self.state_store is not None:
+            return self.state_store.save_summary(chat_id, state['summary'], state['through_id'],
+                                                 previous['through_id'])
+        with self._lock:
+            if self._summaries.get(chat_id) is not previous:
+                return False
+            self._summaries[chat_id] = state
+            return True
+
+    def prefold(self, chat: dict, model_name: str, fetch_older) -> bool:
+        """Fold the summary ahead of the next turn once the chat's history passes PREFOLD_RATIO of the budget.
+
+        Meant to run after a reply, on a background task, so that build()
+        seldom has to wait for the summarizer. It takes no chat lock: the
+        result is only stored if no other fold happened meanwhile, and a turn
+        built concurrently keeps its own consistent summary. Returns whether
+        it folded.
+        """
+        chat_id = chat['id']
+        budget = self.budget_for(model_name)
+        state = self._state(chat_id)
+        family = model_family(model_name)
+        count = lambda message: self.counter.count_message(chat_id, message, model_name)
+
+        # Cached prefixes are never changed, so this one can be read while a turn builds on it
+        prefix = self._prefix(chat_id, state, family)
+        newer = prefix.newer(chat['messages']) if prefix is not None else None
+        if newer is not None:
+            pending = prefix.stored + newer
+            pending_tokens = prefix.tokens + sum(count(message) for message in newer)
+        else:
+            pending = self._unsummarized(chat, state, budget, count, fetch_older)
+            pending_tokens = sum(count(message) for message in pending)
+        summary_tokens = self.counter.count_text(state['summary'], model_name) if state['summary'] else 0
+
+        if pending_tokens + summary_tokens <= budget * PREFOLD_RATIO or len(pending) < 2:
+            return False
+        folded, pending, _ = self._fold(state, pending, pending_tokens, summary_tokens, budget, model_name, count)
+        if not self._commit(chat_id, state, folded):
+            return False
+
+        prefix = PromptPrefix(folded['summary'], folded['through_id'], family)
+        prefix.extend(pending, count)
+        self._save_prefix(chat_id, prefix)
+        with self._lock:
+            self.prefolds += 1
+        return True
+
+    def build(self, chat: dict, model_name: str, fetch_older) -> ContextWindow:
+        """Build the context window for a chat whose last message is the current user turn.
+
+        fetch_older(before_id, limit) returns the stored messages older than
+        before_id (oldest first) and is used when chat['messages'] does not
+        reach back to the summarized point.
+
+        The window is append-only between summary folds: it starts with the
+        same messages, formatted the same way, as the previous turn's window,
+        so upstream prefix caches can reuse them.
+        """
+        chat_id = chat['id']
+        budget = self.budget_for(model_name)
+        state = self._state(chat_id)
+        family = model_family(model_name)
+        count = lambda message: self.counter.count_message(chat_id, message, model_name)
+
+        prefix = self._prefix(chat_id, state, family)
+        newer = prefix.newer(chat['messages']) if prefix is not None else None
+        reused = newer is not None
+        if reused:
+            prefix_tokens, prefix_bytes = prefix.tokens, prefix.bytes
+            prefix = prefix.extended(newer, count)
+        else:
+            prefix = PromptPrefix(state['summary'], state['through_id'], family)
+            prefix.extend(self._unsummarized(chat, state, budget, count, fetch_older), count)
+
+        pending = prefix.stored
+        pending_tokens = prefix.tokens
+        summary_tokens = self.counter.count_text(state['summary'], model_name) if state['summary'] else 0
+
+        if pending_tokens + summary_tokens > budget and len(pending) > 1:
+            previous = state
+            state, pending, pending_tokens = self._fold(state, pending, pending_tokens, summary_tokens,
+                                                        budget, model_name, count)
+            self._commit(chat_id, previous, state)
+            summary_tokens = self.counter.count_text(state['summary'], model_name)
+            with self._lock:
+                self.folds += 1
+
+            # The summary opens the prompt, so the next turns build on a new prefix
+            prefix = PromptPrefix(state['summary'], state['through_id'], family)
+            prefix.extend(pending, count)
+            reused = False
+
+        self._save_prefix(chat_id, prefix)
+        with self._lock:
+            if reused:
+                self.prefix_hits += 1
+            else:
+                self.prefix_misses += 1
+
+        window_messages = list(prefix.messages)
+        summary_bytes = len(state['summary'].encode())
+        window_bytes = prefix.bytes + summary_bytes
+        if reused:
+            # The unchanged summary is part of the repeated prefix too
+            prefix_tokens += summary_tokens
+            prefix_bytes += summary_bytes
+        else:
+            prefix_tokens = prefix_bytes = 0
+
+        # A single oversized message is truncated to what remains of the budget
+        remaining = budget - summary_tokens - (pending_tokens - count(pending[-1]))
+        if window_messages and count(pending[-1]) > remaining:
+            ratio = CHARS_PER_TOKEN.get(family, DEFAULT_CHARS_PER_TOKEN)
+            max_chars = max(0, int(remaining * ratio))
+            truncated = dict(window_messages[-1], content=window_messages[-1]['content'][:max_chars])
+            window_bytes += message_bytes(truncated) - message_bytes(window_messages[-1])
+            window_messages[-1] = truncated
+            pending_tokens = pending_tokens - count(pending[-1]) + remaining
+
+        return ContextWindow(state['summary'], window_messages, pending_tokens + summary_tokens,
+                             window_bytes, prefix_tokens, prefix_bytes)
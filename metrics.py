@@ -0,0 +1,260 @@
+"""Latency instrumentation and Prometheus-style metrics.
+
+Timing spans wrap each stage of a chat request (agent construction, the
+agent run, every Groq round trip, tool calls, the fallback path). Their
+durations are recorded as histograms labeled by stage, model and path.
+Token usage from Groq responses is counted per model and path. render()
+produces the Prometheus text exposition format served by /metrics.
+
+When METRICS_TIMING_LOG is enabled, the spans of each request are also
+logged as one JSON line. The line is written through defer(), which app.py
+points at the background task queue. With METRICS_ENABLED=false, span()
+returns a shared no-op context manager and every record call returns
+immediately.
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_trace = contextvars.ContextVar('metrics_trace', default=None)
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    def __init__(self, registry, stage, labels):
+        self.registry = registry
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.record_span(self.stage, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms"""
+
+    def __init__(self, enabled: bool = True, timing_log: bool = False, buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.timing_log = timing_log
+        self.buckets = buckets
+        self._counters = {}    # name -> {label_key: value}
+        self._histograms = {}  # name -> {label_key: [bucket counts..., sum, count]}
+        self._help = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        # defer(fn, *args) runs fn(*args), now or later; app.py hands it to the background task queue
+        self.defer = lambda fn, *args: fn(*args)
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def add_collector(self, collector):
+        """Register a callable returning extra exposition lines at render time"""
+        self._collectors.append(collector)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            values = series.get(key)
+            if values is None:
+                values = series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    values[index] += 1
+            values[-2] += seconds
+            values[-1] += 1
+
+    def span(self, stage: str, **labels):
+        """Context manager timing one stage of the current request"""
+        if not self.enabled:
+            return NOOP_SPAN
+        return _Span(self, stage, labels)
+
+    def record_span(self, stage: str, seconds: float, **labels):
+        if not self.enabled:
+            return
+        self.observe('chat_stage_duration_seconds', seconds, stage=stage, **labels)
+        trace = _trace.get()
+        if trace is not None:
+            trace['spans'].append(dict(labels, stage=stage, ms=round(seconds * 1000, 2)))
+
+    def record_tokens(self, usage, **labels):
+        """Count prompt/completion tokens from a Groq usage object or dict"""
+        if not self.enabled or not usage:
+            return
+        get = usage.get if isinstance(usage, dict) else lambda key, default=0: getattr(usage, key, default)
+        for kind in ('prompt', 'completion'):
+            tokens = get(f'{kind}_tokens', 0) or 0
+            if tokens:
+                self.inc('groq_tokens_total', tokens, type=kind, **labels)
+        trace = _trace.get()
+        if trace is not None:
+            trace['tokens'] = trace.get('tokens', 0) + (get('total_tokens', 0) or 0)
+
+    def start_trace(self, **fields):
+        """Begin collecting spans for the current request"""
+        if self.enabled and self.timing_log:
+            return _trace.set(dict(fields, spans=[]))
+        return None
+
+    def finish_trace(self, token, **fields):
+        """Log the collected spans of the current request as one JSON line"""
+        if token is None:
+            return
+        trace = _trace.get()
+        try:
+            _trace.reset(token)
+        except ValueError:  # Finished in a different context than it started
+            _trace.set(None)
+        if trace is not None:
+            trace.update(fields)
+            self.defer(self._log_trace, trace)
+
+    @staticmethod
+    def _log_trace(trace: dict):
+        logger.info(f"request_timing {json.dumps(trace)}")
+
+    def render(self) -> str:
+        """Prometheus text exposition of every metric"""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    lines.append(f'# HELP {name} {self._help[name]}')
+                lines.append(f'# TYPE {name} counter')
+                for key, value in series.items():
+                    lines.append(f'{name}{_format_labels(key)} {value}')
+
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    lines.append(f'# HELP {name} {self._help[name]}')
+                lines.append(f'# TYPE {name} histogram')
+                for key, values in series.items():
+                    for bound, count in zip(self.buckets, values):
+                        lines.append(f'{name}_bucket{_format_labels(key, (("le", str(bound)),))} {count}')
+                    lines.append(f'{name}_bucket{_format_labels(key, (("le", "+Inf"),))} {values[-1]}')
+                    lines.append(f'{name}_sum{_format_labels(key)} {values[-2]}')
+                    lines.append(f'{name}_count{_format_labels(key)} {values[-1]}')
+
+        for collector in self._collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """Times each LLM round trip and tool call of an agent run and counts tokens"""
+
+    def __init__(self, registry: MetricsRegistry, model: str, path: str):
+        self.registry = registry
+        self.model = model
+        self.path = path
+        self._starts = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            self.registry.record_span('llm_call', time.perf_counter() - start, model=self.model, path=self.path)
+        usage = (response.llm_output or {}).get('token_usage')
+        if not usage:
+            # Streamed responses report usage on the message instead
+            for generations in response.generations:
+                for generation in generations:
+                    message = getattr(generation, 'message', None)
+                    usage_metadata = getattr(message, 'usage_metadata', None)
+                    if usage_metadata:
+                        usage = {
+                            'prompt_tokens': usage_metadata.get('input_tokens', 0),
+                            'completion_tokens': usage_metadata.get('output_tokens', 0),
+                            'total_tokens': usage_metadata.get('total_tokens', 0)
+                        }
+        self.registry.record_tokens(usage, model=self.model, path=self.path)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._starts.pop(run_id, None)
+        self.registry.inc('groq_errors_total', model=self.model, path=self.path, error=type(error).__name__)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._starts[run_id] = (time.perf_counter(), (serialized or {}).get('name', 'unknown'))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            self.registry.record_span('tool', time.perf_counter() - start[0], model=self.model, path=self.path, tool=start[1])
+
+
+def create_metrics_registry() -> MetricsRegistry:
+    """Build the registry configured by METRICS_ENABLED / METRICS_TIMING_LOG"""
+    registry = MetricsRegistry(
+        enabled=os.getenv('METRICS_ENABLED', 'true').lower() == 'true',
+        timing_log=os.getenv('METRICS_TIMING_LOG', 'false').lower() == 'true'
+    )
+    registry.describe('http_requests_total', 'HTTP requests by endpoint, method and status')
+    registry.describe('http_request_duration_seconds', 'HTTP request latency until the response is returned')
+    registry.describe('chat_stage_duration_seconds', 'Latency of each chat pipeline stage')
+    registry.describe('groq_tokens_total', 'Tokens reported by Groq responses')
+    registry.describe('groq_errors_total', 'Failed Groq calls')
+    registry.describe('chat_fallbacks_total', 'Chat replies served by the direct Groq fallback')
+    registry.describe('chat_agent_failures_total', 'Failed agent runs by error kind')
+    registry.describe('chat_routes_total', 'Messages routed to the agent or to a direct completion')
+    registry.describe('bulk_jobs_total', 'Jobs run by POST /chats/bulk by model and status')
+    registry.describe('prompt_history_bytes_total', 'Bytes of conversation history sent, repeated from the previous turn (prefix) or not (new)')
+    registry.describe('prompt_history_tokens_total', 'Estimated tokens of conversation history sent, by prefix/new part')
+    registry.describe('background_task_wait_seconds', 'Time background tasks waited in the queue, by task')
+    registry.describe('background_task_duration_seconds', 'Time background tasks ran, by task')
+    return registry
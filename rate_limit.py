@@ -0,0 +1,347 @@
+"""Token-bucket rate limiting and admission control of Groq calls.
+
+ModelRateLimiter paces one kind of work per model, e.g. bulk jobs: each
+model's bucket refills at requests_per_minute / 60 tokens per second, and
+acquire() blocks until a token is available.
+
+AdmissionController sits in front of every Groq call. Each model has two
+buckets mirroring Groq's limits: requests per minute and tokens per minute.
+A call is charged its estimated prompt tokens. Callers that cannot be
+admitted right away wait in a bounded per-model queue. The queue is served
+round-robin across user ids, so one busy user cannot starve the others.
+Calls that would wait longer than max_wait, or that find the queue full,
+are rejected at once with AdmissionRejected (a 503) rather than piling up
+threads that would only end in 429s.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class TokenBucket:
+    """Refills continuously at `rate` tokens per second up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, amount: float = 1.0) -> float:
+        """Take `amount` tokens and return 0, or return the seconds until they are available"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.rate
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available, without taking them"""
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (amount - self.tokens) / self.rate)
+
+    def available(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self.tokens
+
+
+class ModelRateLimiter:
+    """One token bucket per model; requests_per_minute <= 0 disables limiting"""
+
+    def __init__(self, requests_per_minute: float = 60.0, burst: float = None):
+        self.requests_per_minute = requests_per_minute
+        # Default burst: ten seconds' worth of requests
+        self.burst = burst or max(1.0, requests_per_minute / 6)
+        self.waits = 0
+        self.waited_seconds = 0.0
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests_per_minute > 0
+
+    def bucket(self, model_name: str) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(model_name)
+            if bucket is None:
+                bucket = self._buckets[model_name] = TokenBucket(self.requests_per_minute / 60, self.burst)
+            return bucket
+
+    def acquire(self, model_name: str, cancelled: threading.Event = None) -> float:
+        """Block until model_name may be called; return the seconds waited, or None if cancelled"""
+        if not self.enabled:
+            return 0.0
+        bucket = self.bucket(model_name)
+        start = time.monotonic()
+        while True:
+            wait = bucket.try_take()
+            if wait == 0:
+                break
+            if cancelled is None:
+                time.sleep(wait)
+            elif cancelled.wait(wait):
+                return None
+        waited = time.monotonic() - start
+        if waited > 0:
+            with self._lock:
+                self.waits += 1
+                self.waited_seconds += waited
+        return waited
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'requests_per_minute': self.requests_per_minute,
+                'burst': self.burst,
+                'waits': self.waits,
+                'waited_seconds': round(self.waited_seconds, 3)
+            }
+
+
+class AdmissionRejected(Exception):
+    """Raised instead of queueing a Groq call that cannot be admitted in time"""
+
+    status_code = 503
+
+    def __init__(self, model_name: str, reason: str, retry_after: float):
+        super().__init__(f"Too many requests for {model_name} ({reason})")
+        self.model_name = model_name
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ('user_id', 'requests', 'tokens')
+
+    def __init__(self, user_id: str, requests: int, tokens: float):
+        self.user_id = user_id
+        self.requests = requests
+        self.tokens = tokens
+
+
+class _ModelAdmission:
+    """Buckets and fair wait queue of one model"""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        # Buckets hold one minute's worth, like Groq's own per-minute windows
+        self.requests = TokenBucket(requests_per_minute / 60, requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute) if tokens_per_minute > 0 else None
+        self.queues = OrderedDict()  # user_id -> deque of waiters, in round-robin order
+        self.queued = 0
+        self.queued_requests = 0
+        self.queued_tokens = 0.0
+        self.admitted = 0
+        self.rejected = {}
+
+    def wait_for(self, requests: float, tokens: float) -> float:
+        """Seconds until both buckets can cover the given amounts"""
+        wait = 0.0
+        if self.requests is not None:
+            wait = self.requests.wait_time(requests)
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens))
+        return wait
+
+    def head(self):
+        return self.queues[next(iter(self.queues))][0] if self.queues else None
+
+    def remove(self, waiter: _Waiter):
+        waiters = self.queues.get(waiter.user_id)
+        if waiters is None or waiter not in waiters:
+            return
+        waiters.remove(waiter)
+        if not waiters:
+            del self.queues[waiter.user_id]
+        self.queued -= 1
+        self.queued_requests -= waiter.requests
+        self.queued_tokens -= waiter.tokens
+
+
+class AdmissionController:
+    """Per-model RPM/TPM admission with a bounded queue served fairly across users"""
+
+    # How often async waiters that are not at the head of the queue re-check it
+    ASYNC_POLL_SECONDS = 0.05
+
+    def __init__(self, requests_per_minute: float = 30, tokens_per_minute: float = 6000, model_limits: dict = None,
+                 max_queue: int = 64, max_queue_per_user: int = 8, max_wait: float = 10.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.model_limits = model_limits or {}  # model -> (requests_per_minute, tokens_per_minute)
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.max_wait = max_wait
+        self._models = {}
+        self._cond = threading.Condition()
+
+    def _state(self, model_name: str):
+        state = self._models.get(model_name)
+        if state is None:
+            rpm, tpm = self.model_limits.get(model_name, (self.requests_per_minute, self.tokens_per_minute))
+            state = self._models[model_name] = _ModelAdmission(rpm, tpm)
+        if state.requests is None and state.tokens is None:
+            return None
+        return state
+
+    def _reject(self, state: _ModelAdmission, model_name: str, reason: str, retry_after: float):
+        state.rejected[reason] = state.rejected.get(reason, 0) + 1
+        raise AdmissionRejected(model_name, reason, max(retry_after, 1.0))
+
+    def _check_capacity(self, state: _ModelAdmission, model_name: str, user_id: str, requests: float,
+                        tokens: float, max_wait: float):
+        """Reject up front when the queue is full or the estimated wait exceeds max_wait"""
+        if state.queued >= self.max_queue:
+            self._reject(state, model_name, 'queue_full', state.wait_for(state.queued_requests, state.queued_tokens))
+        if len(state.queues.get(user_id, ())) >= self.max_queue_per_user:
+            self._reject(state, model_name, 'user_queue_full', state.wait_for(requests, tokens))
+        estimated = state.wait_for(state.queued_requests + requests, state.queued_tokens + tokens)
+        if estimated > max_wait:
+            self._reject(state, model_name, 'overloaded', estimated)
+
+    def _clamp(self, state: _ModelAdmission, requests: float, tokens: float) -> tuple:
+        # A call larger than a whole minute's budget could never be admitted
+        if state.requests is not None:
+            requests = min(requests, state.requests.capacity)
+        if state.tokens is not None:
+            tokens = min(tokens, state.tokens.capacity)
+        return requests, tokens
+
+    def reject_if_overloaded(self, model_name: str, user_id: str, tokens: float = 0, requests: int = 1):
+        """Raise AdmissionRejected now if a call would be rejected, without queueing it"""
+        with self._cond:
+            state = self._state(model_name)
+            if state is not None:
+                requests, tokens = self._clamp(state, requests, tokens)
+                self._check_capacity(state, model_name, user_id, requests, tokens, self.max_wait)
+
+    def _enqueue(self, model_name: str, user_id: str, tokens: float, requests: int, max_wait: float):
+        state = self._state(model_name)
+        if state is None:
+            return None, None
+        waiter = _Waiter(user_id, *self._clamp(state, requests, tokens))
+        self._check_capacity(state, model_name, user_id, waiter.requests, waiter.tokens, max_wait)
+        state.queues.setdefault(user_id, deque()).append(waiter)
+        state.queued += 1
+        state.queued_requests += waiter.requests
+        state.queued_tokens += waiter.tokens
+        return state, waiter
+
+    def _try_admit(self, state: _ModelAdmission, waiter: _Waiter):
+        """Admit waiter if it is at the head of the queue and the buckets cover it.
+
+        Returns 0 when admitted, otherwise the seconds until the head can go,
+        or None when waiter is not at the head.
+        """
+        if state.head() is not waiter:
+            return None
+        wait = state.wait_for(waiter.requests, waiter.tokens)
+        if wait > 0:
+            return wait
+        if state.requests is not None:
+            state.requests.try_take(waiter.requests)
+        if state.tokens is not None:
+            state.tokens.try_take(waiter.tokens)
+        state.remove(waiter)
+        # Round robin: the user goes to the back of the line if it has more waiters
+        if waiter.user_id in state.queues:
+            state.queues.move_to_end(waiter.user_id)
+        state.admitted += 1
+        return 0.0
+
+    def acquire(self, model_name: str, user_id: str, tokens: float, requests: int = 1, max_wait: float = None) -> float:
+        """Block until the call may go to Groq; return the seconds waited or raise AdmissionRejected"""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        start = time.monotonic()
+        deadline = start + max_wait
+        with self._cond:
+            state, waiter = self._enqueue(model_name, user_id, tokens, requests, max_wait)
+            if state is None:
+                return 0.0
+            try:
+                while True:
+                    wait = self._try_admit(state, waiter)
+                    if wait == 0:
+                        self._cond.notify_all()
+                        return time.monotonic() - start
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._reject(state, model_name, 'timeout', wait or state.wait_for(waiter.requests, waiter.tokens))
+                    self._cond.wait(min(wait, remaining) if wait else remaining)
+            except BaseException:
+                state.remove(waiter)
+                self._cond.notify_all()
+                raise
+
+    async def aacquire(self, model_name: str, user_id: str, tokens: float, requests: int = 1,
+                       max_wait: float = None) -> float:
+        """Async variant of acquire() that waits with asyncio.sleep instead of blocking the loop"""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        start = time.monotonic()
+        deadline = start + max_wait
+        with self._cond:
+            state, waiter = self._enqueue(model_name, user_id, tokens, requests, max_wait)
+        if state is None:
+            return 0.0
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_admit(state, waiter)
+                    if wait == 0:
+                        self._cond.notify_all()
+                        return time.monotonic() - start
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._reject(state, model_name, 'timeout', wait or state.wait_for(waiter.requests, waiter.tokens))
+                await asyncio.sleep(min(wait or self.ASYNC_POLL_SECONDS, remaining))
+        except BaseException:
+            with self._cond:
+                state.remove(waiter)
+                self._cond.notify_all()
+            raise
+
+    def stats(self) -> dict:
+        with self._cond:
+            stats = {}
+            for model_name, state in self._models.items():
+                stats[model_name] = {
+                    'queued': state.queued,
+                    'admitted': state.admitted,
+                    'rejected': dict(state.rejected),
+                    'requests_available': round(state.requests.available(), 1) if state.requests else None,
+                    'tokens_available': round(state.tokens.available()) if state.tokens else None
+                }
+            return stats
+
+
+def parse_model_limits(value: str) -> dict:
+    """Parse "model=rpm:tpm,model=rpm:tpm" into {model: (rpm, tpm)}"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in (value or '').split(','))):
+        model_name, _, pair = item.partition('=')
+        rpm, _, tpm = pair.partition(':')
+        limits[model_name.strip()] = (float(rpm or 0), float(tpm or 0))
+    return limits
+
+
+def create_admission_controller() -> AdmissionController:
+    """Admission configured by GROQ_RPM / GROQ_TPM / GROQ_MODEL_LIMITS and ADMISSION_* (0 disables a limit)"""
+    return AdmissionController(
+        requests_per_minute=float(os.getenv('GROQ_RPM', '30')),
+        tokens_per_minute=float(os.getenv('GROQ_TPM', '6000')),
+        model_limits=parse_model_limits(os.getenv('GROQ_MODEL_LIMITS', '')),
+        max_queue=int(os.getenv('ADMISSION_MAX_QUEUE', '64')),
+        max_queue_per_user=int(os.getenv('ADMISSION_MAX_QUEUE_PER_USER', '8')),
+        max_wait=float(os.getenv('ADMISSION_MAX_WAIT_SECONDS', '10'))
+    )
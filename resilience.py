@@ -0,0 +1,303 @@
+"""Error classification, retries and per-model circuit breakers for Groq calls.
+
+Every failed call is classified into a kind that decides what happens next.
+Retryable kinds are retried with exponential backoff and full jitter,
+waiting at least as long as the server's Retry-After header asks. Kinds that
+point at an unhealthy model also count toward that model's circuit breaker.
+Once a breaker opens, calls fail fast until the reset timeout elapses, and a
+single probe call then decides whether it closes again.
+
+The Groq SDK clients are created with max_retries=0, so these retries are the
+only ones and every attempt is visible to the breakers.
+"""
+import asyncio
+import email.utils
+import os
+import random
+import sys
+import threading
+import time
+
+import httpx
+from langchain_core.callbacks import BaseCallbackHandler
+
+from rate_limit import AdmissionRejected
+
+RATE_LIMITED = 'rate_limited'
+AUTH = 'auth'
+BAD_REQUEST = 'bad_request'
+SERVER = 'server'
+TIMEOUT = 'timeout'
+CONNECTION = 'connection'
+CIRCUIT_OPEN = 'circuit_open'
+OVERLOADED = 'overloaded'
+UNKNOWN = 'unknown'
+
+# kind -> (retryable, worth falling back to a direct completion, counts toward the breaker)
+ERROR_POLICIES = {
+    RATE_LIMITED: (True, True, True),
+    AUTH: (False, False, False),
+    BAD_REQUEST: (False, True, False),  # e.g. a malformed tool call; a plain completion may still work
+    SERVER: (True, True, True),
+    TIMEOUT: (True, True, True),
+    CONNECTION: (True, True, True),
+    CIRCUIT_OPEN: (False, False, False),
+    OVERLOADED: (False, False, False),  # Shed by admission control before reaching Groq
+    UNKNOWN: (False, True, False),
+}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a model whose circuit breaker is open"""
+
+    status_code = 503
+
+    def __init__(self, model_name: str, retry_after: float):
+        super().__init__(f"Model {model_name} is temporarily unavailable")
+        self.model_name = model_name
+        self.retry_after = retry_after
+
+
+class ClassifiedError:
+    """What went wrong with a call and how to react to it"""
+
+    def __init__(self, kind: str, status_code: int = None, retry_after: float = None):
+        self.kind = kind
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.retryable, self.fallback, self.trips_breaker = ERROR_POLICIES[kind]
+
+
+def parse_retry_after(headers) -> float:
+    """Seconds to wait according to retry-after-ms / retry-after headers, or None"""
+    if not headers:
+        return None
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(error: Exception) -> ClassifiedError:
+    """Classify an exception raised by the Groq SDK, httpx or LangChain"""
+    if isinstance(error, CircuitOpenError):
+        return ClassifiedError(CIRCUIT_OPEN, 503, error.retry_after)
+    if isinstance(error, AdmissionRejected):
+        return ClassifiedError(OVERLOADED, 503, error.retry_after)
+
+    # The groq package is imported lazily by app.py; if it isn't loaded, no groq error can exist
+    groq = sys.modules.get('groq')
+    if groq is not None and isinstance(error, groq.APITimeoutError):
+        return ClassifiedError(TIMEOUT)
+    if isinstance(error, (httpx.TimeoutException, TimeoutError)):
+        return ClassifiedError(TIMEOUT)
+    if groq is not None and isinstance(error, groq.APIConnectionError):
+        return ClassifiedError(CONNECTION)
+    if isinstance(error, (httpx.TransportError, ConnectionError)):
+        return ClassifiedError(CONNECTION)
+
+    status_code = getattr(error, 'status_code', None)
+    if not isinstance(status_code, int):
+        return ClassifiedError(UNKNOWN)
+
+    retry_after = parse_retry_after(getattr(getattr(error, 'response', None), 'headers', None))
+    if status_code == 429:
+        return ClassifiedError(RATE_LIMITED, status_code, retry_after)
+    if status_code in (401, 403):
+        return ClassifiedError(AUTH, status_code)
+    if status_code in (408, 409) or status_code >= 500:
+        return ClassifiedError(SERVER, status_code, retry_after)
+    return ClassifiedError(BAD_REQUEST, status_code)
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter that honors Retry-After"""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0,
+                 max_wait: float = 20.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # Longest single wait worth holding a request for; beyond it the error is returned
+        self.max_wait = max_wait
+
+    def delay(self, attempt: int, retry_after: float = None) -> float:
+        """Seconds to wait before retry number attempt + 1"""
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            return retry_after + backoff * 0.1
+        return backoff
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures -> half-open probe -> closed"""
+
+    def __init__(self, model_name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.model_name = model_name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_until = 0.0
+        self.probing = False
+        self.trips = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_until > time.monotonic():
+                return 'open'
+            return 'half_open' if self.failures >= self.failure_threshold else 'closed'
+
+    def reject_if_open(self):
+        """Raise CircuitOpenError while the breaker is open, without claiming the half-open probe"""
+        with self._lock:
+            now = time.monotonic()
+            if self.opened_until > now:
+                raise CircuitOpenError(self.model_name, self.opened_until - now)
+
+    def check(self):
+        """Raise CircuitOpenError unless a call may go through now"""
+        with self._lock:
+            now = time.monotonic()
+            if self.opened_until > now:
+                raise CircuitOpenError(self.model_name, self.opened_until - now)
+            if self.failures >= self.failure_threshold:
+                # Half-open: let exactly one probe through
+                if self.probing:
+                    raise CircuitOpenError(self.model_name, 1.0)
+                self.probing = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self, error: ClassifiedError):
+        if not error.trips_breaker:
+            with self._lock:
+                self.probing = False
+            return
+        with self._lock:
+            now = time.monotonic()
+            self.failures += 1
+            was_probing, self.probing = self.probing, False
+            if was_probing or self.failures == self.failure_threshold:
+                self.opened_until = max(self.opened_until, now + self.reset_timeout)
+                self.trips += 1
+            if error.retry_after:
+                # The server said when to come back; nobody should call before then
+                self.opened_until = max(self.opened_until, now + error.retry_after)
+
+    def stats(self) -> dict:
+        return {'state': self.state, 'failures': self.failures, 'trips': self.trips}
+
+
+class CircuitBreakerRegistry:
+    """One circuit breaker per model"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_name: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(model_name)
+            if breaker is None:
+                breaker = self._breakers[model_name] = CircuitBreaker(
+                    model_name, self.failure_threshold, self.reset_timeout
+                )
+            return breaker
+
+    def stats(self) -> dict:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.model_name: breaker.stats() for breaker in breakers}
+
+
+def call_with_retry(fn, breaker: CircuitBreaker, policy: RetryPolicy, max_attempts: int = None):
+    """Call fn() through the breaker, retrying retryable errors with backoff"""
+    attempts = max_attempts or policy.max_attempts
+    for attempt in range(attempts):
+        breaker.check()
+        try:
+            result = fn()
+        except Exception as e:
+            error = classify_error(e)
+            breaker.record_failure(error)
+            if not error.retryable or attempt == attempts - 1:
+                raise
+            delay = policy.delay(attempt, error.retry_after)
+            if delay > policy.max_wait:
+                raise
+            time.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
+
+
+async def acall_with_retry(fn, breaker: CircuitBreaker, policy: RetryPolicy, max_attempts: int = None):
+    """Async variant of call_with_retry; fn() returns an awaitable"""
+    attempts = max_attempts or policy.max_attempts
+    for attempt in range(attempts):
+        breaker.check()
+        try:
+            result = await fn()
+        except Exception as e:
+            error = classify_error(e)
+            breaker.record_failure(error)
+            if not error.retryable or attempt == attempts - 1:
+                raise
+            delay = policy.delay(attempt, error.retry_after)
+            if delay > policy.max_wait:
+                raise
+            await asyncio.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
+
+
+class ToolResultRecorder(BaseCallbackHandler):
+    """Keep the results of tool calls made during an agent run so a fallback can reuse them"""
+
+    def __init__(self):
+        self.results = []  # [(tool name, input, output)]
+        self._pending = {}
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._pending[run_id] = ((serialized or {}).get('name', 'tool'), input_str)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        name, input_str = self._pending.pop(run_id, ('tool', ''))
+        self.results.append((name, input_str, str(output)))
+
+
+def create_retry_policy() -> RetryPolicy:
+    """Retry policy configured by GROQ_MAX_ATTEMPTS / GROQ_RETRY_MAX_WAIT_SECONDS"""
+    return RetryPolicy(
+        max_attempts=int(os.getenv('GROQ_MAX_ATTEMPTS', '3')),
+        max_wait=float(os.getenv('GROQ_RETRY_MAX_WAIT_SECONDS', '20'))
+    )
+
+
+def create_circuit_breakers() -> CircuitBreakerRegistry:
+    """Breakers configured by CIRCUIT_BREAKER_THRESHOLD / CIRCUIT_BREAKER_RESET_SECONDS"""
+    return CircuitBreakerRegistry(
+        failure_threshold=int(os.getenv('CIRCUIT_BREAKER_THRESHOLD', '5')),
+        reset_timeout=float(os.getenv('CIRCUIT_BREAKER_RESET_SECONDS', '30'))
+    )
@@ -0,0 +1,240 @@
+"""Opt-in cache of assistant replies for repeated prompts.
+
+Many conversations open with the same greeting or FAQ, and each one pays a
+full Groq round trip. Replies are cached under a key built from the model,
+the route (direct or agent), the normalized prompt and a hash of the context
+that shaped the reply: the rolling summary, the earlier turns and the user's
+name. A cache hit costs a dictionary or SQLite lookup.
+
+Normalization lowercases the prompt, drops punctuation, collapses whitespace
+and maps common greetings to one form, so "Hello!" and "hi" share an entry.
+Replies that used a tool, such as the weather, get a much shorter TTL, and
+fallback replies are never cached.
+
+Pick a backend with RESPONSE_CACHE (off by default); see create_response_cache().
+The SQLite backend stores entries next to the chats, so every worker process
+shares them.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+PUNCTUATION_RE = re.compile(r"[^\w\s]", re.UNICODE)
+
+# Interchangeable opening phrases, mapped to one canonical form
+GREETINGS = {
+    'hi', 'hii', 'hello', 'hey', 'heya', 'hiya', 'howdy', 'yo', 'greetings',
+    'hi there', 'hello there', 'hey there', 'good morning', 'good afternoon', 'good evening',
+}
+
+
+def normalize_prompt(text: str) -> str:
+    """Canonical form of a prompt for cache lookups"""
+    text = unicodedata.normalize('NFKC', text).casefold()
+    text = " ".join(PUNCTUATION_RE.sub(' ', text).split())
+    return 'hi' if text in GREETINGS else text
+
+
+def cache_key(model_name: str, route: str, prompt: str, context) -> str:
+    """Key of a reply: model, route, normalized prompt and a hash of the context"""
+    context_hash = hashlib.sha256(json.dumps(context, sort_keys=True).encode()).hexdigest()
+    raw = json.dumps([model_name, route, normalize_prompt(prompt), context_hash])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class ResponseCache:
+    """Interface implemented by every response cache backend"""
+
+    enabled = True
+
+    def __init__(self, ttl_seconds: float = 3600.0, tool_ttl_seconds: float = 60.0):
+        self.ttl_seconds = ttl_seconds
+        self.tool_ttl_seconds = tool_ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, key: str):
+        """Return (response, model_used) for a fresh entry, or None"""
+        entry = self._load(key)
+        with self._stats_lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def set(self, key: str, response: str, model_used: str, used_tools: bool = False):
+        """Cache a reply; replies that used tools get the short tool TTL (0 skips them)"""
+        ttl = self.tool_ttl_seconds if used_tools else self.ttl_seconds
+        if ttl <= 0 or not response:
+            return
+        self._save(key, response, model_used, ttl)
+        with self._stats_lock:
+            self.stores += 1
+
+    def _load(self, key: str):
+        raise NotImplementedError
+
+    def _save(self, key: str, response: str, model_used: str, ttl: float):
+        raise NotImplementedError
+
+    def size(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': True,
+                'size': self.size(),
+                'hits': self.hits,
+                'misses': self.misses,
+                'stores': self.stores,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+class DisabledResponseCache(ResponseCache):
+    """Stand-in used when RESPONSE_CACHE=off: every lookup misses without counting"""
+
+    enabled = False
+
+    def get(self, key):
+        return None
+
+    def set(self, key, response, model_used, used_tools=False):
+        pass
+
+    def size(self):
+        return 0
+
+    def stats(self):
+        return {'enabled': False}
+
+
+class InMemoryResponseCache(ResponseCache):
+    """Process-local cache with LRU and TTL eviction"""
+
+    def __init__(self, max_entries: int = 10000, **kwargs):
+        super().__init__(**kwargs)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, response, model_used)
+        self._lock = threading.Lock()
+
+    def _load(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1], entry[2]
+
+    def _save(self, key, response, model_used, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, response, model_used)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def size(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteResponseCache(ResponseCache):
+    """SQLite-backed cache (WAL mode) shared by every worker process using the same file"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS response_cache (
+            key TEXT PRIMARY KEY,
+            response TEXT NOT NULL,
+            model_used TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            last_used REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_response_cache_last_used ON response_cache (last_used);
+    """
+
+    # Entries beyond max_entries are pruned every this many writes
+    PRUNE_EVERY = 100
+
+    def __init__(self, path: str = 'chats.db', max_entries: int = 10000, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.max_entries = max_entries
+        self._writes = 0
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+            conn.execute('DELETE FROM response_cache WHERE expires_at < ?', (time.time(),))
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _load(self, key):
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(
+            'SELECT response, model_used FROM response_cache WHERE key = ? AND expires_at >= ?', (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        with conn:
+            conn.execute('UPDATE response_cache SET last_used = ? WHERE key = ?', (now, key))
+        return row[0], row[1]
+
+    def _save(self, key, response, model_used, ttl):
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO response_cache (key, response, model_used, expires_at, last_used) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, response, model_used, now + ttl, now)
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                conn.execute('DELETE FROM response_cache WHERE expires_at < ?', (now,))
+                conn.execute(
+                    'DELETE FROM response_cache WHERE key IN ('
+                    'SELECT key FROM response_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                    (self.max_entries,)
+                )
+
+    def size(self):
+        return self._connect().execute('SELECT COUNT(*) FROM response_cache').fetchone()[0]
+
+
+def create_response_cache() -> ResponseCache:
+    """Build the cache selected by RESPONSE_CACHE=off|memory|sqlite"""
+    backend = os.getenv('RESPONSE_CACHE', 'off').lower()
+    options = {
+        'max_entries': int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '10000')),
+        'ttl_seconds': float(os.getenv('RESPONSE_CACHE_TTL_SECONDS', '3600')),
+        'tool_ttl_seconds': float(os.getenv('RESPONSE_CACHE_TOOL_TTL_SECONDS', '60')),
+    }
+    if backend == 'off':
+        return DisabledResponseCache()
+    if backend == 'memory':
+        return InMemoryResponseCache(**options)
+    if backend == 'sqlite':
+        path = os.getenv('RESPONSE_CACHE_PATH') or os.getenv('CHAT_STORE_PATH', 'chats.db')
+        return SQLiteResponseCache(path, **options)
+    raise ValueError(f"Unknown RESPONSE_CACHE backend: {backend}")
@@ -0,0 +1,68 @@
+"""Routing of chat messages to the tool-calling agent or a single direct completion.
+
+The agent costs at least one extra planning round trip even when no tool is
+needed. The router sends a message to the agent only when it looks like it
+needs a tool, which today means a weather question or a follow-up to one.
+Everything else goes straight to one Groq completion. The check is a local
+keyword heuristic, so routing adds no latency.
+
+ROUTER_MODE=agent restores the old behaviour of sending every message
+through the agent.
+"""
+import os
+import re
+import threading
+
+AGENT = 'agent'
+DIRECT = 'direct'
+
+# Words that suggest a live weather lookup is needed
+WEATHER_PATTERN = re.compile(
+    r"\b(weather|forecast|temperatures?|degrees|celsius|fahrenheit|rain\w*|snow\w*|sunny|cloudy|"
+    r"humid\w*|wind\w*|storm\w*|umbrella|outside)\b",
+    re.IGNORECASE
+)
+
+# Short follow-ups such as "what about Paris?" inherit the previous turn's route
+FOLLOW_UP_PATTERN = re.compile(r"^\s*(what|how) about\b|^\s*and (in|for|at)\b", re.IGNORECASE)
+FOLLOW_UP_MAX_WORDS = 8
+
+
+class ModelRouter:
+    """Chooses AGENT or DIRECT for each message and counts the choices"""
+
+    def __init__(self, mode: str = 'heuristic'):
+        if mode not in ('heuristic', AGENT):
+            raise ValueError(f"Unknown ROUTER_MODE: {mode}")
+        self.mode = mode
+        self.counts = {AGENT: 0, DIRECT: 0}
+        self._lock = threading.Lock()
+
+    def needs_tools(self, message: str, previous_used_tools: bool = False) -> bool:
+        """Whether a message likely needs a tool call"""
+        if WEATHER_PATTERN.search(message):
+            return True
+        return (
+            previous_used_tools
+            and len(message.split()) <= FOLLOW_UP_MAX_WORDS
+            and FOLLOW_UP_PATTERN.search(message) is not None
+        )
+
+    def route(self, message: str, previous_used_tools: bool = False) -> str:
+        """Return AGENT or DIRECT for a user message"""
+        if self.mode == AGENT or self.needs_tools(message, previous_used_tools):
+            route = AGENT
+        else:
+            route = DIRECT
+        with self._lock:
+            self.counts[route] += 1
+        return route
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'mode': self.mode, **self.counts}
+
+
+def create_model_router() -> ModelRouter:
+    """Router configured by ROUTER_MODE=heuristic|agent"""
+    return ModelRouter(os.getenv('ROUTER_MODE', 'heuristic').lower())
@@ -0,0 +1,303 @@
+"""Incremental inverted index for /chats/search.
+
+Each user gets their own index, which maps a token to the chats and message
+numbers containing it. A user's index is built from the chat store the first
+time they search. After that, app.py keeps it current as messages are
+appended (on a background task) and chats are renamed or deleted, so a
+query only touches the postings of matching tokens instead of scanning
+every message.
+
+When several worker processes share the chat store (shared=True), another
+worker may have changed the user's chats. Each user index then remembers the
+store's revision counter it is current with. A search that finds a newer
+revision first catches the index up: it lists the user's chats and indexes
+only what it has not seen, i.e. new chats, new titles and the messages past
+each chat's indexed count, and drops deleted chats. Every write bumps the
+revision, this worker's own included, so that listing is the usual cost of
+the first search after a turn, not a full rebuild.
+
+Only the SEARCH_INDEX_MAX_USERS users who searched most recently keep an
+index. Beyond that the least recent one is dropped, so users the chat store
+has evicted do not keep holding memory here. A dropped index is rebuilt on
+the user's next search.
+
+Query terms of two or more characters are prefix-matched against a sorted
+vocabulary, which suits search-as-you-type. Chats are ranked by tf-idf with a boost for title
+matches.
+"""
+import bisect
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Pseudo message number used for postings that come from the chat title
+TITLE = -1
+TITLE_BOOST = 3.0
+
+SNIPPET_LENGTH = 120
+
+# Shorter query terms are matched exactly; expanding a one-letter prefix
+# would touch a large share of the vocabulary for little value
+MIN_PREFIX_LENGTH = 2
+
+
+def tokenize(text: str) -> list:
+    """Split text into lowercase word tokens"""
+    return TOKEN_RE.findall(text.lower())
+
+
+def make_snippet(text: str, terms: list, length: int = SNIPPET_LENGTH) -> str:
+    """Return a window of text around the first occurrence of any query term"""
+    lowered = text.lower()
+    positions = [pos for pos in (lowered.find(term) for term in terms) if pos >= 0]
+    if len(text) <= length:
+        return text
+    start = max(0, min(positions, default=0) - length // 3)
+    end = min(len(text), start + length)
+    start = max(0, end - length)
+    snippet = text[start:end].strip()
+    if start > 0:
+        snippet = "..." + snippet
+    if end < len(text):
+        snippet = snippet + "..."
+    return snippet
+
+
+class _UserIndex:
+    """Postings and vocabulary for a single user"""
+
+    def __init__(self):
+        self.postings = {}      # token -> {chat_id: [weighted term frequency, {msg_no: term_frequency}]}
+        self.vocab = []         # sorted list of tokens, for prefix lookups
+        self.chat_tokens = {}   # chat_id -> set of tokens, for deletes
+        self.title_tokens = {}  # chat_id -> set of title tokens, for renames
+        self.next_msg_no = {}   # chat_id -> number of the next appended message
+        self.titles = {}        # chat_id -> indexed title
+        self.revision = None    # chat store revision the index was built at (shared stores)
+
+    def add(self, chat_id: str, msg_no: int, text: str):
+        counts = {}
+        for token in tokenize(text):
+            counts[token] = counts.get(token, 0) + 1
+
+        boost = TITLE_BOOST if msg_no == TITLE else 1.0
+        tokens = self.chat_tokens.setdefault(chat_id, set())
+        for token, tf in counts.items():
+            chats = self.postings.get(token)
+            if chats is None:
+                chats = self.postings[token] = {}
+                bisect.insort(self.vocab, token)
+            posting = chats.get(chat_id)
+            if posting is None:
+                posting = chats[chat_id] = [0.0, {}]
+            posting[0] += tf * boost
+            posting[1][msg_no] = tf
+            tokens.add(token)
+        return set(counts)
+
+    def remove_postings(self, chat_id: str, tokens, msg_no: int = None):
+        """Drop postings of chat_id for tokens (only msg_no if given)"""
+        for token in tokens:
+            chats = self.postings.get(token)
+            if not chats or chat_id not in chats:
+                continue
+            if msg_no is None:
+                del chats[chat_id]
+            else:
+                posting = chats[chat_id]
+                tf = posting[1].pop(msg_no, 0)
+                posting[0] -= tf * (TITLE_BOOST if msg_no == TITLE else 1.0)
+                if not posting[1]:
+                    del chats[chat_id]
+            if not chats:
+                del self.postings[token]
+                index = bisect.bisect_left(self.vocab, token)
+                if index < len(self.vocab) and self.vocab[index] == token:
+                    del self.vocab[index]
+
+    def expand(self, prefix: str) -> list:
+        """Return every vocabulary token starting with prefix"""
+        if len(prefix) < MIN_PREFIX_LENGTH:
+            return [prefix] if prefix in self.postings else []
+        start = bisect.bisect_left(self.vocab, prefix)
+        end = bisect.bisect_left(self.vocab, prefix + '\U0010ffff')
+        return self.vocab[start:end]
+
+
+class SearchIndex:
+    """Thread-safe per-user inverted index over chat titles and messages"""
+
+    def __init__(self, chat_store, shared: bool = False, max_users: int = None):
+        self.chat_store = chat_store
+        self.shared = shared
+        self.max_users = max_users or int(os.getenv('SEARCH_INDEX_MAX_USERS', '1000'))
+        self.catch_ups = 0
+        self.evictions = 0
+        self._users = OrderedDict()  # user_id -> _UserIndex, least recently searched first
+        self._lock = threading.RLock()
+
+    def _user(self, user_id: str):
+        """Return the user's index, building it from the chat store on first use or catching it up when stale"""
+        index = self._users.get(user_id)
+        # Read before the chats, so a write that lands meanwhile leaves the index stale rather than marked current
+        revision = self.chat_store.revision(user_id) if self.shared else None
+        if index is None:
+            index = _UserIndex()
+            for summary in self.chat_store.list_chats(user_id):
+                chat = self.chat_store.get_chat(user_id, summary['id'])
+                if chat:
+                    self._index_chat(index, chat)
+            self._users[user_id] = index
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+                self.evictions += 1
+        elif index.revision != revision:
+            self._catch_up(user_id, index)
+            self.catch_ups += 1
+        index.revision = revision
+        self._users.move_to_end(user_id)
+        return index
+
+    def _catch_up(self, user_id: str, index: _UserIndex):
+        """Apply the changes other workers made to the user's chats, reading only what the index lacks"""
+        summaries = {summary['id']: summary for summary in self.chat_store.list_chats(user_id)}
+        for chat_id in [chat_id for chat_id in index.next_msg_no if chat_id not in summaries]:
+            self._remove_chat(index, chat_id)
+        for chat_id, summary in summaries.items():
+            if chat_id not in index.next_msg_no:
+                chat = self.chat_store.get_chat(user_id, chat_id)
+                if chat:
+                    self._index_chat(index, chat)
+                continue
+            if index.titles[chat_id] != summary['title']:
+                self._rename_chat(index, chat_id, summary['title'])
+            for msg_no in range(index.next_msg_no[chat_id], summary['message_count']):
+                message = self.chat_store.get_message(user_id, chat_id, msg_no)
+                if message is None:
+                    break
+                index.add(chat_id, msg_no, message['content'])
+                index.next_msg_no[chat_id] = msg_no + 1
+
+    def _index_chat(self, index: _UserIndex, chat: dict):
+        index.titles[chat['id']] = chat['title']
+        index.title_tokens[chat['id']] = index.add(chat['id'], TITLE, chat['title'])
+        for msg_no, message in enumerate(chat['messages']):
+            index.add(chat['id'], msg_no, message['content'])
+        index.next_msg_no[chat['id']] = len(chat['messages'])
+
+    @staticmethod
+    def _rename_chat(index: _UserIndex, chat_id: str, title: str):
+        index.remove_postings(chat_id, index.title_tokens.get(chat_id, ()), TITLE)
+        index.titles[chat_id] = title
+        index.title_tokens[chat_id] = index.add(chat_id, TITLE, title)
+
+    @staticmethod
+    def _remove_chat(index: _UserIndex, chat_id: str):
+        index.remove_postings(chat_id, index.chat_tokens.pop(chat_id, ()))
+        index.title_tokens.pop(chat_id, None)
+        index.titles.pop(chat_id, None)
+        index.next_msg_no.pop(chat_id, None)
+
+    def add_chat(self, user_id: str, chat_id: str, title: str):
+        """Index a newly created chat"""
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is None:
+                return  # Built from the store on the user's first search
+            index.titles[chat_id] = title
+            index.title_tokens[chat_id] = index.add(chat_id, TITLE, title)
+            index.next_msg_no[chat_id] = 0
+
+    def add_message(self, user_id: str, chat_id: str, content: str, msg_no: int = None):
+        """Index a message appended to a chat, as its msg_no-th message (default: the next one).
+
+        app.py indexes messages on a background task, so the index may have
+        been built from the store after the message was stored; a message
+        that is already indexed is skipped.
+        """
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is None or chat_id not in index.next_msg_no:
+                return
+            if msg_no is None:
+                msg_no = index.next_msg_no[chat_id]
+            index.next_msg_no[chat_id] = max(index.next_msg_no[chat_id], msg_no + 1)
+            tokens = tokenize(content)
+            if tokens and msg_no in index.postings.get(tokens[0], {}).get(chat_id, (0, {}))[1]:
+                return
+            index.add(chat_id, msg_no, content)
+
+    def rename_chat(self, user_id: str, chat_id: str, title: str):
+        """Replace the indexed title of a chat"""
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is None or chat_id not in index.next_msg_no:
+                return
+            self._rename_chat(index, chat_id, title)
+
+    def remove_chat(self, user_id: str, chat_id: str):
+        """Drop every posting of a deleted chat"""
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is None:
+                return
+            self._remove_chat(index, chat_id)
+
+    def search(self, user_id: str, query: str, limit: int = 20) -> list:
+        """Return [(chat_id, score, best_msg_no)] for chats matching every query term, best first"""
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        with self._lock:
+            index = self._user(user_id)
+            total_chats = max(1, len(index.next_msg_no))
+            scores = None
+            matched_tokens = []
+
+            for term in terms:
+                term_scores = {}
+                for token in index.expand(term):
+                    chats = index.postings[token]
+                    idf = math.log(1 + total_chats / len(chats))
+                    matched_tokens.append((token, idf))
+                    for chat_id, posting in chats.items():
+                        term_scores[chat_id] = term_scores.get(chat_id, 0.0) + posting[0] * idf
+
+                # Every term must match (AND semantics)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {chat_id: score + term_scores[chat_id]
+                              for chat_id, score in scores.items() if chat_id in term_scores}
+                if not scores:
+                    return []
+
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+            # Pick the best-matching message of each returned chat for its snippet
+            results = []
+            for chat_id, score in ranked:
+                message_scores = {}
+                for token, idf in matched_tokens:
+                    posting = index.postings[token].get(chat_id)
+                    if posting:
+                        for msg_no, tf in posting[1].items():
+                            if msg_no != TITLE:
+                                message_scores[msg_no] = message_scores.get(msg_no, 0.0) + tf * idf
+                best_msg_no = max(message_scores, key=message_scores.get) if message_scores else TITLE
+                results.append((chat_id, score, best_msg_no))
+            return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'users': len(self._users),
+                'tokens': sum(len(index.vocab) for index in self._users.values()),
+                'catch_ups': self.catch_ups,
+                'evictions': self.evictions
+            }
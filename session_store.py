@@ -0,0 +1,190 @@
+"""Server-side Flask sessions.
+
+The session cookie carries only an opaque random id. The session data lives
+in a SessionStore, either in-memory with LRU/TTL eviction or in SQLite.
+Sessions are written back only when they were modified, and the cookie is
+sent only when a new session is created. Pick a backend with the
+SESSION_STORE environment variable; see create_session_store().
+"""
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session dict that tracks modification and remembers its id"""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+class SessionStore:
+    """Interface implemented by every session storage backend"""
+
+    # Whether every worker process sees the same sessions (see WORKER_MODE in app.py)
+    shared = False
+
+    def load(self, sid: str):
+        """Return the session data dict, or None if unknown or expired"""
+        raise NotImplementedError
+
+    def save(self, sid: str, data: dict):
+        raise NotImplementedError
+
+    def delete(self, sid: str):
+        raise NotImplementedError
+
+
+class InMemorySessionStore(SessionStore):
+    """Process-local session store with LRU and idle-TTL eviction"""
+
+    def __init__(self, max_sessions: int = 100000, ttl_seconds: float = 30 * 24 * 3600):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict()  # sid -> (last_access, data)
+        self._lock = threading.Lock()
+
+    def load(self, sid):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(sid)
+            if entry is None:
+                return None
+            if now - entry[0] > self.ttl_seconds:
+                del self._sessions[sid]
+                return None
+            self._sessions[sid] = (now, entry[1])
+            self._sessions.move_to_end(sid)
+            return dict(entry[1])
+
+    def save(self, sid, data):
+        with self._lock:
+            self._sessions[sid] = (time.monotonic(), dict(data))
+            self._sessions.move_to_end(sid)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLite-backed session store (WAL mode), shareable across worker processes"""
+
+    shared = True
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at);
+    """
+
+    def __init__(self, path: str = 'sessions.db', ttl_seconds: float = 30 * 24 * 3600):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+            conn.execute('DELETE FROM sessions WHERE expires_at < ?', (time.time(),))
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def load(self, sid):
+        row = self._connect().execute(
+            'SELECT data FROM sessions WHERE id = ? AND expires_at >= ?', (sid, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, sid, data):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO sessions (id, data, expires_at) VALUES (?, ?, ?)',
+                (sid, json.dumps(data), time.time() + self.ttl_seconds)
+            )
+
+    def delete(self, sid):
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM sessions WHERE id = ?', (sid,))
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask session interface backed by a SessionStore"""
+
+    def __init__(self, store: SessionStore):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            data = self.store.load(sid)
+            if data is not None:
+                return ServerSideSession(data, sid=sid)
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.modified:
+            self.store.save(session.sid, dict(session))
+
+        # The id never changes, so the cookie only needs sending once
+        if session.new or (session.permanent and self.should_set_cookie(app, session)):
+            response.set_cookie(
+                name,
+                session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app)
+            )
+            response.vary.add('Cookie')
+
+
+def create_session_store() -> SessionStore:
+    """Build the session store selected by the SESSION_STORE environment variable"""
+    backend = os.getenv('SESSION_STORE', 'memory').lower()
+    ttl = float(os.getenv('SESSION_TTL_SECONDS', str(30 * 24 * 3600)))
+    if backend == 'sqlite':
+        return SQLiteSessionStore(os.getenv('SESSION_STORE_PATH', 'sessions.db'), ttl_seconds=ttl)
+    if backend == 'memory':
+        return InMemorySessionStore(
+            max_sessions=int(os.getenv('SESSION_STORE_MAX_SESSIONS', '100000')),
+            ttl_seconds=ttl
+        )
+    raise ValueError(f"Unknown SESSION_STORE backend: {backend}")
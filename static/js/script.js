@@ -32,6 +32,11 @@ let conversationStarted = false;
 let currentChatId = null;
 let currentRenameId = null;
 let userProfile = null;
+let nextChatCursor = null;
+let isLoadingMoreChats = false;
+let oldestMessageId = null;
+let hasOlderMessages = false;
+let isLoadingOlderMessages = false;
 
 // Initialize
 document.addEventListener('DOMContentLoaded', function() {
@@ -79,6 +84,20 @@ function setupEventListeners() {
     // Search events
     searchChats.addEventListener('input', debounce(searchChatSessions, 300));
 
+    // Load older messages when the conversation is scrolled to the top
+    chatMessages.addEventListener('scroll', function() {
+        if (this.scrollTop < 50) {
+            loadOlderMessages();
+        }
+    });
+
+    // Load older chats when the sidebar list is scrolled to the bottom
+    chatList.addEventListener('scroll', function() {
+        if (this.scrollTop + this.clientHeight >= this.scrollHeight - 50) {
+            loadMoreChatSessions();
+        }
+    });
+
     // Model selection
     modelSelect.addEventListener('change', updateCurrentModel);
 
@@ -157,16 +176,17 @@ function formatTimestamp(isoString) {
 }
 
 // Chat session management
-async function loadChatSessions() {
+async function loadChatSessions(reloadMessages = true) {
     try {
         const response = await fetch('/chats');
         const data = await response.json();
 
         if (response.ok) {
             renderChatList(data.chats);
+            nextChatCursor = data.next_cursor;
             currentChatId = data.current_chat_id;
             if (currentChatId) {
-                await loadChatMessages(currentChatId);
+                if (reloadMessages) await loadChatMessages(currentChatId);
                 highlightActiveChat(currentChatId);
             }
         }
@@ -175,6 +195,28 @@ async function loadChatSessions() {
     }
 }
 
+async function loadMoreChatSessions() {
+    if (!nextChatCursor || isLoadingMoreChats || searchChats.value.trim()) return;
+
+    isLoadingMoreChats = true;
+    try {
+        const response = await fetch(`/chats?cursor=${encodeURIComponent(nextChatCursor)}`);
+        const data = await response.json();
+
+        if (response.ok) {
+            data.chats.forEach(chat => {
+                chatList.appendChild(createChatItem(chat));
+            });
+            nextChatCursor = data.next_cursor;
+            highlightActiveChat(currentChatId);
+        }
+    } catch (error) {
+        console.error('Error loading more chat sessions:', error);
+    } finally {
+        isLoadingMoreChats = false;
+    }
+}
+
 function renderChatList(chats) {
     chatList.innerHTML = '';
 
@@ -254,7 +296,7 @@ async function switchToChat(chatId) {
 
         if (response.ok) {
             currentChatId = chatId;
-            await loadChatMessages(chatId);
+            renderChatMessages(data.chat);
             highlightActiveChat(chatId);
             closeSidebarPanel(); // Close sidebar on mobile
         } else {
@@ -272,23 +314,59 @@ async function loadChatMessages(chatId) {
         const data = await response.json();
 
         if (response.ok) {
-            clearChatMessages();
-            const messages = data.chat.messages || [];
-
-            if (messages.length === 0) {
-                showWelcomeMessage();
-            } else {
-                conversationStarted = true;
-                messages.forEach(msg => {
-                    addMessage(msg.content, msg.role, msg.model);
-                });
-            }
+            renderChatMessages(data.chat);
         }
     } catch (error) {
         console.error('Error loading chat messages:', error);
     }
 }
 
+// Render a chat's most recent page of messages; older ones load on scroll
+function renderChatMessages(chat) {
+    clearChatMessages();
+    const messages = chat.messages || [];
+    oldestMessageId = messages.length > 0 ? messages[0].id : null;
+    hasOlderMessages = Boolean(chat.has_more);
+
+    if (messages.length === 0) {
+        showWelcomeMessage();
+    } else {
+        conversationStarted = true;
+        messages.forEach(msg => {
+            addMessage(msg.content, msg.role, msg.model);
+        });
+    }
+}
+
+async function loadOlderMessages() {
+    if (!hasOlderMessages || isLoadingOlderMessages || !currentChatId) return;
+
+    isLoadingOlderMessages = true;
+    try {
+        const response = await fetch(`/chats/${currentChatId}/messages?before=${oldestMessageId}`);
+        const data = await response.json();
+
+        if (response.ok && data.messages.length > 0) {
+            // Keep the visible messages in place while prepending older ones
+            const previousHeight = chatMessages.scrollHeight;
+            const firstMessage = chatMessages.firstChild;
+            data.messages.forEach(msg => {
+                chatMessages.insertBefore(createMessageElement(msg.content, msg.role, msg.model), firstMessage);
+            });
+            chatMessages.scrollTop += chatMessages.scrollHeight - previousHeight;
+
+            oldestMessageId = data.messages[0].id;
+            hasOlderMessages = data.has_more;
+        } else {
+            hasOlderMessages = false;
+        }
+    } catch (error) {
+        console.error('Error loading older messages:', error);
+    } finally {
+        isLoadingOlderMessages = false;
+    }
+}
+
 // Send message
 async function sendMessage() {
     const message = messageInput.value.trim();
@@ -314,7 +392,7 @@ async function sendMessage() {
     showTypingIndicator();
 
     try {
-        // Send request to backend
+        // Send request to backend and stream the reply as it is generated
         const response = await fetch('/chat', {
             method: 'POST',
             headers: {
@@ -322,22 +400,20 @@ async function sendMessage() {
             },
             body: JSON.stringify({
                 message: message,
-                model: modelSelect.value
+                model: modelSelect.value,
+                stream: true
             })
         });
 
-        const data = await response.json();
-
         if (!response.ok) {
+            const data = await response.json();
             throw new Error(data.error || 'Failed to get response');
         }
 
-        // Add AI response to chat
-        hideTypingIndicator();
-        addMessage(data.response, 'assistant', data.model_used);
+        await readChatStream(response);
 
         // Refresh chat list to update preview and timestamp
-        await loadChatSessions();
+        await loadChatSessions(false);
 
     } catch (error) {
         console.error('Error sending message:', error);
@@ -351,8 +427,62 @@ async function sendMessage() {
     }
 }
 
-// Add message to chat
-function addMessage(content, role, modelUsed = null) {
+// Read a Server-Sent Events response from /chat and render tokens as they arrive
+async function readChatStream(response) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let text = '';
+    let messageDiv = null;
+
+    const handleEvent = (event, data) => {
+        if (event === 'token') {
+            if (!messageDiv) {
+                hideTypingIndicator();
+                messageDiv = addMessage('', 'assistant');
+            }
+            text += data.token;
+            messageDiv.querySelector('.message-content').textContent = text;
+            chatMessages.scrollTop = chatMessages.scrollHeight;
+        } else if (event === 'tool_start' || event === 'reset') {
+            // Discard partial output; the final answer is streamed afterwards
+            text = '';
+            if (messageDiv) messageDiv.querySelector('.message-content').textContent = '';
+        } else if (event === 'done') {
+            hideTypingIndicator();
+            if (!messageDiv) messageDiv = addMessage('', 'assistant');
+            messageDiv.querySelector('.message-content').textContent = data.response;
+            const timestamp = new Date().toLocaleTimeString([], {hour: '2-digit', minute:'2-digit'});
+            messageDiv.querySelector('.message-info').textContent = `${timestamp} • ${data.model_used}`;
+        } else if (event === 'error') {
+            if (messageDiv) messageDiv.remove();
+            throw new Error(data.error || 'Failed to get response');
+        }
+    };
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            });
+            handleEvent(event, data ? JSON.parse(data) : {});
+        }
+    }
+}
+
+// Build a message element
+function createMessageElement(content, role, modelUsed = null) {
     const messageDiv = document.createElement('div');
     messageDiv.className = `message ${role}`;
 
@@ -373,10 +503,18 @@ function addMessage(content, role, modelUsed = null) {
 
     messageDiv.appendChild(messageContent);
     messageDiv.appendChild(messageInfo);
+    return messageDiv;
+}
+
+// Add message to chat
+function addMessage(content, role, modelUsed = null) {
+    const messageDiv = createMessageElement(content, role, modelUsed);
     chatMessages.appendChild(messageDiv);
 
     // Scroll to bottom
     chatMessages.scrollTop = chatMessages.scrollHeight;
+
+    return messageDiv;
 }
 
 // Show typing indicator
@@ -0,0 +1,181 @@
+"""Fingerprinted, precompressed static assets and the cached index page.
+
+Served plainly, every page load renders index.html again, and the browser
+revalidates style.css and script.js, which /static sends uncompressed. With
+STATIC_ASSETS=fingerprint (the default), each file under static/ is read once
+and named after a hash of its content, e.g. css/style.1a2b3c4d5e.css. It is
+also compressed ahead of time with gzip and, if the brotli package is
+installed, brotli. /assets/<name> sends the smallest variant the client
+accepts, with a year-long immutable Cache-Control. A changed file gets a new
+name, so a browser never has to revalidate its cached copy.
+
+The index shell is rendered once per model list and compressed the same way.
+It is sent with no-cache and an ETag. Each load is then a cheap revalidation
+that returns 304, and a deploy's new asset names reach clients at once.
+
+STATIC_ASSETS=plain keeps Flask's /static files and renders the template on
+every request, which suits editing assets during development.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+import time
+
+from flask import Response, render_template, request, url_for
+from werkzeug.exceptions import NotFound
+
+try:
+    import brotli
+except ImportError:  # Optional: assets are then precompressed with gzip only
+    brotli = None
+
+# Content encodings in order of preference
+ENCODINGS = ('br', 'gzip')
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+FINGERPRINT_LENGTH = 10
+FINGERPRINT_RE = re.compile(r'^(?P<stem>.+)\.[0-9a-f]{%d}(?P<suffix>\.[^./]+)$' % FINGERPRINT_LENGTH)
+
+
+def fingerprint(filename: str, digest: str) -> str:
+    """css/style.css -> css/style.<first FINGERPRINT_LENGTH hex digits of digest>.css"""
+    stem, suffix = os.path.splitext(filename)
+    return f'{stem}.{digest[:FINGERPRINT_LENGTH]}{suffix}'
+
+
+class PrecompressedBody:
+    """A response body kept as identity, gzip and (when smaller) brotli bytes"""
+
+    __slots__ = ('variants', 'mimetype', 'etag')
+
+    def __init__(self, data: bytes, mimetype: str):
+        self.variants = {'identity': data}
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(compressed) < len(data):
+            self.variants['gzip'] = compressed
+        if brotli is not None:
+            compressed = brotli.compress(data, quality=11)
+            if len(compressed) < len(self.variants.get('gzip', data)):
+                self.variants['br'] = compressed
+        self.mimetype = mimetype
+        self.etag = hashlib.sha256(data).hexdigest()[:16]
+
+    def encoding_for(self, accept_encodings) -> str:
+        for encoding in ENCODINGS:
+            if encoding in self.variants and accept_encodings.quality(encoding) > 0:
+                return encoding
+        return 'identity'
+
+    def response(self, cache_control: str) -> Response:
+        encoding = self.encoding_for(request.accept_encodings)
+        response = Response(self.variants[encoding], mimetype=self.mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = cache_control
+        # Each encoding is a different representation, so it gets its own tag
+        response.set_etag(f'{self.etag}-{encoding}')
+        return response.make_conditional(request)
+
+    def stats(self) -> dict:
+        return {encoding: len(data) for encoding, data in self.variants.items()}
+
+
+class StaticAssets:
+    """Fingerprinted static files and rendered pages, built once per process"""
+
+    def __init__(self, app, fingerprinted: bool = True):
+        self.app = app
+        self.fingerprinted = fingerprinted
+        self.build_seconds = None
+        self.stale_served = 0
+        self._assets = {}  # fingerprinted name -> PrecompressedBody
+        self._names = {}   # static/ path -> fingerprinted name
+        self._pages = {}   # (template, context key) -> PrecompressedBody
+        self._lock = threading.Lock()
+
+    def build(self):
+        """Read, fingerprint and compress every file under the static folder (once)"""
+        if self.build_seconds is not None or not self.fingerprinted:
+            return
+        with self._lock:
+            if self.build_seconds is not None:
+                return
+            start = time.perf_counter()
+            root = self.app.static_folder
+            for directory, _, files in os.walk(root):
+                for file in files:
+                    path = os.path.join(directory, file)
+                    filename = os.path.relpath(path, root).replace(os.sep, '/')
+                    with open(path, 'rb') as handle:
+                        data = handle.read()
+                    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                    body = PrecompressedBody(data, mimetype)
+                    name = fingerprint(filename, hashlib.sha256(data).hexdigest())
+                    self._assets[name] = body
+                    self._names[filename] = name
+            self.build_seconds = round(time.perf_counter() - start, 3)
+
+    def url(self, filename: str) -> str:
+        """URL of a file under static/: its fingerprinted /assets URL, or the plain /static one"""
+        if self.fingerprinted:
+            self.build()
+            name = self._names.get(filename)
+            if name is not None:
+                return url_for('asset', filename=name)
+        return url_for('static', filename=filename)
+
+    def serve(self, name: str) -> Response:
+        """Response for GET /assets/<name>"""
+        if not self.fingerprinted:
+            raise NotFound()
+        self.build()
+        body = self._assets.get(name)
+        if body is not None:
+            return body.response(IMMUTABLE)
+        # A page rendered before a deploy may ask for an older version; send the current one, uncached
+        match = FINGERPRINT_RE.match(name)
+        current = self._names.get(match['stem'] + match['suffix']) if match else None
+        if current is None:
+            raise NotFound()
+        self.stale_served += 1
+        return self._assets[current].response(REVALIDATE)
+
+    def page(self, template: str, **context) -> Response:
+        """The rendered template, cached per distinct context (e.g. once per model list)"""
+        if not self.fingerprinted:
+            return Response(render_template(template, **context), mimetype='text/html')
+        key = (template, repr(sorted(context.items())))
+        body = self._pages.get(key)
+        if body is None:
+            body = PrecompressedBody(render_template(template, **context).encode(), 'text/html; charset=utf-8')
+            with self._lock:
+                body = self._pages.setdefault(key, body)
+        return body.response(REVALIDATE)
+
+    def stats(self) -> dict:
+        if not self.fingerprinted:
+            return {'mode': 'plain'}
+        return {
+            'mode': 'fingerprint',
+            'brotli': brotli is not None,
+            'build_seconds': self.build_seconds,
+            'assets': {name: body.stats() for name, body in self._assets.items()},
+            'pages': len(self._pages),
+            'stale_served': self.stale_served
+        }
+
+
+def create_static_assets(app) -> StaticAssets:
+    """Build the static asset pipeline selected by the STATIC_ASSETS environment variable"""
+    mode = os.getenv('STATIC_ASSETS', 'fingerprint').lower()
+    if mode not in ('fingerprint', 'plain'):
+        raise ValueError(f"Unknown STATIC_ASSETS mode: {mode}")
+    assets = StaticAssets(app, fingerprinted=mode == 'fingerprint')
+    app.add_template_global(assets.url, 'asset_url')
+    return assets
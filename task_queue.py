@@ -0,0 +1,168 @@
+"""In-process background task queue for work that can wait until the response has gone out.
+
+A chat turn used to finish a number of chores before returning: titling a new
+chat, indexing each message for search, storing the reply in the response
+cache and writing the request's timing line. None of them change the reply,
+so app.py hands them to a TaskQueue instead. BACKGROUND_WORKERS threads run
+the tasks.
+
+Each task has a key, e.g. its chat id. Tasks with the same key always go to
+the same worker, so the messages of a chat are indexed in order. The queue of
+each worker is bounded (BACKGROUND_QUEUE_SIZE tasks in all). When a worker
+falls so far behind that its queue is full, submit() waits up to
+BACKGROUND_QUEUE_WAIT_MS for room and then runs the task itself, on the
+request thread. That back-pressure slows requests down instead of letting the
+backlog, and the memory it holds, grow without bound.
+
+Queue depth and per-task counts are reported by stats(). The time each task
+waited in the queue and the time it ran are recorded as the
+background_task_wait_seconds and background_task_duration_seconds
+histograms. With BACKGROUND_WORKERS=0 every task runs inline, as before.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Sentinel that stops a worker
+_STOP = object()
+
+
+class TaskQueue:
+    """Bounded per-key ordered queues served by a fixed pool of worker threads"""
+
+    def __init__(self, workers: int = 2, max_size: int = 1000, max_wait: float = 0.05, registry=None):
+        self.workers = workers
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self.registry = registry  # MetricsRegistry for the wait and run time histograms
+        self.submitted = 0
+        self.inline = 0
+        self.max_depth = 0
+        self._tasks = {}  # task name -> {'completed', 'failed', 'seconds'}
+        self._next = 0
+        self._unfinished = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._queues = [queue.Queue(max(1, max_size // workers)) for _ in range(workers)]
+        self._threads = []
+        for number, tasks in enumerate(self._queues):
+            thread = threading.Thread(target=self._run, args=(tasks,), name=f'background-{number}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        atexit.register(self.close)
+
+    def _queue_for(self, key) -> queue.Queue:
+        if key is None:
+            with self._cond:
+                self._next += 1
+                return self._queues[self._next % self.workers]
+        return self._queues[zlib.crc32(str(key).encode()) % self.workers]
+
+    def submit(self, name: str, fn, *args, key=None) -> bool:
+        """Run fn(*args) on the worker for key; False if it ran inline because that worker is backed up"""
+        with self._cond:
+            self.submitted += 1
+            queued = self.workers > 0 and not self._closed
+            if queued:
+                self._unfinished += 1
+        if queued:
+            try:
+                self._queue_for(key).put((name, fn, args, time.perf_counter()), timeout=self.max_wait)
+                with self._cond:
+                    self.max_depth = max(self.max_depth, self.depth())
+                return True
+            except queue.Full:
+                with self._cond:
+                    self._unfinished -= 1
+                    self.inline += 1
+                    self._cond.notify_all()
+                logger.warning(f"Background queue full, running {name} task inline")
+        self._execute(name, fn, args)
+        return False
+
+    def _run(self, tasks: queue.Queue):
+        while True:
+            item = tasks.get()
+            if item is _STOP:
+                return
+            name, fn, args, queued_at = item
+            if self.registry is not None:
+                self.registry.observe('background_task_wait_seconds', time.perf_counter() - queued_at, task=name)
+            self._execute(name, fn, args)
+            with self._cond:
+                self._unfinished -= 1
+                self._cond.notify_all()
+
+    def _execute(self, name: str, fn, args):
+        start = time.perf_counter()
+        failed = False
+        try:
+            fn(*args)
+        except Exception as e:
+            failed = True
+            logger.error(f"Background {name} task failed: {e}")
+        elapsed = time.perf_counter() - start
+        if self.registry is not None:
+            self.registry.observe('background_task_duration_seconds', elapsed, task=name)
+        with self._cond:
+            counts = self._tasks.setdefault(name, {'completed': 0, 'failed': 0, 'seconds': 0.0})
+            counts['failed' if failed else 'completed'] += 1
+            counts['seconds'] += elapsed
+
+    def depth(self) -> int:
+        """Tasks waiting in the queues"""
+        return sum(tasks.qsize() for tasks in self._queues)
+
+    def drain(self, timeout: float = None) -> bool:
+        """Wait until every task queued so far has run; False on timeout"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._unfinished, timeout)
+
+    def close(self, timeout: float = 10.0):
+        """Run the queued tasks and stop the workers"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+        if not self.drain(timeout):
+            logger.warning(f"Stopping the background queue with {self._unfinished} tasks unfinished")
+        for tasks in self._queues:
+            try:
+                tasks.put_nowait(_STOP)
+            except queue.Full:
+                pass  # Its worker is stuck on a task; the thread is a daemon
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'workers': self.workers,
+                'max_size': self.max_size,
+                'depth': self.depth(),
+                'max_depth': self.max_depth,
+                'unfinished': self._unfinished,
+                'submitted': self.submitted,
+                'inline': self.inline,
+                'tasks': {name: dict(counts, seconds=round(counts['seconds'], 3))
+                          for name, counts in self._tasks.items()}
+            }
+
+
+def create_task_queue(registry=None) -> TaskQueue:
+    """Build the queue configured by BACKGROUND_WORKERS / BACKGROUND_QUEUE_SIZE / BACKGROUND_QUEUE_WAIT_MS"""
+    workers = int(os.getenv('BACKGROUND_WORKERS', '2'))
+    if workers < 0:
+        raise ValueError(f"BACKGROUND_WORKERS must be 0 or more: {workers}")
+    return TaskQueue(
+        workers=workers,
+        max_size=int(os.getenv('BACKGROUND_QUEUE_SIZE', '1000')),
+        max_wait=int(os.getenv('BACKGROUND_QUEUE_WAIT_MS', '50')) / 1000,
+        registry=registry
+    )
@@ -0,0 +1,14 @@
+"""Point the app at the local fake Groq/OpenWeatherMap server before any test imports it."""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import fake_llm
+
+server = fake_llm.start_server(0)
+FAKE_URL = f'http://127.0.0.1:{server.server_address[1]}'
+os.environ.update(GROQ_API_KEY='fake-key', OPENWEATHER_API_KEY='fake-key', GROQ_BASE_URL=FAKE_URL,
+                  OPENWEATHER_BASE_URL=FAKE_URL, GROQ_RPM='0', GROQ_TPM='0', WARM_UP='off')
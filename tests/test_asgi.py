@@ -0,0 +1,93 @@
+"""The ASGI entry point against the local fake Groq server: native async /chat and streamed WSGI responses."""
+import json
+import time
+
+import anyio
+import httpx
+
+import app
+import asgi
+
+
+def run_with_client(scenario):
+    async def main():
+        transport = httpx.ASGITransport(app=asgi.application)
+        async with httpx.AsyncClient(transport=transport, base_url='http://testserver') as client:
+            await client.get('/')
+            return await scenario(client)
+    return anyio.run(main)
+
+
+def parse_sse(text: str) -> list:
+    events = []
+    for block in text.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines())
+        events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+def test_chat():
+    response = run_with_client(lambda client: client.post('/chat', json={'message': 'hello'}))
+    assert response.status_code == 200
+    assert response.json()['response']
+
+
+def test_streamed_chat():
+    async def scenario(client):
+        async with client.stream('POST', '/chat', json={'message': 'hello', 'stream': True}) as response:
+            body = ''.join([chunk async for chunk in response.aiter_text()])
+        return response, body
+
+    response, body = run_with_client(scenario)
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/event-stream')
+    events = parse_sse(body)
+    assert events[-1][0] == 'done'
+    tokens = ''.join(data['token'] for event, data in events if event == 'token')
+    assert tokens == events[-1][1]['response']
+
+
+def test_streamed_export():
+    async def scenario(client):
+        await client.post('/chat', json={'message': 'hello'})
+        return await client.get('/chats/export')
+
+    response = run_with_client(scenario)
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[0] == {'type': 'export', 'version': 1}
+    assert [line['role'] for line in lines if line['type'] == 'message'] == ['user', 'assistant']
+
+
+def test_slow_store_write_does_not_block_other_requests(monkeypatch):
+    append_message = app.chat_store.append_message
+
+    def slow_append_message(user_id, chat_id, message):
+        if message['content'] == 'slow':
+            time.sleep(1.0)  # A SQLite write waiting on the disk
+        return append_message(user_id, chat_id, message)
+
+    monkeypatch.setattr(app.chat_store, 'append_message', slow_append_message)
+
+    async def timed_chat(message: str, delay: float):
+        transport = httpx.ASGITransport(app=asgi.application)
+        async with httpx.AsyncClient(transport=transport, base_url='http://testserver') as client:
+            await client.get('/')
+            await anyio.sleep(delay)
+            response = await client.post('/chat', json={'message': message})
+            assert response.status_code == 200
+            # From the common start, so time the event loop spent blocked counts too
+            finished[message] = time.perf_counter() - start
+
+    async def main():
+        async with anyio.create_task_group() as tasks:
+            tasks.start_soon(timed_chat, 'slow', 0)
+            tasks.start_soon(timed_chat, 'hello', 0.1)
+
+    # Build the clients and agents first, so only the slow write can hold the other request up
+    run_with_client(lambda client: client.post('/chat', json={'message': 'hello'}))
+    finished = {}
+    start = time.perf_counter()
+    anyio.run(main)
+    assert finished['slow'] >= 1.0
+    assert finished['hello'] < 0.75
@@ -0,0 +1,105 @@
+"""Behavior the chat store backends must agree on."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_store import InMemoryChatStore, SQLiteChatStore
+from write_behind import WriteBehindChatStore
+
+TIMESTAMP = '2024-01-01T00:00:00'
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'journal'])
+def chat_store(request, tmp_path):
+    if request.param == 'memory':
+        yield InMemoryChatStore()
+    elif request.param == 'sqlite':
+        yield SQLiteChatStore(str(tmp_path / 'chats.db'))
+    else:
+        # A one-user cache, so switching users reloads them from SQLite
+        store = WriteBehindChatStore(SQLiteChatStore(str(tmp_path / 'chats.db')), InMemoryChatStore(max_users=1),
+                                     str(tmp_path / 'chats.db.journal'), commit_interval=0.001)
+        yield store
+        store.close()
+
+
+def add_messages(chat_store, user_id, chat_id, count, timestamp=TIMESTAMP):
+    return [chat_store.append_message(user_id, chat_id, {'role': 'user', 'content': f'message {number}',
+                                                         'timestamp': timestamp})
+            for number in range(count)]
+
+
+def test_get_chat_message_limit(chat_store):
+    chat_store.create_chat('user', 'chat', 'Title', TIMESTAMP)
+    for number in range(5):
+        chat_store.append_message('user', 'chat', {'role': 'user', 'content': f'message {number}', 'timestamp': TIMESTAMP})
+
+    assert chat_store.get_chat('user', 'chat', message_limit=0)['messages'] == []
+    assert chat_store.get_chat('user', 'chat', message_limit=0)['message_count'] == 5
+    assert [m['content'] for m in chat_store.get_chat('user', 'chat', message_limit=2)['messages']] == \
+        ['message 3', 'message 4']
+    assert len(chat_store.get_chat('user', 'chat', message_limit=10)['messages']) == 5
+    assert len(chat_store.get_chat('user', 'chat')['messages']) == 5
+
+
+def test_messages_get_increasing_ids_and_page_both_ways(chat_store):
+    chat_store.create_chat('user', 'chat', 'Title', TIMESTAMP)
+    ids = add_messages(chat_store, 'user', 'chat', 7)
+    assert ids == sorted(set(ids))
+
+    def contents(messages):
+        return [m['content'] for m in messages]
+
+    assert contents(chat_store.get_messages('user', 'chat', limit=3)) == ['message 4', 'message 5', 'message 6']
+    assert contents(chat_store.get_messages('user', 'chat', before=ids[4], limit=3)) == \
+        ['message 1', 'message 2', 'message 3']
+    assert contents(chat_store.get_messages('user', 'chat', after=ids[1], limit=3)) == \
+        ['message 2', 'message 3', 'message 4']
+    assert chat_store.get_messages('user', 'chat', after=ids[-1]) == []
+    assert chat_store.get_message('user', 'chat', 2)['content'] == 'message 2'
+    assert chat_store.get_message('user', 'chat', 7) is None
+    assert chat_store.get_messages('user', 'missing') is None
+
+    chat = chat_store.get_chat('user', 'chat', message_limit=0)
+    assert chat['message_count'] == 7
+    assert chat['preview'] == 'message 0'
+
+
+def test_list_chats_by_recency_in_pages(chat_store):
+    for number in range(5):
+        chat_store.create_chat('user', f'chat{number}', f'Chat {number}', f'2024-01-0{number + 1}T00:00:00')
+    # A new message moves a chat to the top
+    add_messages(chat_store, 'user', 'chat1', 1, timestamp='2024-02-01T00:00:00')
+
+    first = chat_store.list_chats('user', limit=2)
+    assert [chat['id'] for chat in first] == ['chat1', 'chat4']
+    second = chat_store.list_chats('user', limit=2, before=(first[-1]['updated_at'], first[-1]['id']))
+    assert [chat['id'] for chat in second] == ['chat3', 'chat2']
+    assert [chat['id'] for chat in chat_store.list_chats('user')] == ['chat1', 'chat4', 'chat3', 'chat2', 'chat0']
+    assert chat_store.list_chats('other') == []
+
+    assert chat_store.update_chat('user', 'chat0', title='Renamed', updated_at='2024-03-01T00:00:00')
+    assert chat_store.list_chats('user', limit=1)[0]['title'] == 'Renamed'
+    assert not chat_store.update_chat('user', 'missing', title='Nope')
+
+
+def test_search_delete_and_profiles_are_per_user(chat_store):
+    chat_store.create_chat('alice', 'a1', 'Groceries', TIMESTAMP)
+    chat_store.append_message('alice', 'a1', {'role': 'user', 'content': 'Buy APPLES', 'timestamp': TIMESTAMP})
+    chat_store.create_chat('bob', 'b1', 'Apples', TIMESTAMP)
+    chat_store.save_profile('alice', {'name': 'Alice', 'preferences': {'units': 'metric'}})
+
+    assert [chat['id'] for chat in chat_store.search_chats('alice', 'apples')] == ['a1']
+    assert [chat['id'] for chat in chat_store.search_chats('bob', 'apples')] == ['b1']
+    assert chat_store.get_profile('alice')['preferences'] == {'units': 'metric'}
+    assert chat_store.get_profile('bob') is None
+
+    assert not chat_store.delete_chat('bob', 'a1')
+    assert chat_store.delete_chat('alice', 'a1')
+    assert not chat_store.has_chat('alice', 'a1')
+    assert chat_store.get_chat('alice', 'a1') is None
+    assert chat_store.list_chats('alice') == []
+    assert chat_store.has_chat('bob', 'b1')
@@ -0,0 +1,108 @@
+"""Rolling summaries: how turns fold, folds triggered by build() and prefold(), and the races between them."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_store import SQLiteChatStore
+from context_builder import ContextBuilder
+
+TIMESTAMP = '2024-01-01T00:00:00'
+MODEL = 'llama3-8b-8192'
+WORDS = ' '.join(f'word{number}' for number in range(20))
+
+
+def fill_chat(store, chat_id: str, count: int):
+    for number in range(count):
+        role = 'user' if number % 2 == 0 else 'assistant'
+        store.append_message('user', chat_id, {'role': role, 'content': f'message {number} {WORDS}',
+                                               'timestamp': TIMESTAMP})
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def state_store(request, tmp_path):
+    """Where summaries live: the builder itself, or a shared SQLite chat store"""
+    return None if request.param == 'memory' else SQLiteChatStore(str(tmp_path / 'chats.db'))
+
+
+@pytest.fixture
+def chats(tmp_path):
+    store = SQLiteChatStore(str(tmp_path / 'history.db'))
+    store.create_chat('user', 'chat', 'Title', TIMESTAMP)
+    return store
+
+
+def fetcher(store):
+    return lambda before, limit: store.get_messages('user', 'chat', before=before, limit=limit) or []
+
+
+def test_late_prefold_does_not_replace_a_newer_fold(chats, state_store):
+    if state_store is not None:
+        state_store.create_chat('user', 'chat', 'Title', TIMESTAMP)
+    fill_chat(chats, 'chat', 30)
+    calls = []
+
+    def summarizer(previous, messages, model_name):
+        calls.append(messages[-1]['id'])
+        if len(calls) == 1:
+            # A turn folds while the background prefold is still waiting for its summary
+            fill_chat(chats, 'chat', 1)
+            builder.build(chats.get_chat('user', 'chat', message_limit=20), MODEL, fetcher(chats))
+        return f'summary through {messages[-1]["id"]}'
+
+    builder = ContextBuilder(summarizer, budget=600, state_store=state_store)
+    assert not builder.prefold(chats.get_chat('user', 'chat', message_limit=20), MODEL, fetcher(chats))
+
+    turn_fold = calls[1]
+    assert builder._state('chat') == {'summary': f'summary through {turn_fold}', 'through_id': turn_fold}
+    assert builder.stats()['folds'] == 1 and builder.stats()['prefolds'] == 0
+
+
+def test_cached_prefix_is_not_changed_by_later_turns(chats):
+    builder = ContextBuilder(lambda previous, messages, model_name: 'summary', budget=3000)
+    fill_chat(chats, 'chat', 3)
+    builder.build(chats.get_chat('user', 'chat'), MODEL, fetcher(chats))
+    first = builder._prefixes['chat']
+    stored = list(first.stored)
+
+    fill_chat(chats, 'chat', 2)
+    window = builder.build(chats.get_chat('user', 'chat'), MODEL, fetcher(chats))
+    assert builder._prefixes['chat'] is not first
+    assert first.stored == stored and first.tokens == sum(builder.counter.count_message('chat', m, MODEL)
+                                                          for m in stored)
+    assert window.prefix_tokens > 0 and len(window.messages) == 5
+
+
+def test_turns_fold_in_batches_and_stay_within_budget(chats, state_store):
+    if state_store is not None:
+        state_store.create_chat('user', 'chat', 'Title', TIMESTAMP)
+    folded = []
+
+    def summarizer(previous, messages, model_name):
+        folded.append([message['id'] for message in messages])
+        return f'summary through {messages[-1]["id"]}'
+
+    builder = ContextBuilder(summarizer, budget=600, state_store=state_store)
+    budget = builder.budget_for(MODEL)
+    previous = None
+    through_ids = []
+    for turn in range(40):
+        fill_chat(chats, 'chat', 1)
+        window = builder.build(chats.get_chat('user', 'chat', message_limit=20), MODEL, fetcher(chats))
+        assert window.tokens <= budget
+        assert window.messages[-1]['content'].startswith('message 0 ')
+        state = builder._state('chat')
+        through_ids.append(state['through_id'])
+        if previous is not None and state['through_id'] == previous[0]:
+            # Between folds the window repeats the previous one and adds the new turn
+            assert window.messages[:-1] == previous[1]
+            assert window.prefix_bytes > 0
+        previous = (state['through_id'], window.messages)
+
+    assert through_ids == sorted(through_ids) and through_ids[-1] > 0
+    # Each fold takes several turns at once and continues where the previous one stopped
+    assert 1 < len(folded) < 40 // 3
+    assert all(len(batch) > 1 for batch in folded)
+    assert [batch[0] for batch in folded[1:]] == [batch[-1] + 1 for batch in folded[:-1]]
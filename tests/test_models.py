@@ -0,0 +1,22 @@
+"""Only the offered models are accepted, so per-model agents, breakers and queues stay bounded."""
+import app
+
+
+def test_unknown_model_is_rejected_before_anything_is_built():
+    client = app.app.test_client()
+    client.get('/')
+    agents = app.agent_registry.stats()
+    response = client.post('/chat', json={'message': 'hello', 'model': 'made-up-model'})
+    assert response.status_code == 400
+    assert 'made-up-model' in response.get_json()['error']
+    assert app.agent_registry.stats() == agents
+    assert 'made-up-model' not in app.circuit_breakers.stats()
+    assert [chat['message_count'] for chat in client.get('/chats').get_json()['chats']] == [0]
+
+
+def test_bulk_rejects_a_job_with_an_unknown_model():
+    client = app.app.test_client()
+    client.get('/')
+    response = client.post('/chats/bulk', json={'jobs': [{'message': 'hi'}, {'message': 'hi', 'model': 'nope'}]})
+    assert response.status_code == 400
+    assert 'Job 1: unknown model nope' in response.get_json()['error']
@@ -0,0 +1,85 @@
+"""Admission control: rejecting what cannot be admitted in time and serving users in turn."""
+import threading
+import time
+
+import pytest
+
+from rate_limit import AdmissionController, AdmissionRejected
+
+MODEL = 'llama3-8b-8192'
+
+
+def drained(**options):
+    """A controller limiting tokens only (100 per second) whose bucket was just emptied"""
+    admission = AdmissionController(requests_per_minute=0, tokens_per_minute=6000, **options)
+    admission.acquire(MODEL, 'setup', tokens=6000)
+    return admission
+
+
+def wait_for_queue(admission, length):
+    deadline = time.monotonic() + 5
+    while admission.stats()[MODEL]['queued'] < length:
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def queue(admission, user_id, tokens, admitted, max_wait=10):
+    """Start a thread waiting for admission and return once it is queued"""
+    length = admission.stats()[MODEL]['queued'] + 1
+
+    def wait():
+        try:
+            admission.acquire(MODEL, user_id, tokens=tokens, max_wait=max_wait)
+            admitted.append(user_id)
+        except AdmissionRejected as e:
+            admitted.append(e.reason)
+
+    thread = threading.Thread(target=wait)
+    thread.start()
+    wait_for_queue(admission, length)
+    return thread
+
+
+def test_rejects_calls_that_would_wait_too_long():
+    admission = drained(max_wait=0.5)
+    with pytest.raises(AdmissionRejected) as error:
+        admission.acquire(MODEL, 'alice', tokens=100)  # A second's worth of tokens
+    assert error.value.reason == 'overloaded'
+    assert error.value.retry_after >= 1.0
+    assert admission.stats()[MODEL]['queued'] == 0
+
+    # Nothing was charged for the rejected call
+    assert admission.acquire(MODEL, 'alice', tokens=20) < 0.5
+
+
+def test_rejects_when_the_queue_or_the_users_share_is_full():
+    admission = drained(max_queue=2, max_queue_per_user=1)
+    admitted = []
+    threads = [queue(admission, 'alice', 10, admitted)]
+    with pytest.raises(AdmissionRejected) as error:
+        admission.reject_if_overloaded(MODEL, 'alice', tokens=10)
+    assert error.value.reason == 'user_queue_full'
+
+    threads.append(queue(admission, 'bob', 10, admitted))
+    with pytest.raises(AdmissionRejected) as error:
+        admission.acquire(MODEL, 'carol', tokens=10)
+    assert error.value.reason == 'queue_full'
+
+    for thread in threads:
+        thread.join()
+    assert admitted == ['alice', 'bob']
+    assert admission.stats()[MODEL]['rejected'] == {'user_queue_full': 1, 'queue_full': 1}
+
+
+def test_users_take_turns():
+    admission = drained()
+    admitted = []
+    threads = [queue(admission, 'alice', 20, admitted) for _ in range(3)]
+    threads += [queue(admission, 'bob', 20, admitted) for _ in range(2)]
+    threads.append(queue(admission, 'carol', 20, admitted))
+    for thread in threads:
+        thread.join()
+    # Alice queued first, but Bob and Carol do not wait behind all of her calls
+    assert admitted == ['alice', 'bob', 'carol', 'alice', 'bob', 'alice']
+    assert admission.stats()[MODEL]['admitted'] == 7
+
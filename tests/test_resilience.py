@@ -0,0 +1,143 @@
+"""Circuit breaker transitions and retries that wait as long as Retry-After asks."""
+import asyncio
+import time
+
+import pytest
+
+import resilience
+from resilience import (SERVER, BAD_REQUEST, CircuitBreaker, CircuitOpenError, ClassifiedError, RetryPolicy,
+                        acall_with_retry, call_with_retry)
+
+
+class FakeClock:
+    """Stands in for the time module; sleeping advances it instantly"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeResponse:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f'HTTP {status_code}')
+        self.status_code = status_code
+        self.response = FakeResponse(headers or {})
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience, 'time', clock)
+    return clock
+
+
+def failing(*errors, result='ok'):
+    """fn() raising each error in turn, then returning result"""
+    calls = []
+
+    def fn():
+        calls.append(resilience.time.monotonic())
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    fn.calls = calls
+    return fn
+
+
+def test_breaker_opens_probes_once_and_closes(clock):
+    breaker = CircuitBreaker('model', failure_threshold=2, reset_timeout=30)
+    breaker.record_failure(ClassifiedError(BAD_REQUEST, 400))
+    breaker.record_failure(ClassifiedError(SERVER, 500))
+    assert breaker.state == 'closed'  # Bad requests say nothing about the model's health
+    breaker.check()
+
+    breaker.record_failure(ClassifiedError(SERVER, 500))
+    assert breaker.state == 'open' and breaker.trips == 1
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.check()
+    assert error.value.retry_after == 30
+
+    clock.now += 30
+    assert breaker.state == 'half_open'
+    breaker.check()  # The probe
+    with pytest.raises(CircuitOpenError):
+        breaker.check()  # Everyone else while it is out
+
+    # A failed probe opens the breaker for another reset timeout
+    breaker.record_failure(ClassifiedError(SERVER, 500))
+    assert breaker.state == 'open' and breaker.trips == 2
+    clock.now += 30
+    breaker.check()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    breaker.check()
+    breaker.check()
+
+
+def test_retry_after_keeps_the_breaker_open_until_then(clock):
+    breaker = CircuitBreaker('model', failure_threshold=5, reset_timeout=30)
+    breaker.record_failure(ClassifiedError(SERVER, 503, retry_after=7))
+    assert breaker.state == 'open'
+    clock.now += 6.9
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    clock.now += 0.1
+    breaker.check()
+
+
+@pytest.mark.parametrize('headers, wait', [({'retry-after': '2'}, 2.0), ({'retry-after-ms': '1500'}, 1.5)])
+def test_retry_waits_at_least_retry_after(clock, headers, wait):
+    breaker = CircuitBreaker('model')
+    fn = failing(StatusError(429, headers))
+    assert call_with_retry(fn, breaker, RetryPolicy(max_attempts=3)) == 'ok'
+    assert len(fn.calls) == 2
+    assert fn.calls[1] - fn.calls[0] >= wait
+    assert wait <= clock.sleeps[0] <= wait + 0.1 * RetryPolicy().base_delay
+    assert breaker.state == 'closed'
+
+
+def test_retry_gives_up_when_retry_after_is_too_long(clock):
+    fn = failing(StatusError(429, {'retry-after': '60'}))
+    with pytest.raises(StatusError):
+        call_with_retry(fn, CircuitBreaker('model'), RetryPolicy(max_attempts=3, max_wait=20))
+    assert len(fn.calls) == 1 and clock.sleeps == []
+
+
+def test_only_retryable_errors_are_retried(clock):
+    fn = failing(StatusError(401))
+    with pytest.raises(StatusError):
+        call_with_retry(fn, CircuitBreaker('model'), RetryPolicy(max_attempts=3))
+    assert len(fn.calls) == 1
+
+    fn = failing(StatusError(500), StatusError(502), StatusError(503))
+    with pytest.raises(StatusError):
+        call_with_retry(fn, CircuitBreaker('model'), RetryPolicy(max_attempts=3))
+    assert len(fn.calls) == 3 and len(clock.sleeps) == 2
+
+
+def test_async_retry_waits_for_retry_after():
+    fn = failing(StatusError(429, {'retry-after-ms': '200'}))
+
+    async def call():
+        return fn()
+
+    start = time.monotonic()
+    assert asyncio.run(acall_with_retry(call, CircuitBreaker('model'), RetryPolicy(max_attempts=2))) == 'ok'
+    assert time.monotonic() - start >= 0.2
+    assert len(fn.calls) == 2
@@ -0,0 +1,73 @@
+"""Search index: memory bound and catching up with other workers' writes."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_store import InMemoryChatStore, SQLiteChatStore
+from search_index import SearchIndex
+
+TIMESTAMP = '2024-01-01T00:00:00'
+
+
+def add_user(chat_store, user_id: str, text: str):
+    chat_store.create_chat(user_id, f'{user_id}-chat', 'Title', TIMESTAMP)
+    chat_store.append_message(user_id, f'{user_id}-chat', {'role': 'user', 'content': text, 'timestamp': TIMESTAMP})
+
+
+def test_least_recently_searched_users_are_dropped_and_rebuilt():
+    chat_store = InMemoryChatStore()
+    index = SearchIndex(chat_store, max_users=2)
+    for user_id in ('alice', 'bob', 'carol'):
+        add_user(chat_store, user_id, f'{user_id} likes zebras')
+
+    assert index.search('alice', 'zebras')
+    assert index.search('bob', 'zebras')
+    assert index.search('alice', 'zebras')  # Alice is now the most recent
+    assert index.search('carol', 'zebras')
+    assert set(index._users) == {'alice', 'carol'}
+    assert index.stats()['evictions'] == 1
+
+    # Bob's index is rebuilt from the store, including what was written while it was dropped
+    chat_store.append_message('bob', 'bob-chat', {'role': 'user', 'content': 'and giraffes', 'timestamp': TIMESTAMP})
+    index.add_message('bob', 'bob-chat', 'and giraffes', 1)
+    assert [chat_id for chat_id, _, _ in index.search('bob', 'giraffes')] == ['bob-chat']
+    assert len(index._users) == 2
+
+
+
+class CountingStore(SQLiteChatStore):
+    """SQLite store that counts full-history chat reads"""
+
+    chat_reads = 0
+
+    def get_chat(self, user_id, chat_id, message_limit=None):
+        self.chat_reads += 1
+        return super().get_chat(user_id, chat_id, message_limit)
+
+
+def test_shared_index_catches_up_without_rereading_history(tmp_path):
+    chat_store = CountingStore(str(tmp_path / 'chats.db'))
+    index = SearchIndex(chat_store, shared=True)
+    add_user(chat_store, 'alice', 'alice likes zebras')
+    chat_store.create_chat('alice', 'old', 'Old chat', TIMESTAMP)
+    assert index.search('alice', 'zebras')
+    reads = chat_store.chat_reads
+
+    # This worker's own turn, indexed incrementally
+    chat_store.append_message('alice', 'alice-chat', {'role': 'user', 'content': 'and lions', 'timestamp': TIMESTAMP})
+    index.add_message('alice', 'alice-chat', 'and lions', 1)
+    # Another worker's writes: a message, a rename, a new chat and a delete
+    chat_store.append_message('alice', 'alice-chat', {'role': 'assistant', 'content': 'and giraffes',
+                                                      'timestamp': TIMESTAMP})
+    chat_store.update_chat('alice', 'alice-chat', title='Safari')
+    chat_store.create_chat('alice', 'new', 'Penguins', TIMESTAMP)
+    chat_store.delete_chat('alice', 'old')
+
+    assert [chat_id for chat_id, _, _ in index.search('alice', 'giraffes')] == ['alice-chat']
+    assert [chat_id for chat_id, _, _ in index.search('alice', 'lions')] == ['alice-chat']
+    assert [chat_id for chat_id, _, _ in index.search('alice', 'safari')] == ['alice-chat']
+    assert [chat_id for chat_id, _, _ in index.search('alice', 'penguins')] == ['new']
+    assert index.search('alice', 'old') == []
+    assert chat_store.chat_reads == reads + 1  # Only the new chat was read in full
+    assert index.stats()['catch_ups'] == 1
@@ -0,0 +1,67 @@
+"""Server-Sent Events from POST /chat: event order and the stored reply, also when the client disconnects."""
+import json
+import time
+
+import app
+
+
+def parse_sse(text: str) -> list:
+    events = []
+    for block in text.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines())
+        events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+def stored_messages(client) -> list:
+    chat_id = client.get('/chats').get_json()['chats'][0]['id']
+    return client.get(f'/chats/{chat_id}/messages').get_json()['messages']
+
+
+def test_events_arrive_in_order_and_the_reply_is_stored():
+    client = app.app.test_client()
+    client.get('/')
+    response = client.post('/chat', json={'message': "What's the weather in London?", 'stream': True})
+    assert response.status_code == 200
+    events = parse_sse(response.get_data(as_text=True))
+    names = [event for event, _ in events]
+
+    assert names.index('tool_start') < names.index('tool_end')
+    assert names[-1] == 'done'
+    assert names.count('done') == 1 and 'error' not in names
+    done = events[-1][1]
+    assert done['model_used'].endswith('+ weather-api')
+    # Tokens after the last tool call or reset make up the reply
+    last_step = max(index for index, name in enumerate(names) if name in ('tool_end', 'reset'))
+    tokens = ''.join(data['token'] for event, data in events[last_step:] if event == 'token')
+    assert tokens in ('', done['response'])
+
+    messages = stored_messages(client)
+    assert [m['role'] for m in messages] == ['user', 'assistant']
+    assert messages[-1]['content'] == done['response']
+
+
+def test_reply_is_stored_after_the_client_disconnects(monkeypatch):
+    append_message = app.chat_store.append_message
+
+    def slow_append_message(user_id, chat_id, message):
+        if message['role'] == 'assistant':
+            time.sleep(0.3)
+        return append_message(user_id, chat_id, message)
+
+    monkeypatch.setattr(app.chat_store, 'append_message', slow_append_message)
+    client = app.app.test_client()
+    client.get('/')
+    response = client.post('/chat', json={'message': 'hello', 'stream': True}, buffered=False)
+    first = next(iter(response.response))
+    assert b'event: token' in first
+    response.close()
+
+    chat_id = client.get('/chats').get_json()['chats'][0]['id']
+    # The turn still holds the chat until its reply is stored
+    assert app.chat_locks.try_acquire(chat_id) is None
+    with app.chat_locks.acquire(chat_id, timeout=5):
+        pass
+    messages = stored_messages(client)
+    assert [m['role'] for m in messages] == ['user', 'assistant']
+    assert messages[-1]['content'].strip() == 'This is a canned reply from the local fake LLM server.'
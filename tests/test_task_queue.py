@@ -0,0 +1,55 @@
+"""Background tasks: per-key order, back-pressure when a worker falls behind, and draining on close."""
+import threading
+
+from task_queue import TaskQueue
+
+
+def test_tasks_with_the_same_key_run_in_order():
+    tasks = TaskQueue(workers=3, max_size=3000)
+    done = {key: [] for key in range(5)}
+    for number in range(200):
+        for key in done:
+            tasks.submit('append', done[key].append, number, key=key)
+    assert tasks.drain(10)
+    assert all(numbers == list(range(200)) for numbers in done.values())
+    assert tasks.stats()['tasks']['append']['completed'] == 1000
+    tasks.close()
+
+
+def test_a_backed_up_worker_makes_submit_run_the_task_inline():
+    tasks = TaskQueue(workers=1, max_size=2, max_wait=0.01)
+    release = threading.Event()
+    started = threading.Event()
+    ran_on = []
+
+    def block():
+        started.set()
+        release.wait()
+
+    tasks.submit('block', block, key='chat')
+    started.wait(5)
+    assert tasks.submit('record', lambda: ran_on.append(threading.current_thread().name), key='chat')
+    assert tasks.submit('record', lambda: ran_on.append(threading.current_thread().name), key='chat')
+    # The worker is busy and its queue is full, so the caller runs this one itself
+    assert not tasks.submit('record', lambda: ran_on.append(threading.current_thread().name), key='chat')
+    assert ran_on == [threading.current_thread().name]
+    assert tasks.stats()['inline'] == 1
+
+    release.set()
+    assert tasks.drain(5)
+    assert ran_on[1:] == ['background-0', 'background-0']
+
+
+def test_failures_are_counted_and_close_runs_what_is_queued():
+    tasks = TaskQueue(workers=2)
+    done = []
+    tasks.submit('fail', lambda: 1 / 0)
+    for number in range(10):
+        tasks.submit('ok', done.append, number, key='chat')
+    tasks.close()
+    assert done == list(range(10))
+    failures = tasks.stats()['tasks']['fail']
+    assert (failures['completed'], failures['failed']) == (0, 1)
+    # Once closed, tasks run inline
+    assert not tasks.submit('ok', done.append, 10)
+    assert done[-1] == 10
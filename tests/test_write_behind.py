@@ -0,0 +1,181 @@
+"""Write-behind chat store: journal recovery and rotation, cache eviction, and loads that wait on uncommitted writes."""
+import json
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_store import InMemoryChatStore, SQLiteChatStore
+import write_behind
+from write_behind import ChatStoreBusy, Journal, WriteBehindChatStore
+
+TIMESTAMP = '2024-01-01T00:00:00'
+
+
+class FlakyStore(SQLiteChatStore):
+    """SQLite store whose journal commits fail while failing is set"""
+
+    failing = False
+
+    def apply_journal(self, entries):
+        if self.failing:
+            raise OSError('disk unavailable')
+        return super().apply_journal(entries)
+
+
+def test_load_times_out_without_blocking_other_users(tmp_path):
+    durable = FlakyStore(str(tmp_path / 'chats.db'))
+    store = WriteBehindChatStore(durable, InMemoryChatStore(max_users=1), str(tmp_path / 'chats.db.journal'),
+                                 commit_interval=0.001, load_timeout=0.3)
+    try:
+        durable.failing = True
+        store.create_chat('alice', 'a1', 'Alice', TIMESTAMP)
+        # Bob's write evicts Alice from the cache while her create is still uncommitted
+        store.create_chat('bob', 'b1', 'Bob', TIMESTAMP)
+
+        errors = []
+
+        def load_alice():
+            try:
+                store.list_chats('alice')
+            except ChatStoreBusy as e:
+                errors.append(e)
+
+        loading = threading.Thread(target=load_alice)
+        loading.start()
+        time.sleep(0.05)
+        start = time.perf_counter()
+        store.append_message('bob', 'b1', {'role': 'user', 'content': 'hi', 'timestamp': TIMESTAMP})
+        assert time.perf_counter() - start < 0.1
+        loading.join()
+        assert len(errors) == 1
+
+        with pytest.raises(ChatStoreBusy):
+            store.append_message('alice', 'a1', {'role': 'user', 'content': 'hi', 'timestamp': TIMESTAMP})
+
+        durable.failing = False
+        assert store.flush(5)
+        assert [chat['id'] for chat in store.list_chats('alice')] == ['a1']
+    finally:
+        durable.failing = False
+        store.close()
+
+
+class RacingCache(InMemoryChatStore):
+    """Memory store that runs race() just before the next message append"""
+
+    race = None
+
+    def append_message(self, user_id, chat_id, message):
+        race, self.race = self.race, None
+        if race:
+            race()
+        return super().append_message(user_id, chat_id, message)
+
+
+def test_another_users_load_does_not_evict_a_user_mid_write(tmp_path):
+    durable = SQLiteChatStore(str(tmp_path / 'chats.db'))
+    durable.create_chat('bob', 'b1', 'Bob', TIMESTAMP)
+    cache = RacingCache(max_users=1)
+    store = WriteBehindChatStore(durable, cache, str(tmp_path / 'chats.db.journal'), commit_interval=0.001)
+    try:
+        store.create_chat('alice', 'a1', 'Alice', TIMESTAMP)
+        # Loading Bob needs room in the one-user cache while Alice's append is under way
+        cache.race = lambda: store.list_chats('bob')
+        message_id = store.append_message('alice', 'a1', {'role': 'user', 'content': 'hi', 'timestamp': TIMESTAMP})
+        assert message_id == 1
+        assert store.flush(5)
+        assert [m['content'] for m in durable.get_chat('alice', 'a1')['messages']] == ['hi']
+
+        with pytest.raises(LookupError):
+            store.append_message('alice', 'missing', {'role': 'user', 'content': 'hi', 'timestamp': TIMESTAMP})
+    finally:
+        store.close()
+
+
+def test_journal_replays_uncommitted_writes_after_a_crash(tmp_path):
+    path = str(tmp_path / 'chats.db.journal')
+    released = threading.Event()
+
+    def frozen(entries):
+        # The process dies before its first commit completes
+        released.wait()
+
+    crashed = Journal(path, frozen, commit_interval=0.001)
+    try:
+        for number in range(5):
+            crashed.append({'op': 'profile', 'user': 'alice', 'profile': {'number': number}})
+        with open(path, 'ab') as journal:
+            journal.write(b'{"op":"profile","user":"alice","seq":6,"prof')  # Torn by the crash
+
+        replayed = []
+        recovered = Journal(path, replayed.extend, checkpoint=2)
+        assert recovered.recovered == 3
+        assert [entry['seq'] for entry in replayed] == [3, 4, 5]
+        assert [entry['profile']['number'] for entry in replayed] == [2, 3, 4]
+        assert os.path.getsize(path) == 0
+        # New entries continue the sequence, so they are not mistaken for replayed ones
+        recovered.append({'op': 'profile', 'user': 'alice', 'profile': {}})
+        assert recovered.flush(5)
+        assert replayed[-1]['seq'] == 6
+        recovered.close()
+    finally:
+        released.set()
+        crashed.close()
+
+
+def test_journal_stays_small_under_sustained_writes(tmp_path, monkeypatch):
+    monkeypatch.setattr(write_behind, 'CHECKPOINT_BYTES', 2000)
+    path = str(tmp_path / 'chats.db.journal')
+    committed = []
+    sizes = []
+    missing = []
+
+    def apply(entries):
+        # Every entry being committed must still be in the file, in case this commit is lost
+        with open(path, 'rb') as current:
+            seqs = {json.loads(line)['seq'] for line in current}
+        missing.extend(entry['seq'] for entry in entries if entry['seq'] not in seqs)
+        committed.extend(entries)
+        sizes.append(os.path.getsize(path))
+        # Another write arrives during every commit, so the backlog is never empty
+        if len(committed) < 300:
+            journal.append({'op': 'profile', 'user': 'alice', 'profile': {'number': len(committed)}})
+
+    journal = Journal(path, apply, commit_interval=0.001)
+    try:
+        journal.append({'op': 'profile', 'user': 'alice', 'profile': {'number': 0}})
+        deadline = time.monotonic() + 10
+        while len(committed) < 300 and time.monotonic() < deadline:
+            assert journal.flush(5)
+        assert len(committed) == 300
+        assert journal.stats()['rotations'] > 0
+        assert max(sizes) < 2 * write_behind.CHECKPOINT_BYTES
+        assert missing == []
+    finally:
+        journal.close()
+
+
+def test_export_pages_from_sqlite_without_loading_the_user(tmp_path):
+    from chat_export import export_chats
+
+    durable = SQLiteChatStore(str(tmp_path / 'chats.db'))
+    store = WriteBehindChatStore(durable, InMemoryChatStore(max_users=1), str(tmp_path / 'chats.db.journal'),
+                                 commit_interval=0.001)
+    try:
+        store.create_chat('alice', 'a1', 'Alice', TIMESTAMP)
+        for number in range(5):
+            store.append_message('alice', 'a1', {'role': 'user', 'content': f'm{number}', 'timestamp': TIMESTAMP})
+        store.list_chats('bob')  # Evicts Alice, whose writes may not be committed yet
+        loads = store.loads
+
+        lines = [json.loads(line) for line in export_chats(store.export_source('alice'), 'alice', message_page=2)]
+        assert [line['content'] for line in lines if line['type'] == 'message'] == [f'm{n}' for n in range(5)]
+        assert store.loads == loads
+        assert not store.cache.has_user('alice')
+    finally:
+        store.close()
@@ -0,0 +1,217 @@
+"""OpenWeatherMap client behind the get_weather_for_city tool.
+
+- Pooled connections: one requests.Session for sync calls, and a shared
+  httpx.AsyncClient for async calls. The session (and the requests package)
+  is only loaded on first use, which keeps app start-up fast.
+- TTL cache keyed on the normalized city name. Weather changes slowly, so
+  a few minutes of staleness is fine.
+- Single-flight: concurrent lookups for the same city share one upstream
+  call.
+- Counters for cache hits, misses and coalesced calls, plus a cumulative
+  upstream latency histogram (exported on /metrics).
+
+Set OPENWEATHER_BASE_URL to point the client at a local stub server.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def normalize_city(city_name: str) -> str:
+    """Cache key for a city name: lowercase with collapsed whitespace"""
+    return " ".join(city_name.strip().lower().split())
+
+
+class WeatherClient:
+    """Cached, coalescing client for the OpenWeatherMap current-weather endpoint"""
+
+    def __init__(self, api_key: str = None, base_url: str = None, ttl_seconds: float = None,
+                 not_found_ttl_seconds: float = 60.0, max_entries: int = 1024, async_client=None,
+                 async_client_factory=None):
+        self.api_key = api_key
+        self.base_url = (base_url or os.getenv('OPENWEATHER_BASE_URL', 'http://api.openweathermap.org')).rstrip('/')
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv('WEATHER_CACHE_TTL_SECONDS', '300'))
+        self.not_found_ttl_seconds = not_found_ttl_seconds
+        self.max_entries = max_entries
+        # An httpx.AsyncClient, or a callable returning one on first async lookup
+        self._async_client = async_client
+        self._async_client_factory = async_client_factory
+
+        self._session = None
+        self._session_lock = threading.Lock()
+
+        self._cache = OrderedDict()  # key -> (expires_at, status_code, data)
+        self._inflight = {}          # key -> concurrent.futures.Future
+        self._ainflight = {}         # key -> asyncio.Future
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.latency_count = 0
+
+    @property
+    def session(self):
+        """Pooled requests.Session, created on first use"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+        return self._session
+
+    @property
+    def async_client(self):
+        if self._async_client is None and self._async_client_factory is not None:
+            self._async_client = self._async_client_factory()
+        return self._async_client
+
+    @property
+    def url(self) -> str:
+        return f"{self.base_url}/data/2.5/weather"
+
+    def _params(self, city_name: str) -> dict:
+        return {'q': city_name, 'appid': self.api_key or os.getenv('OPENWEATHER_API_KEY'), 'units': 'metric'}
+
+    def _cached(self, key: str):
+        """Return the fresh cache entry for key, counting hit or miss (caller holds the lock)"""
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+        self.misses += 1
+        return None
+
+    def _store(self, key: str, status_code: int, data: dict):
+        """Cache successful and not-found responses; other errors are retried next time"""
+        if status_code == 200:
+            ttl = self.ttl_seconds
+        elif status_code == 404:
+            ttl = self.not_found_ttl_seconds
+        else:
+            return
+        with self._lock:
+            self._cache[key] = (time.monotonic() + ttl, status_code, data)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def _observe(self, seconds: float):
+        with self._lock:
+            self.latency_sum += seconds
+            self.latency_count += 1
+            # Cumulative buckets, as in the Prometheus exposition format
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    self.latency_buckets[index] += 1
+            self.latency_buckets[-1] += 1
+
+    def _fetch(self, city_name: str):
+        start = time.perf_counter()
+        try:
+            response = self.session.get(self.url, params=self._params(city_name), timeout=10)
+        finally:
+            self._observe(time.perf_counter() - start)
+        data = response.json() if response.status_code == 200 else {}
+        return response.status_code, data
+
+    async def _afetch(self, city_name: str):
+        start = time.perf_counter()
+        try:
+            response = await self.async_client.get(self.url, params=self._params(city_name), timeout=10)
+        finally:
+            self._observe(time.perf_counter() - start)
+        data = response.json() if response.status_code == 200 else {}
+        return response.status_code, data
+
+    def get(self, city_name: str):
+        """Return (status_code, data) for a city; raises requests.RequestException on connection errors"""
+        key = normalize_city(city_name)
+        with self._lock:
+            cached = self._cached(key)
+            if cached is not None:
+                return cached
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = self._fetch(city_name)
+            self._store(key, *result)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def aget(self, city_name: str):
+        """Async variant of get(); raises httpx.HTTPError on connection errors"""
+        key = normalize_city(city_name)
+        with self._lock:
+            cached = self._cached(key)
+            if cached is not None:
+                return cached
+        future = self._ainflight.get(key)
+        if future is not None:
+            with self._lock:
+                self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = self._ainflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self._afetch(city_name)
+            self._store(key, *result)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else is waiting
+            future.exception()
+            raise
+        finally:
+            self._ainflight.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'cache_size': len(self._cache),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'coalesced': self.coalesced,
+                'errors': self.errors,
+                'upstream_latency': {
+                    'buckets': dict(zip([str(b) for b in LATENCY_BUCKETS] + ['+Inf'], self.latency_buckets)),
+                    'sum': round(self.latency_sum, 6),
+                    'count': self.latency_count
+                }
+            }
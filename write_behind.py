@@ -0,0 +1,382 @@
+"""Write-behind chat store: history is served from memory and written to SQLite off the request path.
+
+With CHAT_STORE=sqlite every appended message is its own SQLite transaction
+inside the request, so a chat turn waits on the disk for the user message and
+again for the reply. WriteBehindChatStore (CHAT_STORE=journal) keeps each
+user's chats in an InMemoryChatStore, which answers every read. Each write
+(new chat, message, rename, delete or profile) is recorded as one line of an
+append-only journal file. A background thread commits the journal to SQLite
+in batches (group commit). Everything journaled while the previous commit
+ran, up to CHAT_JOURNAL_BATCH_SIZE entries, goes into one transaction, and
+the thread waits up to CHAT_JOURNAL_COMMIT_MS for a burst to fill a batch.
+Requests only pay for an unsynced write to the journal file.
+
+Crash recovery: each journal entry carries a sequence number. Each batch
+stores the number of its last entry in SQLite, in the same transaction as its
+writes. On start, entries newer than that checkpoint are replayed into
+SQLite, so writes that were journaled but not committed when the process
+died are not lost and none is applied twice. A torn last line, left by a
+process that died mid-write, is dropped. Whenever the file has grown past
+CHECKPOINT_BYTES after a commit, it is replaced by one holding only the
+entries not committed yet. Under sustained writes the queue is rarely empty,
+so waiting for SQLite to catch up completely would let the journal, and the
+replay at the next start, grow without bound.
+
+The journal is not fsynced. It survives the process being killed, but a
+power cut can lose the last uncommitted batch.
+
+A user's chats are loaded from SQLite on first access and evicted like in
+the memory store (CHAT_STORE_MAX_USERS, CHAT_STORE_TTL_SECONDS). A load
+first waits for the user's journaled writes to be committed. If that takes
+longer than CHAT_JOURNAL_LOAD_TIMEOUT_SECONDS, e.g. while SQLite keeps
+failing, the request fails with ChatStoreBusy instead of hanging. Loads
+happen outside the write lock, so they never hold up other users' writes. A
+user is pinned in the cache while one of their writes is applied, so another
+user's load cannot evict them halfway. Appending to a chat that is not there
+raises LookupError rather than dropping the message. The journal belongs to
+one process, so this store is not shared by worker processes.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from chat_store import ChatStore
+
+logger = logging.getLogger(__name__)
+
+# Rotate the journal down to its uncommitted entries once it is larger than this
+CHECKPOINT_BYTES = 1 << 20
+
+# Pause before retrying a batch whose commit failed
+RETRY_SECONDS = 1.0
+
+
+class ChatStoreBusy(Exception):
+    """A user's earlier writes did not reach the durable store in time to load their chats"""
+
+    status_code = 503
+
+    def __init__(self, user_id: str, retry_after: float):
+        super().__init__(f"Chats of user {user_id} are still being saved")
+        self.user_id = user_id
+        self.retry_after = retry_after
+
+
+class Journal:
+    """Append-only file of write entries, committed to a durable store in batches by a background thread"""
+
+    def __init__(self, path: str, apply, checkpoint: int = 0, batch_size: int = 256, commit_interval: float = 0.02):
+        self.path = path
+        self.apply = apply  # commits a list of entries in one transaction
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        self.seq = checkpoint
+        self.committed_seq = checkpoint
+        self.appended = 0
+        self.committed = 0
+        self.batches = 0
+        self.max_batch = 0
+        self.commit_seconds = 0.0
+        self.errors = 0
+        self.rotations = 0
+        self._pending = deque()
+        self._pending_users = {}  # user_id -> journaled entries not yet committed
+        self._cond = threading.Condition()
+        self._closed = False
+        self.recovered = self._recover()
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        self._thread = threading.Thread(target=self._run, name='chat-journal', daemon=True)
+        self._thread.start()
+
+    def _recover(self) -> int:
+        """Commit the entries journaled after the checkpoint, empty the journal and return how many there were"""
+        if not os.path.exists(self.path):
+            return 0
+        replayed = 0
+        batch = []
+        with open(self.path, 'rb') as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line) if line.endswith(b'\n') else None
+                except ValueError:
+                    entry = None
+                if entry is None:
+                    logger.warning(f"Dropping a torn entry at the end of chat journal {self.path}")
+                    break
+                self.seq = max(self.seq, entry['seq'])
+                if entry['seq'] <= self.committed_seq:
+                    continue
+                batch.append(entry)
+                if len(batch) >= self.batch_size:
+                    self.apply(batch)
+                    replayed += len(batch)
+                    batch = []
+        if batch:
+            self.apply(batch)
+            replayed += len(batch)
+        if replayed:
+            logger.info(f"Recovered {replayed} uncommitted writes from chat journal {self.path}")
+        self.committed_seq = self.seq
+        os.truncate(self.path, 0)
+        return replayed
+
+    @staticmethod
+    def _write(fd: int, entry: dict):
+        data = memoryview((json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n').encode())
+        while data:
+            data = data[os.write(fd, data):]
+
+    def _rotate(self):
+        """Replace the journal file with one holding only the uncommitted entries; called with _cond held"""
+        rotated_path = self.path + '.rotate'
+        fd = os.open(rotated_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            for entry in self._pending:
+                self._write(fd, entry)
+            os.replace(rotated_path, self.path)
+        except OSError:
+            os.close(fd)
+            raise
+        os.close(self._fd)
+        self._fd = fd
+        self.rotations += 1
+
+    def append(self, entry: dict):
+        """Journal one write; the background thread commits it to the durable store"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"Chat journal {self.path} is closed")
+            self.seq += 1
+            entry['seq'] = self.seq
+            self._write(self._fd, entry)
+            self._pending.append(entry)
+            self._pending_users[entry['user']] = self._pending_users.get(entry['user'], 0) + 1
+            self.appended += 1
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                # Give a burst of writes the chance to share this commit
+                self._cond.wait_for(lambda: len(self._pending) >= self.batch_size or self._closed,
+                                    self.commit_interval)
+                batch = [self._pending[index] for index in range(min(len(self._pending), self.batch_size))]
+
+            start = time.perf_counter()
+            try:
+                self.apply(batch)
+            except Exception as e:
+                logger.error(f"Chat journal commit of {len(batch)} writes failed, retrying: {e}")
+                with self._cond:
+                    self.errors += 1
+                time.sleep(RETRY_SECONDS)
+                continue
+            elapsed = time.perf_counter() - start
+
+            with self._cond:
+                for entry in batch:
+                    self._pending.popleft()
+                    user_id = entry['user']
+                    self._pending_users[user_id] -= 1
+                    if not self._pending_users[user_id]:
+                        del self._pending_users[user_id]
+                self.committed_seq = batch[-1]['seq']
+                self.committed += len(batch)
+                self.batches += 1
+                self.max_batch = max(self.max_batch, len(batch))
+                self.commit_seconds += elapsed
+                if os.fstat(self._fd).st_size > CHECKPOINT_BYTES:
+                    try:
+                        self._rotate()
+                    except OSError as e:
+                        logger.error(f"Could not rotate chat journal {self.path}: {e}")
+                self._cond.notify_all()
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait until every entry journaled so far is committed; False on timeout"""
+        with self._cond:
+            target = self.seq
+            return self._cond.wait_for(lambda: self.committed_seq >= target, timeout)
+
+    def wait_for_user(self, user_id: str, timeout: float = None) -> bool:
+        """Wait until the user's journaled entries are committed; False on timeout"""
+        with self._cond:
+            return self._cond.wait_for(lambda: user_id not in self._pending_users, timeout)
+
+    def close(self, timeout: float = 10.0):
+        """Commit what is pending and stop the background thread"""
+        if not self.flush(timeout):
+            logger.warning(f"Closing chat journal {self.path} with uncommitted writes; they are replayed on restart")
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        os.close(self._fd)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'path': self.path,
+                'pending': len(self._pending),
+                'appended': self.appended,
+                'committed': self.committed,
+                'batches': self.batches,
+                'avg_batch': round(self.committed / self.batches, 1) if self.batches else 0,
+                'max_batch': self.max_batch,
+                'commit_seconds': round(self.commit_seconds, 3),
+                'errors': self.errors,
+                'recovered': self.recovered,
+                'rotations': self.rotations
+            }
+
+
+class WriteBehindChatStore(ChatStore):
+    """Reads and writes go to an in-memory cache; writes reach the durable store through the journal"""
+
+    backend = 'journal'
+
+    def __init__(self, durable, cache, journal_path: str, batch_size: int = 256, commit_interval: float = 0.02,
+                 load_timeout: float = 10.0):
+        self.durable = durable
+        self.cache = cache
+        self.journal = Journal(journal_path, durable.apply_journal, durable.journal_checkpoint(),
+                               batch_size=batch_size, commit_interval=commit_interval)
+        self.loads = 0
+        # Longest wait for a user's pending writes before loading them; ChatStoreBusy after that
+        self.load_timeout = load_timeout
+        # Writes reach the cache in journal order
+        self._write_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _load(self, user_id: str):
+        """Bring the user's chats and profile into the cache from the durable store if they are not there"""
+        if self.cache.has_user(user_id):
+            return
+        # Writes of a user evicted from the cache may still be on their way to the durable store. No new
+        # ones can be journaled meanwhile, since writes only go to users in the cache.
+        if not self.journal.wait_for_user(user_id, self.load_timeout):
+            raise ChatStoreBusy(user_id, self.load_timeout)
+        with self._load_lock:
+            if self.cache.has_user(user_id):
+                return
+            chats = [self.durable.get_chat(user_id, summary['id']) for summary in self.durable.list_chats(user_id)]
+            self.cache.load_user(user_id, [chat for chat in chats if chat], self.durable.get_profile(user_id))
+            self.loads += 1
+
+    @contextmanager
+    def _writing(self, user_id: str):
+        """Hold the write lock with the user loaded and pinned in the cache.
+
+        The user is loaded before the lock is taken, so a slow load never
+        holds up the writes of other users. Reads of other users evict from
+        the cache without the write lock, so the user stays pinned until the
+        write is done.
+        """
+        while True:
+            self._load(user_id)
+            with self._write_lock:
+                # Evicted again between the load and the lock: load once more
+                if self.cache.pin(user_id):
+                    try:
+                        yield
+                    finally:
+                        self.cache.unpin(user_id)
+                    return
+
+    def create_chat(self, user_id, chat_id, title, created_at):
+        with self._writing(user_id):
+            chat = self.cache.create_chat(user_id, chat_id, title, created_at)
+            self.journal.append({'op': 'create', 'user': user_id, 'chat': chat_id, 'title': title,
+                                 'created_at': created_at})
+        return chat
+
+    def append_message(self, user_id, chat_id, message):
+        with self._writing(user_id):
+            message_id = self.cache.append_message(user_id, chat_id, message)
+            if message_id is None:
+                raise LookupError(f"Chat {chat_id} of user {user_id} does not exist")
+            stored = {key: message[key] for key in ('role', 'content', 'timestamp', 'model') if key in message}
+            self.journal.append({'op': 'append', 'user': user_id, 'chat': chat_id, 'message': stored})
+        return message_id
+
+    def update_chat(self, user_id, chat_id, **fields):
+        with self._writing(user_id):
+            updated = self.cache.update_chat(user_id, chat_id, **fields)
+            fields = {key: fields[key] for key in ('title', 'updated_at') if key in fields}
+            if updated and fields:
+                self.journal.append({'op': 'update', 'user': user_id, 'chat': chat_id, 'fields': fields})
+        return updated
+
+    def delete_chat(self, user_id, chat_id):
+        with self._writing(user_id):
+            deleted = self.cache.delete_chat(user_id, chat_id)
+            if deleted:
+                self.journal.append({'op': 'delete', 'user': user_id, 'chat': chat_id})
+        return deleted
+
+    def save_profile(self, user_id, profile):
+        with self._writing(user_id):
+            self.cache.save_profile(user_id, profile)
+            self.journal.append({'op': 'profile', 'user': user_id, 'profile': profile})
+
+    def get_chat(self, user_id, chat_id, message_limit=None):
+        self._load(user_id)
+        return self.cache.get_chat(user_id, chat_id, message_limit)
+
+    def has_chat(self, user_id, chat_id):
+        self._load(user_id)
+        return self.cache.has_chat(user_id, chat_id)
+
+    def get_message(self, user_id, chat_id, position):
+        self._load(user_id)
+        return self.cache.get_message(user_id, chat_id, position)
+
+    def get_messages(self, user_id, chat_id, before=None, limit=50, after=None):
+        self._load(user_id)
+        return self.cache.get_messages(user_id, chat_id, before=before, limit=limit, after=after)
+
+    def list_chats(self, user_id, limit=None, before=None):
+        self._load(user_id)
+        return self.cache.list_chats(user_id, limit=limit, before=before)
+
+    def search_chats(self, user_id, query):
+        self._load(user_id)
+        return self.cache.search_chats(user_id, query)
+
+    def get_profile(self, user_id):
+        self._load(user_id)
+        return self.cache.get_profile(user_id)
+
+    def export_source(self, user_id):
+        """The durable store, once the user's journaled writes are committed.
+
+        An export then pages from SQLite instead of loading the user's whole
+        history into the cache.
+        """
+        if not self.journal.wait_for_user(user_id, self.load_timeout):
+            raise ChatStoreBusy(user_id, self.load_timeout)
+        return self.durable
+
+    def memory_report(self, user_id=None, top=10):
+        return dict(self.cache.memory_report(user_id, top), backend=self.backend)
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait until every write so far is committed to the durable store"""
+        return self.journal.flush(timeout)
+
+    def close(self):
+        self.journal.close()
+
+    def stats(self):
+        return {'backend': self.backend, 'loads': self.loads, 'journal': self.journal.stats()}